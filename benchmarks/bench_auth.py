@@ -0,0 +1,55 @@
+"""
+Compare authenticated request latency with DRF's BasicAuthentication and
+with CachedBasicAuthentication.
+
+Run with:
+    pytest benchmarks/bench_auth.py -s
+"""
+import base64
+import json
+import os
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from rest_framework.authentication import BasicAuthentication
+
+from dsnap_registration.authentication import (CachedBasicAuthentication,
+                                               credential_cache)
+from dsnap_registration.views import RegistrationDetail
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+ROUNDS = 50
+AUTHORIZATION = "Basic {}".format(
+    base64.b64encode(b"bench:bench").decode())
+
+
+def mean_latency(client, url):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        response = client.get(url, HTTP_AUTHORIZATION=AUTHORIZATION)
+        assert response.status_code == 200
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+@pytest.mark.django_db
+def test_auth_benchmark(client, monkeypatch):
+    get_user_model().objects.create_user(username="bench", password="bench")
+    with open(EXAMPLE_PATH) as f:
+        payload = json.load(f)
+    response = client.post('/registrations', data=payload,
+                           content_type="application/json")
+    url = f'/registrations/{response.json()["id"]}'
+
+    monkeypatch.setattr(RegistrationDetail, 'authentication_classes',
+                        (BasicAuthentication,))
+    before = mean_latency(client, url)
+
+    credential_cache.clear()
+    monkeypatch.setattr(RegistrationDetail, 'authentication_classes',
+                        (CachedBasicAuthentication,))
+    after = mean_latency(client, url)
+
+    print(f"\nGET {url}: BasicAuthentication {before:.1f}ms, "
+          f"CachedBasicAuthentication {after:.1f}ms")
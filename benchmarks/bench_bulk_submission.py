@@ -0,0 +1,51 @@
+"""
+Compare submitting registrations one POST at a time with /registrations/bulk.
+
+Run with:
+    pytest benchmarks/bench_bulk_submission.py -s
+"""
+import base64
+import json
+import os
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+
+from dsnap_registration.models import Registration
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+COUNT = 500
+AUTHORIZATION = "Basic {}".format(
+    base64.b64encode(b"bench:bench").decode())
+
+
+@pytest.mark.django_db
+def test_bulk_submission_benchmark(client, settings):
+    # Without the limits on anonymous submissions
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK,
+                               'DEFAULT_THROTTLE_RATES': {}}
+    settings.SUBMISSION_MAX_CONCURRENT = None
+    get_user_model().objects.create_user(username="bench", password="bench")
+    with open(EXAMPLE_PATH) as f:
+        payload = json.load(f)
+
+    start = time.perf_counter()
+    for _ in range(COUNT):
+        response = client.post('/registrations', data=payload,
+                               content_type="application/json")
+        assert response.status_code == 201
+    single = time.perf_counter() - start
+
+    body = "\n".join([json.dumps(payload)] * COUNT)
+    start = time.perf_counter()
+    response = client.post('/registrations/bulk', data=body,
+                           content_type="application/x-ndjson",
+                           HTTP_AUTHORIZATION=AUTHORIZATION)
+    bulk = time.perf_counter() - start
+    assert response.status_code == 200
+
+    assert Registration.objects.count() == 2 * COUNT
+    print(f"\n{COUNT} registrations: single POSTs {COUNT / single:.0f}/s, "
+          f"bulk {COUNT / bulk:.0f}/s ({single / bulk:.1f}x)")
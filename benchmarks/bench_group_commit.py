@@ -0,0 +1,82 @@
+"""
+Registrations per second and POST latency with group commit off and with
+windows of a few milliseconds, for concurrent anonymous submissions.
+
+Threads stand in for gunicorn's gevent greenlets.
+
+Run with:
+    pytest benchmarks/bench_group_commit.py -s
+"""
+import json
+import os
+import threading
+import time
+
+import pytest
+from django.db import connection
+from django.test import Client
+
+from dsnap_registration.models import Registration
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+CONCURRENCY = 32
+REQUESTS_PER_THREAD = 25
+WINDOWS = (0, 0.002, 0.005, 0.01)
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def run_load(payload):
+    barrier = threading.Barrier(CONCURRENCY)
+    latencies = []
+    errors = []
+
+    def work():
+        client = Client()
+        barrier.wait()
+        try:
+            for _ in range(REQUESTS_PER_THREAD):
+                start = time.perf_counter()
+                response = client.post('/registrations', data=payload,
+                                       content_type="application/json")
+                # The test client leaves connections open; a real request
+                # hands its connection back to the pool when it finishes
+                connection.close()
+                latencies.append(time.perf_counter() - start)
+                assert response.status_code == 201
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work) for _ in range(CONCURRENCY)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert not errors, errors[0]
+    return len(latencies) / elapsed, latencies
+
+
+@pytest.mark.django_db(transaction=True)
+def test_group_commit_benchmark(settings):
+    # Without the limits on anonymous submissions
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK,
+                               'DEFAULT_THROTTLE_RATES': {}}
+    settings.SUBMISSION_MAX_CONCURRENT = None
+    with open(EXAMPLE_PATH) as f:
+        payload = json.load(f)
+
+    print(f"\n{CONCURRENCY} concurrent clients:")
+    for window in WINDOWS:
+        settings.GROUP_COMMIT_WINDOW = window
+        Registration.objects.all().delete()
+        rate, latencies = run_load(payload)
+        label = f"{window * 1000:g}ms window" if window else "off"
+        print(f"  group commit {label:>12}: {rate:6.0f} registrations/s, "
+              f"p50 {percentile(latencies, 0.5) * 1000:5.1f}ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:5.1f}ms")
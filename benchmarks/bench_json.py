@@ -0,0 +1,84 @@
+"""
+Compare DRF's JSONParser/JSONRenderer with FastJSONParser/FastJSONRenderer,
+rendering list pages of 100 and 1000 registrations and parsing submissions.
+
+Run with (needs orjson installed):
+    pytest benchmarks/bench_json.py -s
+"""
+import base64
+import io
+import json
+import os
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from dsnap_registration.models import Registration
+from dsnap_registration.parsers import FastJSONParser
+from dsnap_registration.renderers import FastJSONRenderer
+from dsnap_registration.serializers import RegistrationSerializer
+from dsnap_registration.views import RegistrationList
+
+pytest.importorskip('orjson')
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+PAGE_SIZES = (100, 1000)
+ROUNDS = 10
+AUTHORIZATION = "Basic {}".format(
+    base64.b64encode(b"bench:bench").decode())
+
+
+def mean_ms(function):
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        function()
+    return (time.perf_counter() - start) / ROUNDS * 1000
+
+
+def mean_request_ms(client, url):
+    def get():
+        response = client.get(url, HTTP_AUTHORIZATION=AUTHORIZATION)
+        assert response.status_code == 200
+    # Warm up, so the first password check is not part of the timing
+    get()
+    return mean_ms(get)
+
+
+@pytest.mark.django_db
+def test_json_benchmark(client, monkeypatch):
+    get_user_model().objects.create_user(username="bench", password="bench")
+    with open(EXAMPLE_PATH) as f:
+        payload = json.load(f)
+    Registration.objects.bulk_create(
+        Registration(original_data=payload, latest_data=payload)
+        for _ in range(max(PAGE_SIZES)))
+
+    print()
+    for page_size in PAGE_SIZES:
+        data = RegistrationSerializer(
+            Registration.objects.all()[:page_size], many=True).data
+        stock = mean_ms(lambda: JSONRenderer().render(data))
+        fast = mean_ms(lambda: FastJSONRenderer().render(data))
+        print(f"render {page_size} registrations: JSONRenderer "
+              f"{stock:.1f}ms, FastJSONRenderer {fast:.1f}ms "
+              f"({stock / fast:.1f}x)")
+
+        url = f'/registrations?limit={page_size}'
+        monkeypatch.setattr(RegistrationList, 'renderer_classes',
+                            (JSONRenderer,))
+        stock = mean_request_ms(client, url)
+        monkeypatch.setattr(RegistrationList, 'renderer_classes',
+                            (FastJSONRenderer,))
+        fast = mean_request_ms(client, url)
+        print(f"GET {url}: JSONRenderer {stock:.1f}ms, "
+              f"FastJSONRenderer {fast:.1f}ms ({stock / fast:.1f}x)")
+
+    body = json.dumps(payload).encode()
+    stock = mean_ms(lambda: JSONParser().parse(io.BytesIO(body)))
+    fast = mean_ms(lambda: FastJSONParser().parse(io.BytesIO(body)))
+    print(f"parse one submission: JSONParser {stock * 1000:.0f}us, "
+          f"FastJSONParser {fast * 1000:.0f}us ({stock / fast:.1f}x)")
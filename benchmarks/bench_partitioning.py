@@ -0,0 +1,71 @@
+"""
+Compare reading one disaster's registrations from the registration table
+partitioned by disaster with reading them from an unpartitioned copy with an
+index on disaster_id.
+
+Run with:
+    pytest benchmarks/bench_partitioning.py -s
+"""
+import json
+import os
+import time
+
+import pytest
+from django.db import connection
+
+from dsnap_registration import partitions
+from dsnap_registration.models import Registration
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+DISASTERS = 20
+PER_DISASTER = 1000
+REPEAT = 50
+# Time the scan rather than sending the documents to the client
+QUERY = """
+    SELECT count(*) FROM {table}
+    WHERE disaster_id = %s AND latest_data ->> 'county' IS NOT NULL
+"""
+
+
+def timed(cursor, table, disaster_id):
+    start = time.perf_counter()
+    for _ in range(REPEAT):
+        cursor.execute(QUERY.format(table=table), [disaster_id])
+        count, = cursor.fetchone()
+    return (time.perf_counter() - start) / REPEAT, count
+
+
+@pytest.mark.django_db
+def test_partitioning_benchmark():
+    if not partitions.is_partitioned():
+        pytest.skip("The registration table is not partitioned")
+    with open(EXAMPLE_PATH) as f:
+        payload = json.load(f)
+
+    registrations = []
+    for disaster_id in range(1, DISASTERS + 1):
+        data = dict(payload, disaster_id=disaster_id)
+        registrations += [Registration(original_data=data, latest_data=data)
+                          for _ in range(PER_DISASTER)]
+    Registration.objects.bulk_create(registrations, batch_size=1000)
+
+    with connection.cursor() as cursor:
+        # Registrations for concurrent disasters arrive interleaved, so an
+        # unpartitioned table has each disaster's rows spread over its pages
+        cursor.execute("CREATE TABLE registration_flat AS "
+                       "SELECT * FROM registration ORDER BY random()")
+        cursor.execute("CREATE INDEX ON registration_flat (disaster_id)")
+        cursor.execute("ANALYZE registration")
+        cursor.execute("ANALYZE registration_flat")
+
+        disaster_id = DISASTERS // 2
+        flat, flat_count = timed(cursor, 'registration_flat', disaster_id)
+        partitioned, partitioned_count = timed(cursor, 'registration',
+                                               disaster_id)
+
+    assert flat_count == partitioned_count == PER_DISASTER
+    print(f"\n{PER_DISASTER} of {DISASTERS * PER_DISASTER} registrations: "
+          f"unpartitioned {flat * 1000:.2f}ms, "
+          f"partitioned {partitioned * 1000:.2f}ms "
+          f"({flat / partitioned:.1f}x)")
@@ -0,0 +1,111 @@
+"""
+Load test of the pooled database backend: many concurrent "requests", each
+running a query and then closing its connection as Django does at the end of
+a request, with the number of server connections sampled throughout.
+Compared with persistent per-thread connections (the stock backend with
+CONN_MAX_AGE > 0), which hold one connection per thread.
+
+Threads stand in for gunicorn's gevent greenlets; the pool waits with the
+threading module, which gevent patches.
+
+Run with:
+    pytest benchmarks/bench_pool.py -s
+"""
+import threading
+import time
+
+import psycopg2
+import pytest
+from django.db import connection
+from django.db.backends.postgresql.base import DatabaseWrapper
+
+CONCURRENCY = 60
+REQUESTS_PER_THREAD = 20
+QUERY = "SELECT count(*) FROM registration WHERE disaster_id = 1"
+
+
+class ConnectionSampler(threading.Thread):
+    """
+    Records the peak number of connections to the database
+    """
+    def __init__(self, params):
+        super().__init__()
+        self.connection = psycopg2.connect(**params)
+        self.connection.autocommit = True
+        self.peak = 0
+        self.done = threading.Event()
+
+    def run(self):
+        with self.connection.cursor() as cursor:
+            while not self.done.wait(0.005):
+                cursor.execute(
+                    "SELECT count(*) FROM pg_stat_activity "
+                    "WHERE datname = current_database() "
+                    "AND pid <> pg_backend_pid()")
+                self.peak = max(self.peak, cursor.fetchone()[0])
+        self.connection.close()
+
+
+def run_load(request):
+    params = connection.get_connection_params()
+    sampler = ConnectionSampler(params)
+    sampler.start()
+    errors = []
+    # Every client is active at once, as under a surge
+    barrier = threading.Barrier(CONCURRENCY)
+
+    def work():
+        try:
+            barrier.wait()
+            for _ in range(REQUESTS_PER_THREAD):
+                request()
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work) for _ in range(CONCURRENCY)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    sampler.done.set()
+    sampler.join()
+    assert not errors, errors[0]
+    return CONCURRENCY * REQUESTS_PER_THREAD / elapsed, sampler.peak
+
+
+@pytest.mark.django_db(transaction=True)
+def test_pool_benchmark():
+    pool_size = connection.settings_dict['POOL']['MAX_SIZE']
+
+    def pooled_request():
+        with connection.cursor() as cursor:
+            cursor.execute(QUERY)
+        # As at the end of a request with CONN_MAX_AGE = 0
+        connection.close()
+
+    pooled_rate, pooled_peak = run_load(pooled_request)
+    connection.pool.close_idle()
+
+    stock = threading.local()
+    stock_connections = []
+
+    def persistent_request():
+        if not hasattr(stock, 'connection'):
+            stock.connection = DatabaseWrapper(connection.settings_dict)
+            stock_connections.append(stock.connection)
+        with stock.connection.cursor() as cursor:
+            cursor.execute(QUERY)
+
+    persistent_rate, persistent_peak = run_load(persistent_request)
+    for stock_connection in stock_connections:
+        stock_connection.inc_thread_sharing()
+        stock_connection.close()
+
+    assert pooled_peak <= pool_size
+    print(f"\n{CONCURRENCY} concurrent clients: "
+          f"pooled (MAX_SIZE={pool_size}) peak {pooled_peak} connections, "
+          f"{pooled_rate:.0f} requests/s; "
+          f"persistent per-thread peak {persistent_peak} connections, "
+          f"{persistent_rate:.0f} requests/s")
@@ -0,0 +1,48 @@
+"""
+Compare the per-request Draft7Validator path with the compiled validator.
+
+Run with:
+    pytest benchmarks/bench_validation.py -s
+"""
+import copy
+import json
+import os
+import timeit
+
+from jsonschema import Draft7Validator
+
+from dsnap_registration.serializers import (REGISTRATION_SCHEMA,
+                                            REGISTRATION_VALIDATOR)
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+ROUNDS = 2000
+
+
+def per_request(document):
+    return [e.message for e in
+            Draft7Validator(REGISTRATION_SCHEMA).iter_errors(document)]
+
+
+def compiled(document):
+    return REGISTRATION_VALIDATOR.error_messages(document)
+
+
+def payloads():
+    with open(EXAMPLE_PATH) as f:
+        example = json.load(f)
+    large = copy.deepcopy(example)
+    large['household'] = [copy.deepcopy(example['household'][0])
+                          for _ in range(12)]
+    return (('examples/request.json', example), ('12-member household', large))
+
+
+def test_validation_benchmark():
+    print()
+    for name, document in payloads():
+        assert per_request(document) == compiled(document) == []
+        before = timeit.timeit(lambda: per_request(document), number=ROUNDS)
+        after = timeit.timeit(lambda: compiled(document), number=ROUNDS)
+        print(f"{name}: per-request {before / ROUNDS * 1e6:.0f}us, "
+              f"compiled {after / ROUNDS * 1e6:.0f}us "
+              f"({before / after:.1f}x)")
@@ -0,0 +1,394 @@
+"""
+Load test a running instance of the service with synthetic registrations.
+
+Each scenario runs for a fixed time with a number of concurrent clients,
+each making a weighted random mix of requests:
+
+    surge       anonymous POST /registrations
+    caseworker  searches, detail reads and status updates
+    mixed       mostly submissions, with some caseworker traffic
+
+Results are written as JSON with, per scenario and endpoint, the number of
+requests, responses by status, throughput and latency percentiles, so runs
+from different commits can be compared (see --baseline).
+
+Run with, e.g.:
+    python benchmarks/loadtest.py http://localhost:8000 \
+        --username caseworker --password secret \
+        --scenario surge --scenario mixed --output loadtest.json
+
+Anonymous submissions from one client address are rate limited by the
+server; raise SUBMISSION_RATE_PER_IP and SUBMISSION_RATE on the server
+under test to measure throughput rather than the throttle.
+"""
+import argparse
+import base64
+import datetime
+import http.client
+import json
+import math
+import os
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+from collections import Counter, defaultdict
+from random import Random
+
+import django
+from django.apps import apps
+
+SCENARIOS = {
+    'surge': {'submit': 1},
+    'caseworker': {'search': 4, 'detail': 4, 'status': 2},
+    'mixed': {'submit': 6, 'search': 2, 'detail': 1.5, 'status': 0.5},
+}
+ENDPOINTS = {
+    'submit': 'POST /registrations',
+    'search': 'GET /registrations',
+    'detail': 'GET /registrations/id',
+    'status': 'PUT /registrations/id/status',
+}
+AUTHENTICATED = {'search', 'detail', 'status'}
+PERCENTILES = (50, 95, 99)
+# Registrations created through /registrations/bulk before the first
+# scenario, for caseworkers to look up
+DEFAULT_SEED_COUNT = 200
+
+
+def percentile(ordered, p):
+    """
+    The nearest-rank `p`th percentile of the sorted list `ordered`
+    """
+    if not ordered:
+        return None
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+
+def summarize(samples, elapsed):
+    """
+    Per-endpoint results from (endpoint, status, seconds) samples
+    """
+    by_endpoint = defaultdict(list)
+    for endpoint, status, seconds in samples:
+        by_endpoint[endpoint].append((status, seconds))
+    results = {}
+    for endpoint, responses in sorted(by_endpoint.items()):
+        # Latency of successful responses; shed requests return early
+        latencies = sorted(seconds * 1000 for status, seconds in responses
+                           if 200 <= status < 300)
+        statuses = Counter(str(status) for status, _ in responses)
+        results[endpoint] = {
+            'requests': len(responses),
+            'succeeded': len(latencies),
+            'statuses': dict(sorted(statuses.items())),
+            'throughput': round(len(responses) / elapsed, 1),
+            'succeeded_throughput': round(len(latencies) / elapsed, 1),
+            'latency_ms': {
+                'mean': (round(sum(latencies) / len(latencies), 2)
+                         if latencies else None),
+                **{f'p{p}': (round(percentile(latencies, p), 2)
+                             if latencies else None)
+                   for p in PERCENTILES},
+                'max': round(latencies[-1], 2) if latencies else None,
+            },
+        }
+    return results
+
+
+class Target:
+    """
+    The server under test, and what the load test has created on it
+    """
+    def __init__(self, url, authorization=None, disaster_ids=(1,), seed=0):
+        parsed = urllib.parse.urlsplit(url)
+        self.host = parsed.hostname
+        self.port = parsed.port
+        self.https = parsed.scheme == 'https'
+        self.prefix = parsed.path.rstrip('/')
+        self.authorization = authorization
+        self.disaster_ids = tuple(disaster_ids)
+        self.seed = seed
+        # (id, search params) of registrations known to exist
+        self.registrations = []
+        self.lock = threading.Lock()
+
+    def connect(self):
+        connection_class = (http.client.HTTPSConnection if self.https
+                            else http.client.HTTPConnection)
+        return connection_class(self.host, self.port, timeout=60)
+
+    def generator(self, stream):
+        from dsnap_registration.synthetic import RegistrationGenerator
+
+        # String seeds are hashed the same way in every process
+        return RegistrationGenerator(seed=f'{self.seed}:{stream}',
+                                     disaster_ids=self.disaster_ids)
+
+    def remember(self, registration_id, payload):
+        registrant = (payload.get('household') or [{}])[0]
+        with self.lock:
+            self.registrations.append((registration_id, {
+                'disaster_id': payload['disaster_id'],
+                'registrant_last_name': registrant.get('last_name', ''),
+            }))
+
+    def seed_registrations(self, count):
+        """
+        Create `count` registrations for the caseworker requests to use
+        """
+        from dsnap_registration.views import BULK_CREATE_MAX_ITEMS
+
+        generator = self.generator('seed')
+        connection = self.connect()
+        try:
+            while count > 0:
+                payloads = list(generator.registrations(
+                    min(count, BULK_CREATE_MAX_ITEMS)))
+                count -= len(payloads)
+                status, body = request(connection, 'POST',
+                                       self.prefix + '/registrations/bulk',
+                                       payloads, self.authorization)
+                if status != 200:
+                    raise SystemExit(f"Seeding registrations failed with "
+                                     f"{status}: {body[:200]!r}")
+                for result in json.loads(body):
+                    if result['status'] == 201:
+                        self.remember(result['id'],
+                                      payloads[result['index']])
+        finally:
+            connection.close()
+
+
+def request(connection, method, path, payload=None, authorization=None):
+    headers = {'Accept': 'application/json'}
+    body = None
+    if payload is not None:
+        body = json.dumps(payload).encode()
+        headers['Content-Type'] = 'application/json'
+    if authorization:
+        headers['Authorization'] = authorization
+    connection.request(method, path, body=body, headers=headers)
+    response = connection.getresponse()
+    return response.status, response.read()
+
+
+class Client(threading.Thread):
+    """
+    Makes requests in the scenario's mix until the deadline
+    """
+    def __init__(self, target, weights, deadline, stream):
+        super().__init__(daemon=True)
+        self.target = target
+        self.operations = list(weights)
+        self.weights = [weights[operation] for operation in self.operations]
+        self.deadline = deadline
+        self.random = Random(f'{target.seed}:{stream}:mix')
+        self.generator = target.generator(stream)
+        self.samples = []
+
+    def run(self):
+        connection = self.target.connect()
+        try:
+            while time.monotonic() < self.deadline:
+                operation = self.random.choices(self.operations,
+                                                self.weights)[0]
+                start = time.perf_counter()
+                try:
+                    status = getattr(self, operation)(connection)
+                except (OSError, http.client.HTTPException):
+                    # Counted as status 0; start over on a new connection
+                    status = 0
+                    connection.close()
+                    connection = self.target.connect()
+                self.samples.append((ENDPOINTS[operation], status,
+                                     time.perf_counter() - start))
+        finally:
+            connection.close()
+
+    def known_registration(self):
+        with self.target.lock:
+            return self.random.choice(self.target.registrations)
+
+    def submit(self, connection):
+        payload = self.generator.registration()
+        status, body = request(connection, 'POST',
+                               self.target.prefix + '/registrations', payload)
+        if status == 201:
+            self.target.remember(json.loads(body)['id'], payload)
+        return status
+
+    def search(self, connection):
+        _, params = self.known_registration()
+        query = urllib.parse.urlencode(dict(params, limit=25))
+        status, _ = request(connection, 'GET',
+                            f'{self.target.prefix}/registrations?{query}',
+                            authorization=self.target.authorization)
+        return status
+
+    def detail(self, connection):
+        registration_id, _ = self.known_registration()
+        status, _ = request(
+            connection, 'GET',
+            f'{self.target.prefix}/registrations/{registration_id}',
+            authorization=self.target.authorization)
+        return status
+
+    def status(self, connection):
+        registration_id, _ = self.known_registration()
+        status, _ = request(
+            connection, 'PUT',
+            f'{self.target.prefix}/registrations/{registration_id}/status',
+            {'rules_service_approved': self.random.random() < 0.8,
+             'user_approved': self.random.random() < 0.7},
+            authorization=self.target.authorization)
+        return status
+
+
+def run_scenario(target, name, duration, concurrency):
+    weights = SCENARIOS[name]
+    deadline = time.monotonic() + duration
+    clients = [Client(target, weights, deadline, (name, index))
+               for index in range(concurrency)]
+    start = time.perf_counter()
+    for client in clients:
+        client.start()
+    for client in clients:
+        client.join()
+    elapsed = time.perf_counter() - start
+    samples = [sample for client in clients for sample in client.samples]
+    return {
+        'duration': round(elapsed, 2),
+        'concurrency': concurrency,
+        'endpoints': summarize(samples, elapsed),
+    }
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', 'HEAD'], stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline):
+    """
+    Lines showing how throughput and p95 latency changed from `baseline`
+    """
+    lines = []
+    for name, scenario in results['scenarios'].items():
+        before = baseline.get('scenarios', {}).get(name, {})
+        for endpoint, now in scenario['endpoints'].items():
+            then = before.get('endpoints', {}).get(endpoint)
+            if then is None:
+                continue
+            line = (f"{name:<11} {endpoint:<29} "
+                    f"{then['succeeded_throughput']:>8}/s -> "
+                    f"{now['succeeded_throughput']:>8}/s")
+            p95_then = then['latency_ms']['p95']
+            p95_now = now['latency_ms']['p95']
+            if p95_then is not None and p95_now is not None:
+                line += f"   p95 {p95_then:>8}ms -> {p95_now:>8}ms"
+            lines.append(line)
+    return lines
+
+
+def setup_django():
+    """
+    Configure Django, which the synthetic registrations need, unless it
+    already is (as when run from the tests)
+    """
+    if apps.ready:
+        return
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE',
+                          'dsnap_registration_service.settings.local')
+    django.setup()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Load test a running dsnap_registration_service")
+    parser.add_argument('url', help="e.g. http://localhost:8000")
+    parser.add_argument('--scenario', action='append',
+                        choices=sorted(SCENARIOS),
+                        help="Run this scenario; may be repeated "
+                             "(default: mixed)")
+    parser.add_argument('--duration', type=float, default=30,
+                        help="Seconds to run each scenario")
+    parser.add_argument('--concurrency', type=int, default=20,
+                        help="Number of concurrent clients")
+    parser.add_argument('--username',
+                        default=os.environ.get('LOADTEST_USERNAME'))
+    parser.add_argument('--password',
+                        default=os.environ.get('LOADTEST_PASSWORD'))
+    parser.add_argument('--disaster-id', type=int, action='append',
+                        dest='disaster_ids',
+                        help="Disaster to register for; may be repeated "
+                             "(default: 1)")
+    parser.add_argument('--seed', type=int, default=0,
+                        help="Seed for the synthetic registrations")
+    parser.add_argument('--seed-count', type=int, default=DEFAULT_SEED_COUNT,
+                        help="Registrations to create for caseworker "
+                             "requests before the first scenario")
+    parser.add_argument('--output', default='loadtest.json')
+    parser.add_argument('--baseline',
+                        help="Results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+    scenarios = args.scenario or ['mixed']
+    setup_django()
+
+    authorization = None
+    if args.username:
+        credentials = f'{args.username}:{args.password or ""}'
+        authorization = 'Basic ' + base64.b64encode(
+            credentials.encode()).decode()
+    elif any(AUTHENTICATED & set(SCENARIOS[name]) for name in scenarios):
+        parser.error("caseworker requests need --username and --password")
+    if authorization and args.seed_count < 1:
+        parser.error("caseworker requests need --seed-count of at least 1")
+
+    target = Target(args.url, authorization, args.disaster_ids or (1,),
+                    args.seed)
+    if authorization and args.seed_count:
+        target.seed_registrations(args.seed_count)
+
+    results = {
+        'commit': current_commit(),
+        'started_at': datetime.datetime.now(
+            datetime.timezone.utc).isoformat(),
+        'url': args.url,
+        'seed': args.seed,
+        'scenarios': {},
+    }
+    for name in scenarios:
+        result = run_scenario(target, name, args.duration, args.concurrency)
+        results['scenarios'][name] = result
+        for endpoint, summary in result['endpoints'].items():
+            latency = summary['latency_ms']
+            print(f"{name:<11} {endpoint:<29} {summary['requests']:>7} "
+                  f"{summary['succeeded_throughput']:>8}/s  "
+                  f"p50 {latency['p50']}ms  p95 {latency['p95']}ms  "
+                  f"p99 {latency['p99']}ms  {summary['statuses']}")
+
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        print(f"Compared with {args.baseline} "
+              f"(commit {baseline.get('commit')}):")
+        for line in compare(results, baseline):
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
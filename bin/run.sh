@@ -1,4 +1,9 @@
 #!/usr/bin/env bash
-[ $CF_INSTANCE_INDEX -eq 0 ] && python manage.py migrate
+[ $CF_INSTANCE_INDEX -eq 0 ] && python manage.py migrate && \
+    python manage.py createcachetable
 python manage.py collectstatic --noinput
-gunicorn -k gevent -w 4 -b 0.0.0.0:$PORT dsnap_registration_service.wsgi
+# Where the gunicorn workers leave their metrics for /metrics to add up;
+# emptied so counts start over with the new workers
+export METRICS_DIR=${METRICS_DIR:-/tmp/dsnap-metrics}
+rm -rf "$METRICS_DIR" && mkdir -p "$METRICS_DIR"
+gunicorn -c gunicorn.conf.py -b 0.0.0.0:$PORT dsnap_registration_service.wsgi
@@ -0,0 +1,121 @@
+"""
+Admission control for anonymous registration submissions.
+
+Anonymous POSTs to /registrations pass two token buckets, one per client IP
+and one shared by all clients. Each bucket holds up to the number of
+requests in its DRF throttle rate (``DEFAULT_THROTTLE_RATES``) and refills
+at that rate, so short bursts get through while a sustained flood is
+answered with ``429`` and ``Retry-After``. The client IP is the one DRF
+reads from X-Forwarded-For given ``NUM_PROXIES``, so clients cannot pick
+their own bucket by sending that header. Buckets are kept in the Django
+cache named by ``SUBMISSION_THROTTLE_CACHE``; with the default in-process
+cache each worker process has its own buckets. A shared cache makes them
+approximate, since reading and updating a bucket are separate operations.
+
+At most ``SUBMISSION_MAX_CONCURRENT`` anonymous submissions are handled at
+once per process. Beyond that they are turned away right away with ``503``
+and ``Retry-After``, so they cannot tie up a worker that caseworkers also
+use. Authenticated requests are not subject to either limit.
+"""
+import threading
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.settings import api_settings
+from rest_framework.throttling import SimpleRateThrottle
+
+
+class ServiceUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Too many submissions are in progress; try again soon.'
+    default_code = 'service_unavailable'
+
+    def __init__(self, wait, detail=None, code=None):
+        super().__init__(detail, code)
+        # Sent as Retry-After by DRF's exception handler
+        self.wait = wait
+
+
+def is_anonymous_submission(request):
+    return request.method == 'POST' and not request.user.is_authenticated
+
+
+class TokenBucketThrottle(SimpleRateThrottle):
+    """
+    A throttle allowing bursts of up to `num_requests`, refilled at
+    `num_requests` per `duration`. No rate for the scope turns it off.
+    """
+    def get_rate(self):
+        # Read when the throttle is made, so changed settings apply
+        return api_settings.DEFAULT_THROTTLE_RATES.get(self.scope)
+
+    @property
+    def cache(self):
+        return caches[settings.SUBMISSION_THROTTLE_CACHE]
+
+    def allow_request(self, request, view):
+        if self.rate is None or not is_anonymous_submission(request):
+            return True
+        self.key = self.get_cache_key(request, view)
+        now = self.timer()
+        tokens, updated_at = self.cache.get(self.key,
+                                            (self.num_requests, now))
+        self.tokens = min(self.num_requests, tokens + (
+            now - updated_at) * self.num_requests / self.duration)
+        if self.tokens < 1:
+            return False
+        # The bucket is full again after `duration`, as if it had expired
+        self.cache.set(self.key, (self.tokens - 1, now), self.duration)
+        return True
+
+    def wait(self):
+        return (1 - self.tokens) * self.duration / self.num_requests
+
+
+class SubmissionRateThrottle(TokenBucketThrottle):
+    """
+    Anonymous submissions per client IP
+    """
+    scope = 'anonymous_submission'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope,
+                                    'ident': self.get_ident(request)}
+
+
+class SubmissionGlobalRateThrottle(TokenBucketThrottle):
+    """
+    Anonymous submissions from all clients together
+    """
+    scope = 'anonymous_submissions_total'
+
+    def get_cache_key(self, request, view):
+        return self.cache_format % {'scope': self.scope, 'ident': 'all'}
+
+
+class ConcurrencyLimit:
+    """
+    Counts the requests in progress in this process
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def acquire(self, limit):
+        """
+        Take a slot if fewer than `limit` are taken; return whether it did
+        """
+        with self._lock:
+            if limit is not None and self.active >= limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+submission_slots = ConcurrencyLimit()
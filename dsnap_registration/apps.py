@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class DsnapRegistrationConfig(AppConfig):
     name = 'dsnap_registration'
+
+    def ready(self):
+        from .routers import check_pin_cache
+        check_pin_cache()
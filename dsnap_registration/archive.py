@@ -0,0 +1,31 @@
+"""
+Cold storage for the registrations of closed disasters.
+
+``python manage.py archive_disaster <disaster_id>`` moves every registration
+of a disaster into the archived_registration table, one ArchivedRegistration
+per registration. Its original_data is stored once, its latest_data as a
+JSON Patch against original_data (see deltas.py), and both are compressed
+with zlib, which makes the archived rows a small fraction of the size of the
+registrations. The disaster's partition of the registration table is then
+dropped, and its match keys deleted, so the hot table and its indexes only
+hold open disasters.
+
+Archived registrations are read-only. ``GET /registrations/<id>`` still
+returns them, and the disaster statistics keep counting them.
+"""
+import json
+import zlib
+
+COMPRESSION_LEVEL = 9
+
+
+def pack(value):
+    """
+    Compress a JSON value
+    """
+    return zlib.compress(
+        json.dumps(value, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+
+
+def unpack(packed):
+    return json.loads(zlib.decompress(packed).decode())
@@ -0,0 +1,92 @@
+import hashlib
+import hmac
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from rest_framework.authentication import BasicAuthentication
+
+from .metrics import phase
+
+
+class CredentialCache:
+    """
+    A bounded, TTL-evicted, in-process cache of credentials that have already
+    passed a full password check.
+
+    Entries are keyed by an HMAC of the username and password, so plain text
+    passwords are never kept, and map to the user's pk and the password hash
+    the credentials were verified against. A hit is only honoured while the
+    stored hash is unchanged, so changing a password invalidates every cached
+    entry for that user, in every worker.
+    """
+    def __init__(self):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(userid, password):
+        return hmac.new(settings.SECRET_KEY.encode(),
+                        f'{userid}:{password}'.encode(),
+                        hashlib.sha256).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user_pk, password_hash, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user_pk, password_hash
+
+    def set(self, key, user_pk, password_hash):
+        expires_at = time.monotonic() + settings.BASIC_AUTH_CACHE_TTL
+        with self._lock:
+            self._entries[key] = (user_pk, password_hash, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.BASIC_AUTH_CACHE_MAX_ENTRIES:
+                self._entries.popitem(last=False)
+
+    def discard(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+credential_cache = CredentialCache()
+
+
+class CachedBasicAuthentication(BasicAuthentication):
+    """
+    HTTP Basic authentication that skips the (deliberately slow) password
+    hashing for credentials it has recently verified. A cache hit costs a
+    primary key lookup of the user instead.
+    """
+    def authenticate(self, request):
+        with phase('authentication'):
+            return super().authenticate(request)
+
+    def authenticate_credentials(self, userid, password, request=None):
+        key = credential_cache.key(userid, password)
+        cached = credential_cache.get(key)
+        if cached is not None:
+            user_pk, password_hash = cached
+            user = get_user_model()._default_manager.filter(
+                pk=user_pk).first()
+            if (user is not None and user.is_active and
+                    user.password == password_hash):
+                return (user, None)
+            credential_cache.discard(key)
+
+        user, auth = super().authenticate_credentials(userid, password,
+                                                      request)
+        credential_cache.set(key, user.pk, user.password)
+        return (user, auth)
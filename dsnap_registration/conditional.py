@@ -0,0 +1,98 @@
+"""
+Conditional requests (ETag and Last-Modified) for registration responses.
+
+Every write bumps ``Registration.modified_at``, so a registration's state is
+identified by its pk and modified_at, and the state of a page of a list by
+the pk and modified_at of each registration on it, along with what the
+page says about the rest of the list (the total count and the links to the
+pages around it). Validators are only read up front for conditional
+requests, and then only those columns of the page's rows, so a request
+that ends in a 304 or 412 never loads the JSON documents and costs no more
+than the page itself.
+
+HTTP dates only have one second resolution, so If-None-Match (which takes
+precedence when both are sent) is the reliable way to revalidate.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+CONDITIONAL_HEADERS = ('HTTP_IF_MATCH', 'HTTP_IF_NONE_MATCH',
+                       'HTTP_IF_MODIFIED_SINCE', 'HTTP_IF_UNMODIFIED_SINCE')
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The registration has changed since it was last read.'
+    default_code = 'precondition_failed'
+
+
+def is_conditional(request):
+    return any(header in request.META for header in CONDITIONAL_HEADERS)
+
+
+def make_etag(request, *state):
+    """
+    A strong ETag for `state` as rendered for this request. Query params and
+    the response format are part of it, since they change the representation.
+    """
+    variant = (request.accepted_renderer.format,
+               sorted(request.query_params.lists()))
+    return quote_etag(
+        hashlib.sha1(repr((state, variant)).encode()).hexdigest())
+
+
+def http_timestamp(value):
+    # HTTP dates are whole seconds
+    return int(value.timestamp())
+
+
+def registration_validators(request, pk, modified_at):
+    """
+    The (etag, last_modified) pair for a single registration
+    """
+    return (make_etag(request, pk, modified_at.isoformat()),
+            http_timestamp(modified_at))
+
+
+def list_validators(request, rows, page_state=None):
+    """
+    The (etag, last_modified) pair for a page of registrations, from the
+    (pk, modified_at) of each of its `rows` and the paginator's
+    `page_state`
+    """
+    rows = list(rows)
+    modified_at = max((row[1] for row in rows), default=None)
+    state = [(pk, row_modified_at.isoformat()) for pk, row_modified_at in rows]
+    return (make_etag(request, state, page_state),
+            modified_at and http_timestamp(modified_at))
+
+
+def evaluate_preconditions(request, etag, last_modified):
+    """
+    Return a 304 response if the client's copy is current, raise
+    PreconditionFailed if an If-Match or If-Unmodified-Since precondition
+    does not hold, or return None if the request should go ahead
+    """
+    response = get_conditional_response(request, etag=etag,
+                                        last_modified=last_modified)
+    if response is None:
+        return None
+    if response.status_code == status.HTTP_412_PRECONDITION_FAILED:
+        raise PreconditionFailed()
+    return set_validators(response, etag, last_modified)
+
+
+def set_validators(response, etag, last_modified):
+    """
+    Add ETag and Last-Modified to a response, and have clients revalidate
+    instead of reusing it (shared caches must not store it at all)
+    """
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
@@ -0,0 +1,132 @@
+"""
+Deltas between JSON documents, as JSON Patch (RFC 6902) operations.
+
+``make_patch(source, target)`` returns the add, remove and replace
+operations that turn `source` into `target`, and ``apply_patch`` applies
+them. Objects are compared key by key and arrays item by item, so a change
+deep inside a registration is a single small operation. Values of different
+JSON types never compare equal, even where Python's do (1, 1.0 and True).
+"""
+import copy
+
+
+class PatchError(ValueError):
+    pass
+
+
+def _same(a, b):
+    return type(a) is type(b) and a == b
+
+
+def escape(key):
+    return str(key).replace('~', '~0').replace('/', '~1')
+
+
+def unescape(token):
+    return token.replace('~1', '/').replace('~0', '~')
+
+
+def make_patch(source, target, path=''):
+    """
+    Return the list of operations that turn `source` into `target`
+    """
+    if isinstance(source, dict) and isinstance(target, dict):
+        operations = []
+        for key in source:
+            if key not in target:
+                operations.append({'op': 'remove',
+                                   'path': f'{path}/{escape(key)}'})
+        for key, value in target.items():
+            if key not in source:
+                operations.append({'op': 'add',
+                                   'path': f'{path}/{escape(key)}',
+                                   'value': value})
+            else:
+                operations += make_patch(source[key], value,
+                                         f'{path}/{escape(key)}')
+        return operations
+    if isinstance(source, list) and isinstance(target, list):
+        operations = []
+        common = min(len(source), len(target))
+        for index in range(common):
+            operations += make_patch(source[index], target[index],
+                                     f'{path}/{index}')
+        # Trailing items are removed from the end so earlier indexes hold
+        for index in range(len(source) - 1, common - 1, -1):
+            operations.append({'op': 'remove', 'path': f'{path}/{index}'})
+        for index in range(common, len(target)):
+            operations.append({'op': 'add', 'path': f'{path}/{index}',
+                               'value': target[index]})
+        return operations
+    if _same(source, target):
+        return []
+    return [{'op': 'replace', 'path': path, 'value': target}]
+
+
+def apply_patch(document, patch):
+    """
+    Return a copy of `document` with the operations in `patch` applied.
+    Raises PatchError if an operation does not fit the document.
+    """
+    document = copy.deepcopy(document)
+    for operation in patch:
+        op, path = operation.get('op'), operation.get('path')
+        if op not in ('add', 'remove', 'replace') or not isinstance(path, str):
+            raise PatchError(f"Unsupported operation {operation!r}")
+        if op != 'remove' and 'value' not in operation:
+            raise PatchError(f"Missing value in {operation!r}")
+        if path == '':
+            if op == 'remove':
+                raise PatchError("Cannot remove the whole document")
+            document = copy.deepcopy(operation['value'])
+            continue
+        if not path.startswith('/'):
+            raise PatchError(f"Invalid path {path!r}")
+        *parents, last = [unescape(token) for token in path[1:].split('/')]
+        container = document
+        for token in parents:
+            container = _child(container, token, path)
+        _apply(container, op, last, operation, path)
+    return document
+
+
+def _index(container, token, path, allow_end=False):
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise PatchError(f"Invalid array index in {path!r}")
+    index = int(token)
+    if index > len(container) or (index == len(container) and not allow_end):
+        raise PatchError(f"Array index out of range in {path!r}")
+    return index
+
+
+def _child(container, token, path):
+    if isinstance(container, dict):
+        if token not in container:
+            raise PatchError(f"Missing member in {path!r}")
+        return container[token]
+    if isinstance(container, list):
+        return container[_index(container, token, path)]
+    raise PatchError(f"Cannot descend into a scalar in {path!r}")
+
+
+def _apply(container, op, token, operation, path):
+    if isinstance(container, dict):
+        if op != 'add' and token not in container:
+            raise PatchError(f"Missing member in {path!r}")
+        if op == 'remove':
+            del container[token]
+        else:
+            container[token] = copy.deepcopy(operation['value'])
+    elif isinstance(container, list):
+        if op == 'add' and token == '-':
+            container.append(copy.deepcopy(operation['value']))
+            return
+        index = _index(container, token, path, allow_end=op == 'add')
+        if op == 'add':
+            container.insert(index, copy.deepcopy(operation['value']))
+        elif op == 'remove':
+            del container[index]
+        else:
+            container[index] = copy.deepcopy(operation['value'])
+    else:
+        raise PatchError(f"Cannot descend into a scalar in {path!r}")
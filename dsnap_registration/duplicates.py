@@ -0,0 +1,59 @@
+"""
+Match keys for finding registrations that are likely the same application
+submitted more than once.
+
+Two registrations for the same disaster are candidate duplicates when they
+share a key: the SSN of any household member, or any member's date of birth
+together with their last name. Keys are normalized so that formatting and
+case differences still match.
+"""
+import re
+
+MATCH_SSN = 'ssn'
+MATCH_DOB_LAST_NAME = 'dob_last_name'
+
+NON_DIGITS = re.compile(r'\D')
+
+MIN_DISASTER_ID = -2 ** 31
+MAX_DISASTER_ID = 2 ** 31 - 1
+
+
+def parse_disaster_id(data):
+    """
+    The registration's disaster_id as an int, or None if it has none
+    """
+    value = data.get('disaster_id') if isinstance(data, dict) else None
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if isinstance(value, float) and not value.is_integer():
+        return None
+    if not MIN_DISASTER_ID <= value <= MAX_DISASTER_ID:
+        # Out of range for the integer columns it is stored in
+        return None
+    return int(value)
+
+
+def normalize_name(value):
+    # Upper-cased like the case-insensitive search fields
+    return ' '.join(value.split()).upper()
+
+
+def match_keys(data):
+    """
+    Return the set of (kind, value) match keys for a registration's data
+    """
+    household = data.get('household') if isinstance(data, dict) else None
+    keys = set()
+    for member in household or []:
+        if not isinstance(member, dict):
+            continue
+        ssn = member.get('ssn')
+        if isinstance(ssn, str) and NON_DIGITS.sub('', ssn):
+            keys.add((MATCH_SSN, NON_DIGITS.sub('', ssn)))
+        dob = member.get('dob')
+        last_name = member.get('last_name')
+        if (isinstance(dob, str) and dob.strip() and
+                isinstance(last_name, str) and last_name.strip()):
+            keys.add((MATCH_DOB_LAST_NAME,
+                      f'{dob.strip()}:{normalize_name(last_name)}'))
+    return keys
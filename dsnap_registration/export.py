@@ -0,0 +1,134 @@
+"""
+Streaming exports of registrations as NDJSON or as a flattened CSV.
+
+Rows are read through a server-side cursor in chunks and written out one at
+a time, so memory stays flat no matter how many registrations are exported.
+"""
+import csv
+
+from django.contrib.postgres.fields.jsonb import KeyTransform
+from django.db.models import Func, Max
+from django.db.models.expressions import RawSQL
+from rest_framework.utils import json
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import REGISTRATION_SCHEMA
+from .validation import inline_refs
+
+EXPORT_FIELDS = (
+    'id',
+    'created_at',
+    'modified_at',
+    'rules_service_approved',
+    'user_approved',
+    'approved_at',
+)
+# Rows fetched from the server-side cursor per round trip
+EXPORT_CHUNK_SIZE = 2000
+
+# The longest jobs list of any household member in a registration
+MAX_JOBS_SQL = """
+    SELECT max(jsonb_array_length(member -> 'jobs'))
+    FROM jsonb_array_elements("registration"."latest_data" -> 'household')
+        AS member
+"""
+
+_encoder = JSONEncoder()
+
+
+def export_records(queryset):
+    """
+    Yield one dict per registration with the EXPORT_FIELDS and latest_data
+    """
+    fields = EXPORT_FIELDS + ('latest_data',)
+    rows = queryset.order_by('id').values_list(*fields)
+    for row in rows.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield dict(zip(fields, row))
+
+
+def ndjson_lines(queryset):
+    for record in export_records(queryset):
+        yield json.dumps(record, cls=JSONEncoder, ensure_ascii=False,
+                         separators=(',', ':')) + '\n'
+
+
+def csv_columns(queryset):
+    """
+    The flattened latest_data columns, with the household and jobs arrays
+    expanded to the longest ones in the exported registrations
+    """
+    lengths = queryset.annotate(
+        household_length=Func(KeyTransform('household', 'latest_data'),
+                              function='jsonb_array_length'),
+        jobs_length=RawSQL(MAX_JOBS_SQL, ()),
+    ).aggregate(household=Max('household_length'), jobs=Max('jobs_length'))
+    array_lengths = {
+        'household': lengths['household'] or 0,
+        'household.jobs': lengths['jobs'] or 0,
+    }
+    return list(_schema_columns(inline_refs(REGISTRATION_SCHEMA), (), (),
+                                array_lengths))
+
+
+def _schema_columns(schema, path, array_path, array_lengths):
+    if 'properties' in schema:
+        for key, subschema in schema['properties'].items():
+            yield from _schema_columns(subschema, path + (key,),
+                                       array_path + (key,), array_lengths)
+    elif 'items' in schema:
+        for index in range(array_lengths.get('.'.join(array_path), 0)):
+            yield from _schema_columns(schema['items'], path + (str(index),),
+                                       array_path, array_lengths)
+    else:
+        yield '.'.join(path)
+
+
+def flatten(value, prefix=''):
+    """
+    Flatten nested objects and arrays into a dict keyed by dotted paths
+    """
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        return {prefix: value}
+    flat = {}
+    for key, item in items:
+        flat.update(flatten(item, f'{prefix}.{key}' if prefix else str(key)))
+    return flat
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (str, int, float)):
+        return value
+    return _encoder.default(value)
+
+
+class _Echo:
+    """
+    A file-like object for csv.writer that hands back each written line
+    """
+    def write(self, value):
+        return value
+
+
+def csv_lines(queryset):
+    columns = csv_columns(queryset)
+    writer = csv.writer(_Echo())
+    yield writer.writerow(EXPORT_FIELDS + tuple(columns))
+    for record in export_records(queryset):
+        data = flatten(record.pop('latest_data'))
+        yield writer.writerow(
+            [_csv_value(record[field]) for field in EXPORT_FIELDS] +
+            [_csv_value(data.get(column)) for column in columns])
+
+
+EXPORT_FORMATS = {
+    'ndjson': ndjson_lines,
+    'csv': csv_lines,
+}
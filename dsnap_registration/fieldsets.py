@@ -0,0 +1,96 @@
+"""
+Sparse fieldsets for registration responses.
+
+``?fields=`` and ``?exclude=`` take comma-separated serializer field names.
+``fields`` may also name paths inside the JSON documents, such as
+``latest_data.household.0.last_name``. Those are extracted by Postgres, so
+JSON columns that are not asked for in full are never read from the database.
+"""
+import re
+from functools import reduce
+
+from django.contrib.postgres.fields.jsonb import KeyTransform
+from rest_framework.exceptions import ValidationError
+
+JSON_FIELDS = ('original_data', 'latest_data')
+PATH_SEGMENT = re.compile(r'^\w+$')
+
+
+class Fieldset:
+    def __init__(self, fields, json_paths):
+        # Serializer fields to keep
+        self.fields = fields
+        # Maps each requested JSON path to the annotation holding its value
+        self.json_paths = json_paths
+
+    @classmethod
+    def from_params(cls, params, available_fields):
+        """
+        Build a Fieldset from the request's query params, or return None if
+        neither `fields` nor `exclude` was given
+        """
+        fields_param = params.get('fields')
+        exclude_param = params.get('exclude')
+        if fields_param is None and exclude_param is None:
+            return None
+
+        errors = []
+        fields = set()
+        json_paths = {}
+        if fields_param is None:
+            fields = set(available_fields)
+        else:
+            for name in _split(fields_param):
+                root, _, path = name.partition('.')
+                if not path and root in available_fields:
+                    fields.add(name)
+                elif (path and root in JSON_FIELDS and
+                        all(map(PATH_SEGMENT.match, path.split('.')))):
+                    json_paths[name] = f'_fieldset_path_{len(json_paths)}'
+                else:
+                    errors.append(f"Unknown field '{name}'")
+        for name in _split(exclude_param or ''):
+            if name not in available_fields:
+                errors.append(f"Unknown field '{name}'")
+            fields.discard(name)
+
+        if errors:
+            raise ValidationError({'fields': errors})
+        return cls(fields, json_paths)
+
+    def apply(self, queryset):
+        """
+        Defer the JSON columns that are not requested in full and have
+        Postgres extract the requested JSON paths
+        """
+        deferred = [name for name in JSON_FIELDS if name not in self.fields]
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        annotations = {
+            alias: reduce(lambda lhs, key: KeyTransform(key, lhs),
+                          path.split('.'))
+            for path, alias in self.json_paths.items()
+        }
+        return queryset.annotate(**annotations)
+
+    def annotate(self, instance):
+        """
+        Set the requested JSON paths on an instance that was not read
+        through apply(), extracting them the way Postgres does
+        """
+        for path, alias in self.json_paths.items():
+            root, *keys = path.split('.')
+            value = getattr(instance, root)
+            for key in keys:
+                # Numeric keys are array indexes, as in KeyTransform
+                if key.isdigit():
+                    index = int(key)
+                    value = (value[index] if isinstance(value, list) and
+                             index < len(value) else None)
+                else:
+                    value = value.get(key) if isinstance(value, dict) else None
+            setattr(instance, alias, value)
+
+
+def _split(param):
+    return [name.strip() for name in param.split(',') if name.strip()]
@@ -0,0 +1,148 @@
+"""
+Group commit for registration creates.
+
+With ``GROUP_COMMIT_WINDOW`` set to a number of seconds, registrations
+created by concurrent requests in a worker process are written together:
+the first one to arrive waits up to the window (or until
+``GROUP_COMMIT_MAX_SIZE`` have arrived), then inserts all of them with
+``Registration.objects.bulk_create`` in one transaction, so they share one
+commit and its fsync. Every request still gets back its own registration
+with its own id. If the batch fails, each request inserts its registration
+on its own, so one bad registration cannot fail the others.
+
+The batch is marked done however the leader's request ends, even if its
+greenlet is killed while it waits or writes, and a request whose batch has
+not started writing within ``GROUP_COMMIT_TIMEOUT`` seconds of the window
+takes its registration back out and inserts it on its own, so no request
+waits on a batch forever.
+
+Requests wait with the threading module, which gevent's monkey patching
+makes cooperative.
+"""
+import threading
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Registration
+
+_committer = None
+_committer_lock = threading.Lock()
+
+
+class Batch:
+    def __init__(self):
+        self.registrations = []
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.failed = False
+        # Guards `started` and taking registrations back out
+        self.lock = threading.Lock()
+        self.started = False
+
+    def start(self):
+        with self.lock:
+            self.started = True
+
+    def withdraw(self, registration):
+        """
+        Take `registration` back out of the batch, unless it is already
+        being written. Returns whether it was taken out.
+        """
+        with self.lock:
+            if self.started:
+                return False
+            # In place, as other requests may be joining the batch
+            for index, joined in enumerate(self.registrations):
+                if joined is registration:
+                    del self.registrations[index]
+                    break
+            return True
+
+    def write(self):
+        try:
+            with transaction.atomic():
+                Registration.objects.bulk_create(self.registrations)
+        except Exception:
+            self.failed = True
+
+
+class GroupCommitter:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._batch = None
+
+    def create(self, registration, window, max_size):
+        """
+        Insert `registration` together with the ones other threads are
+        creating, and return it with its id set
+        """
+        with self._lock:
+            batch = self._batch
+            leader = batch is None
+            if leader:
+                batch = self._batch = Batch()
+            batch.registrations.append(registration)
+            if len(batch.registrations) >= max_size:
+                self._batch = None
+                batch.full.set()
+
+        if leader:
+            self.lead(batch, window)
+        elif not batch.done.wait(window + settings.GROUP_COMMIT_TIMEOUT):
+            if batch.withdraw(registration):
+                registration.save(force_insert=True)
+                return registration
+            # It is being written, and the leader marks the batch done
+            # however that ends
+            batch.done.wait()
+
+        if batch.failed:
+            # Nothing from the batch was kept
+            registration.pk = None
+            registration._state.adding = True
+            registration.save(force_insert=True)
+        return registration
+
+    def lead(self, batch, window):
+        """
+        Wait for `batch` to fill up or the window to pass, then write it.
+        The batch ends up done whatever happens, failed unless written.
+        """
+        written = False
+        try:
+            batch.full.wait(window)
+            with self._lock:
+                if self._batch is batch:
+                    self._batch = None
+            batch.start()
+            batch.write()
+            written = True
+        finally:
+            if not written:
+                with self._lock:
+                    if self._batch is batch:
+                        self._batch = None
+                batch.failed = True
+            batch.done.set()
+
+
+def create_registration(registration):
+    """
+    Insert a new registration, through group commit if it is turned on
+    """
+    window = settings.GROUP_COMMIT_WINDOW
+    if not window:
+        registration.save(force_insert=True)
+        return registration
+    return get_committer().create(registration, window,
+                                  settings.GROUP_COMMIT_MAX_SIZE)
+
+
+def get_committer():
+    # Made on first use, after gevent has patched the threading module
+    global _committer
+    with _committer_lock:
+        if _committer is None:
+            _committer = GroupCommitter()
+        return _committer
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from dsnap_registration.models import (ArchivedRegistration, MatchKey,
+                                       Registration)
+from dsnap_registration.partitions import drop_partition
+
+
+class Command(BaseCommand):
+    help = ("Move every registration of a closed disaster into the "
+            "compressed archive, in batches ordered by id, then drop the "
+            "disaster's partition of the registration table")
+
+    def add_arguments(self, parser):
+        parser.add_argument('disaster_id', type=int)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        disaster_id = options['disaster_id']
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        last_id = 0
+        archived = 0
+        while True:
+            with transaction.atomic():
+                batch = list(Registration.objects.select_for_update()
+                             .filter(disaster_id=disaster_id, pk__gt=last_id)
+                             .order_by('pk')[:batch_size])
+                if not batch:
+                    break
+                ids = [registration.pk for registration in batch]
+                ArchivedRegistration.objects.bulk_create(
+                    ArchivedRegistration.from_registration(registration)
+                    for registration in batch)
+                MatchKey.objects.filter(registration_id__in=ids).delete()
+                # Not Registration.delete(), which would take the archived
+                # registrations out of the disaster statistics
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "DELETE FROM registration "
+                        "WHERE disaster_id = %s AND id = ANY(%s)",
+                        [disaster_id, ids])
+            archived += len(batch)
+            last_id = ids[-1]
+            self.stdout.write(f"Archived {archived} registrations "
+                              f"(up to id {last_id})")
+
+        if drop_partition(disaster_id):
+            self.stdout.write(f"Dropped the partition of disaster "
+                              f"{disaster_id}")
+        self.stdout.write(f"Done: archived {archived} registrations of "
+                          f"disaster {disaster_id}")
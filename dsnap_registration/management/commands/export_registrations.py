@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.exceptions import ValidationError
+
+from dsnap_registration.export import EXPORT_FORMATS
+from dsnap_registration.models import Registration
+from dsnap_registration.search import (REGISTRANT_SEARCH_PARAMS,
+                                       REGISTRATION_SEARCH_PARAMS,
+                                       get_search_filters)
+
+
+class Command(BaseCommand):
+    help = ("Stream registrations as NDJSON or as a flattened CSV, "
+            "optionally filtered like the /registrations search")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(EXPORT_FORMATS),
+                            default='ndjson')
+        parser.add_argument('--output',
+                            help="File to write to (default: stdout)")
+        parser.add_argument('--disaster-id', dest='disaster_id')
+        for param, _ in REGISTRATION_SEARCH_PARAMS:
+            parser.add_argument(f'--{param.replace("_", "-")}', dest=param)
+        for param, _ in REGISTRANT_SEARCH_PARAMS:
+            parser.add_argument(f'--registrant-{param.replace("_", "-")}',
+                                dest=f'registrant_{param}')
+        parser.add_argument('--possible-duplicates', action='store_const',
+                            const='true',
+                            help="Only registrations sharing a match key "
+                                 "with another one of the same disaster")
+
+    def handle(self, *args, **options):
+        try:
+            search_filters = get_search_filters(options)
+        except ValidationError as e:
+            raise CommandError(e.detail)
+        queryset = Registration.objects.filter(**search_filters)
+        lines = EXPORT_FORMATS[options['format']](queryset)
+
+        if options['output']:
+            with open(options['output'], 'w', newline='') as output:
+                output.writelines(lines)
+        else:
+            for line in lines:
+                self.stdout.write(line, ending='')
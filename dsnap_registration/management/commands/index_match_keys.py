@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from dsnap_registration.models import MatchKey, Registration
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the duplicate-detection match keys of existing "
+            "registrations, in batches ordered by id")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--start-id', type=int, default=0,
+                            help="Resume from this registration id")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        last_id = options['start_id'] - 1
+        indexed = 0
+        while True:
+            batch = list(Registration.objects.filter(pk__gt=last_id)
+                         .order_by('pk').only('pk', 'latest_data')
+                         [:batch_size])
+            if not batch:
+                break
+            with transaction.atomic():
+                MatchKey.objects.filter(registration__in=batch).delete()
+                MatchKey.objects.bulk_create(
+                    key for registration in batch
+                    for key in registration.build_match_keys())
+            indexed += len(batch)
+            last_id = batch[-1].pk
+            self.stdout.write(f"Indexed {indexed} registrations "
+                              f"(up to id {last_id})")
+        self.stdout.write(f"Done: indexed {indexed} registrations")
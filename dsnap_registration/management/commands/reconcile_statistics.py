@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from dsnap_registration.models import DisasterStatistic
+from dsnap_registration.statistics import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = ("Rebuild the per-disaster statistics from the registration "
+            "table. Registration writes wait while it runs.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_statistics()
+        self.stdout.write(f"Rebuilt {DisasterStatistic.objects.count()} "
+                          f"disaster statistic counters")
@@ -0,0 +1,79 @@
+import multiprocessing
+import os
+from functools import partial
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+
+from dsnap_registration.partitions import ensure_partitions
+from dsnap_registration.seeding import (DEFAULT_CHUNK_SIZE, load_chunk,
+                                        plan_chunks, reserve_ids)
+from dsnap_registration.statistics import rebuild_statistics
+
+
+class Command(BaseCommand):
+    help = ("Load synthetic registrations for scale testing with COPY in "
+            "parallel worker processes. The same --seed and --chunk-size "
+            "load the same registrations.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('count', type=int,
+                            help="Number of registrations to load")
+        parser.add_argument('--disasters', type=int, default=10,
+                            help="Number of disasters to spread them over")
+        parser.add_argument('--first-disaster-id', type=int, default=1)
+        parser.add_argument('--duplicate-rate', type=float, default=0.05,
+                            help="Share of registrations that repeat the "
+                                 "household, SSN or name of another")
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help="Number of worker processes")
+        parser.add_argument('--chunk-size', type=int,
+                            default=DEFAULT_CHUNK_SIZE,
+                            help="Registrations per COPY and transaction")
+
+    def handle(self, *args, **options):
+        count = options['count']
+        if count < 1:
+            raise CommandError("count must be at least 1")
+        for option in ('disasters', 'workers', 'chunk_size'):
+            if options[option] < 1:
+                raise CommandError(
+                    f"--{option.replace('_', '-')} must be at least 1")
+        if not 0 <= options['duplicate_rate'] <= 1:
+            raise CommandError("--duplicate-rate must be between 0 and 1")
+
+        first_disaster_id = options['first_disaster_id']
+        disaster_ids = list(range(first_disaster_id,
+                                  first_disaster_id + options['disasters']))
+        with transaction.atomic():
+            ensure_partitions(disaster_ids)
+        first_id = reserve_ids(count)
+        chunks = plan_chunks(count, options['chunk_size'], first_id)
+        load = partial(load_chunk, seed=options['seed'],
+                       disaster_ids=disaster_ids,
+                       duplicate_rate=options['duplicate_rate'])
+
+        workers = min(options['workers'], len(chunks))
+        loaded = 0
+        if workers == 1:
+            for chunk in chunks:
+                loaded += load(chunk)
+                self.stdout.write(f"Loaded {loaded} of {count} registrations")
+        else:
+            # Workers are forked and open their own connections
+            connections.close_all()
+            with multiprocessing.Pool(workers) as pool:
+                for chunk_count in pool.imap_unordered(load, chunks):
+                    loaded += chunk_count
+                    self.stdout.write(
+                        f"Loaded {loaded} of {count} registrations")
+
+        self.stdout.write("Rebuilding disaster statistics")
+        with transaction.atomic():
+            rebuild_statistics()
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE registration")
+            cursor.execute("ANALYZE registration_match_key")
+        self.stdout.write(f"Done: loaded {count} registrations with ids "
+                          f"{first_id} to {first_id + count - 1}")
@@ -0,0 +1,410 @@
+"""
+Request metrics in the Prometheus text exposition format.
+
+``MetricsMiddleware`` times every request and records, per view and method,
+its latency, response size, number of database queries, and the time spent
+in authentication, schema validation, database queries, serialization and
+rendering (see ``phase``). A phase is only recorded for requests that went
+through it, and phases can overlap, e.g. authentication runs queries too.
+
+With ``SERVER_TIMING`` on, each response also gets a ``Server-Timing``
+header with its own phases, which browser developer tools show alongside
+the network timings.
+
+Each process keeps its metrics in memory. With ``METRICS_DIR`` set, a
+background thread writes them to ``metrics-<pid>.json`` in that directory
+every ``METRICS_FLUSH_INTERVAL`` seconds, and ``/metrics`` adds up the files
+of every process, so it reports all gunicorn workers whichever one serves
+it. Counters and histograms of exited workers are kept, so totals never go
+down; their gauges are dropped. Without ``METRICS_DIR``, ``/metrics``
+reports only the process that serves it.
+
+The thread-local request state is greenlet-local under gevent.
+"""
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict, namedtuple
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+from dsnap_registration_service.postgresql_pool.pool import pools
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Methods outside these are counted as "other", to bound the label values
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+UNMATCHED_VIEW = 'unmatched'
+SNAPSHOT_PREFIX = 'metrics-'
+# (Server-Timing metric name, phase), in the order requests go through them
+SERVER_TIMING_PHASES = (
+    ('auth', 'authentication'),
+    ('validate', 'validation'),
+    ('db', 'database'),
+    ('serialize', 'serialization'),
+    ('render', 'rendering'),
+)
+
+Metric = namedtuple('Metric', ['name', 'kind', 'documentation', 'labels',
+                               'buckets'])
+
+METRICS = {metric.name: metric for metric in [
+    Metric('dsnap_http_requests_total', COUNTER,
+           "HTTP requests handled", ('view', 'method', 'status'), None),
+    Metric('dsnap_http_request_duration_seconds', HISTOGRAM,
+           "Time to handle HTTP requests", ('view', 'method'),
+           LATENCY_BUCKETS),
+    Metric('dsnap_http_request_phase_seconds', HISTOGRAM,
+           "Time spent per HTTP request in authentication, schema "
+           "validation, database queries, serialization and rendering",
+           ('view', 'method', 'phase'), LATENCY_BUCKETS),
+    Metric('dsnap_http_request_db_queries', HISTOGRAM,
+           "Database queries per HTTP request", ('view', 'method'),
+           QUERY_BUCKETS),
+    Metric('dsnap_http_response_size_bytes', HISTOGRAM,
+           "Size of HTTP response bodies, other than streamed ones",
+           ('view', 'method'), SIZE_BUCKETS),
+    Metric('dsnap_db_pool_connections', GAUGE,
+           "Pooled database connections by state", ('alias', 'state'), None),
+    Metric('dsnap_db_pool_waiting', GAUGE,
+           "Requests waiting for a pooled database connection", ('alias',),
+           None),
+]}
+
+_registry = None
+_registry_lock = threading.Lock()
+_flusher_pid = None
+_flush_lock = threading.Lock()
+_state = threading.local()
+
+
+class Registry:
+    """
+    The counters and histograms of one process
+    """
+    def __init__(self):
+        self.pid = os.getpid()
+        self._lock = threading.Lock()
+        # (name, label values) -> a counter's value, or a histogram's count
+        # per bucket (the last one +Inf) followed by its sum
+        self._values = {}
+
+    def inc(self, name, labels, amount=1):
+        key = (name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name].buckets
+        key = (name, labels)
+        with self._lock:
+            values = self._values.get(key)
+            if values is None:
+                values = self._values[key] = [0] * (len(buckets) + 2)
+            values[bisect_left(buckets, value)] += 1
+            values[-1] += value
+
+    def samples(self):
+        with self._lock:
+            return [[name, list(labels),
+                     list(value) if isinstance(value, list) else value]
+                    for (name, labels), value in self._values.items()]
+
+
+def get_registry():
+    """
+    The registry of the current process; a forked child starts afresh
+    """
+    global _registry
+    with _registry_lock:
+        if _registry is None or _registry.pid != os.getpid():
+            _registry = Registry()
+        return _registry
+
+
+def gauge_samples():
+    totals = defaultdict(int)
+    for (alias, _, _), pool in pools().items():
+        stats = pool.stats()
+        for state in ('open', 'in_use', 'idle'):
+            totals[('dsnap_db_pool_connections', (alias, state))] += \
+                stats[state]
+        totals[('dsnap_db_pool_waiting', (alias,))] += stats['waiting']
+    return [[name, list(labels), value]
+            for (name, labels), value in totals.items()]
+
+
+def snapshot():
+    return {
+        'pid': os.getpid(),
+        'samples': get_registry().samples(),
+        'gauges': gauge_samples(),
+    }
+
+
+def flush():
+    """
+    Write this process's metrics to METRICS_DIR, if it is set
+    """
+    directory = settings.METRICS_DIR
+    if not directory:
+        return
+    path = os.path.join(directory, f'{SNAPSHOT_PREFIX}{os.getpid()}.json')
+    temporary = path + '.tmp'
+    with _flush_lock:
+        with open(temporary, 'w') as f:
+            json.dump(snapshot(), f)
+        # Readers never see a half-written file
+        os.replace(temporary, path)
+
+
+def _flush_periodically():
+    while True:
+        time.sleep(settings.METRICS_FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def start_flusher():
+    """
+    Start writing this process's metrics to METRICS_DIR in the background,
+    unless it already is
+    """
+    global _flusher_pid
+    if _flusher_pid == os.getpid() or not settings.METRICS_DIR:
+        return
+    with _registry_lock:
+        if _flusher_pid == os.getpid():
+            return
+        _flusher_pid = os.getpid()
+    threading.Thread(target=_flush_periodically, daemon=True).start()
+
+
+def is_running(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def read_snapshots():
+    """
+    The snapshots of every process, or of this one without METRICS_DIR
+    """
+    directory = settings.METRICS_DIR
+    if not directory:
+        return [snapshot()]
+    flush()
+    snapshots = []
+    for filename in sorted(os.listdir(directory)):
+        if not (filename.startswith(SNAPSHOT_PREFIX) and
+                filename.endswith('.json')):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as f:
+                snapshots.append(json.load(f))
+        except (OSError, ValueError):
+            # Removed or replaced since it was listed
+            continue
+    return snapshots
+
+
+def merge(snapshots):
+    """
+    {(name, label values): value} summed over `snapshots`, with the gauges
+    of processes that are still running
+    """
+    merged = {}
+    for data in snapshots:
+        samples = data['samples']
+        if is_running(data['pid']):
+            samples = samples + data['gauges']
+        for name, labels, value in samples:
+            if name not in METRICS:
+                continue
+            key = (name, tuple(labels))
+            if isinstance(value, list):
+                total = merged.setdefault(key, [0] * len(value))
+                for index, item in enumerate(value):
+                    total[index] += item
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"') \
+        .replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    pairs = ','.join(f'{name}="{escape(value)}"'
+                     for name, value in zip(names, values))
+    return f'{{{pairs}}}' if pairs else ''
+
+
+def format_number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def render(merged):
+    """
+    `merged` samples in the Prometheus text format
+    """
+    by_name = defaultdict(list)
+    for (name, labels), value in sorted(merged.items()):
+        by_name[name].append((labels, value))
+    lines = []
+    for name, metric in METRICS.items():
+        if name not in by_name:
+            continue
+        lines.append(f'# HELP {name} {metric.documentation}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for labels, value in by_name[name]:
+            if metric.kind != HISTOGRAM:
+                lines.append(f'{name}{format_labels(metric.labels, labels)} '
+                             f'{format_number(value)}')
+                continue
+            cumulative = 0
+            bounds = [format_number(bound) for bound in metric.buckets]
+            for bound, count in zip(bounds + ['+Inf'], value[:-1]):
+                cumulative += count
+                bucket_labels = format_labels(metric.labels + ('le',),
+                                              labels + (bound,))
+                lines.append(f'{name}_bucket{bucket_labels} {cumulative}')
+            label_text = format_labels(metric.labels, labels)
+            lines.append(f'{name}_sum{label_text} {format_number(value[-1])}')
+            lines.append(f'{name}_count{label_text} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+def exposition():
+    """
+    The metrics of every process, in the Prometheus text format
+    """
+    return render(merge(read_snapshots()))
+
+
+class RequestState:
+    def __init__(self):
+        self.view = UNMATCHED_VIEW
+        self.queries = 0
+        # Seconds spent in each phase the request went through
+        self.phases = defaultdict(float)
+        # Phases being timed, so that nested blocks are not counted twice
+        self.active = set()
+
+
+@contextmanager
+def phase(name):
+    """
+    Add the time spent in the block to the current request's `name` phase
+    """
+    current = getattr(_state, 'request', None)
+    if current is None or name in current.active:
+        yield
+        return
+    current.active.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        current.phases[name] += time.perf_counter() - start
+        current.active.discard(name)
+
+
+def _time_query(execute, sql, params, many, context):
+    current = _state.request
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        current.queries += 1
+        current.phases['database'] += time.perf_counter() - start
+
+
+def server_timing(current, duration):
+    """
+    The Server-Timing header value for a request's phases, in milliseconds
+    """
+    entries = []
+    for metric, name in SERVER_TIMING_PHASES:
+        entry = f'{metric};dur={current.phases.get(name, 0) * 1000:.1f}'
+        if name == 'database':
+            entry += f';desc="{current.queries} queries"'
+        entries.append(entry)
+    entries.append(f'total;dur={duration * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def view_name(view_func):
+    view = getattr(view_func, 'view_class', view_func)
+    return getattr(view, '__name__', UNMATCHED_VIEW)
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        start_flusher()
+        current = _state.request = RequestState()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(
+                        connection.execute_wrapper(_time_query))
+                response = self.get_response(request)
+        finally:
+            _state.request = None
+        duration = time.perf_counter() - start
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(current, duration)
+        self.record(request, response, current, duration)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        _state.request.view = view_name(view_func)
+
+    def process_template_response(self, request, response):
+        # Rendered here rather than by the handler, so it can be timed;
+        # rendering a response again does nothing
+        with phase('rendering'):
+            response.render()
+        return response
+
+    def record(self, request, response, current, duration):
+        method = request.method if request.method in METHODS else 'other'
+        labels = (current.view, method)
+        registry = get_registry()
+        registry.inc('dsnap_http_requests_total',
+                     labels + (str(response.status_code),))
+        registry.observe('dsnap_http_request_duration_seconds', labels,
+                         duration)
+        for name, seconds in current.phases.items():
+            registry.observe('dsnap_http_request_phase_seconds',
+                             labels + (name,), seconds)
+        registry.observe('dsnap_http_request_db_queries', labels,
+                         current.queries)
+        if not response.streaming:
+            registry.observe('dsnap_http_response_size_bytes', labels,
+                             len(response.content))
@@ -0,0 +1,63 @@
+# Generated by Django 2.2.8 on 2026-10-18 13:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0006_auto_20190419_1645'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='registrant_dob',
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='registrant_last_name',
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='registrant_ssn',
+            field=models.TextField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='registration',
+            name='state_id',
+            field=models.TextField(editable=False, null=True),
+        ),
+        # Backfill before building the indexes; keep in sync with
+        # Registration.sync_search_fields. UPPER() differs from Python's
+        # upper() for some non-ASCII text, which 0015 folds again.
+        migrations.RunSQL(
+            """
+            UPDATE registration SET
+                state_id = UPPER(latest_data ->> 'state_id'),
+                registrant_ssn = latest_data #>> '{household,0,ssn}',
+                registrant_dob = latest_data #>> '{household,0,dob}',
+                registrant_last_name =
+                    UPPER(latest_data #>> '{household,0,last_name}')
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['state_id'], name='registration_state_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['registrant_ssn'], name='registration_reg_ssn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['registrant_dob'], name='registration_reg_dob_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['registrant_last_name'], name='registration_reg_last_name_idx'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 2.2.8 on 2026-10-18 13:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0007_registration_search_fields'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchKey',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disaster_id', models.IntegerField()),
+                ('kind', models.TextField()),
+                ('value', models.TextField()),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_keys', to='dsnap_registration.Registration')),
+            ],
+            options={
+                'db_table': 'registration_match_key',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='matchkey',
+            index=models.Index(fields=['disaster_id', 'kind', 'value'], name='match_key_lookup_idx'),
+        ),
+    ]
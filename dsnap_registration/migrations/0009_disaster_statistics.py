@@ -0,0 +1,78 @@
+# Generated by Django 2.2.8 on 2026-10-18 13:56
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0008_registration_match_keys'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DisasterStatistic',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('disaster_id', models.IntegerField()),
+                ('county', models.TextField()),
+                ('preferred_language', models.TextField()),
+                ('rules_service_approved', models.TextField()),
+                ('user_approved', models.TextField()),
+                ('count', models.BigIntegerField(default=0)),
+            ],
+            options={
+                'db_table': 'disaster_statistic',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='disasterstatistic',
+            constraint=models.UniqueConstraint(fields=('disaster_id', 'county', 'preferred_language', 'rules_service_approved', 'user_approved'), name='disaster_statistic_key'),
+        ),
+        # Count the existing registrations; keep in sync with
+        # statistics.KEY_SQL
+        migrations.RunSQL(
+            """
+            INSERT INTO disaster_statistic (disaster_id, county,
+                preferred_language, rules_service_approved, user_approved,
+                count)
+            SELECT disaster_id, county, preferred_language,
+                rules_service_approved, user_approved, count(*)
+            FROM (
+                SELECT
+                    CASE WHEN jsonb_typeof(latest_data -> 'disaster_id')
+                              = 'number'
+                         THEN CASE WHEN mod((latest_data ->> 'disaster_id')
+                                            ::numeric, 1) = 0
+                                    AND (latest_data ->> 'disaster_id')
+                                        ::numeric
+                                        BETWEEN -2147483648 AND 2147483647
+                                   THEN (latest_data ->> 'disaster_id')
+                                        ::numeric::integer
+                              END
+                    END AS disaster_id,
+                    CASE WHEN jsonb_typeof(latest_data -> 'county')
+                              = 'string'
+                         THEN latest_data ->> 'county' ELSE ''
+                    END AS county,
+                    CASE WHEN jsonb_typeof(latest_data -> 'preferred_language')
+                              = 'string'
+                         THEN latest_data ->> 'preferred_language' ELSE ''
+                    END AS preferred_language,
+                    CASE rules_service_approved
+                         WHEN true THEN 'true' WHEN false THEN 'false'
+                         ELSE 'null'
+                    END AS rules_service_approved,
+                    CASE user_approved
+                         WHEN true THEN 'true' WHEN false THEN 'false'
+                         ELSE 'null'
+                    END AS user_approved
+                FROM registration
+            ) AS registration_keys
+            WHERE disaster_id IS NOT NULL
+            GROUP BY disaster_id, county, preferred_language,
+                rules_service_approved, user_approved
+            """,
+            migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,138 @@
+# Generated by Django 2.2.8 on 2026-10-18 14:04
+
+import re
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Partitioned tables need primary keys, indexes and foreign keys declared on
+# the parent, which arrived in Postgres 11
+MIN_PARTITIONING_VERSION = 110000
+
+
+def partition_name(disaster_id):
+    # Keep in sync with partitions.partition_name
+    return f'registration_disaster_{disaster_id}'
+
+
+def table_constraints(cursor, table):
+    """
+    The CREATE INDEX statements and foreign key definitions of `table`,
+    other than its primary key
+    """
+    cursor.execute("""
+        SELECT pg_get_indexdef(indexrelid) FROM pg_index
+        WHERE indrelid = %s::regclass AND NOT indisprimary
+    """, [table])
+    indexes = [row[0] for row in cursor.fetchall()]
+    cursor.execute("""
+        SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint
+        WHERE conrelid = %s::regclass AND contype = 'f'
+    """, [table])
+    return indexes, cursor.fetchall()
+
+
+def rebuild_registration_table(cursor, quote_name, partitioned):
+    """
+    Replace the registration table with a copy of itself that is (or is no
+    longer) partitioned by disaster_id, keeping its data, id sequence,
+    indexes and foreign keys
+    """
+    cursor.execute("ALTER TABLE registration RENAME TO registration_old")
+    indexes, foreign_keys = table_constraints(cursor, 'registration_old')
+    for definition in indexes:
+        name = re.match(r'CREATE (?:UNIQUE )?INDEX (\S+)', definition).group(1)
+        cursor.execute(f"DROP INDEX {name}")
+
+    partition_by = ' PARTITION BY LIST (disaster_id)' if partitioned else ''
+    cursor.execute(f"""
+        CREATE TABLE registration (LIKE registration_old
+            INCLUDING DEFAULTS INCLUDING CONSTRAINTS){partition_by}
+    """)
+    cursor.execute("SELECT pg_get_serial_sequence('registration_old', 'id')")
+    sequence = cursor.fetchone()[0]
+    cursor.execute(f"ALTER SEQUENCE {sequence} OWNED BY registration.id")
+
+    if partitioned:
+        # Unique constraints on a partitioned table must include the
+        # partition key, so each partition has its own primary key on id
+        cursor.execute("CREATE TABLE registration_default "
+                       "PARTITION OF registration DEFAULT")
+        cursor.execute("ALTER TABLE registration_default ADD PRIMARY KEY (id)")
+        cursor.execute("SELECT DISTINCT disaster_id FROM registration_old "
+                       "WHERE disaster_id IS NOT NULL")
+        for disaster_id, in cursor.fetchall():
+            table = quote_name(partition_name(disaster_id))
+            cursor.execute(f"CREATE TABLE {table} PARTITION OF registration "
+                           f"FOR VALUES IN (%s)", [disaster_id])
+            cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+    else:
+        cursor.execute("ALTER TABLE registration ADD PRIMARY KEY (id)")
+
+    cursor.execute("INSERT INTO registration SELECT * FROM registration_old")
+    cursor.execute("DROP TABLE registration_old")
+    for definition in indexes:
+        cursor.execute(re.sub(r' ON (?:ONLY )?(?:\S+\.)?registration_old ',
+                              ' ON registration ', definition))
+    for name, definition in foreign_keys:
+        cursor.execute(f"ALTER TABLE registration "
+                       f"ADD CONSTRAINT {quote_name(name)} {definition}")
+
+
+def partition_registration(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.pg_version < MIN_PARTITIONING_VERSION:
+        return
+    with connection.cursor() as cursor:
+        rebuild_registration_table(cursor, connection.ops.quote_name,
+                                   partitioned=True)
+
+
+def unpartition_registration(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.pg_version < MIN_PARTITIONING_VERSION:
+        return
+    with connection.cursor() as cursor:
+        rebuild_registration_table(cursor, connection.ops.quote_name,
+                                   partitioned=False)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0009_disaster_statistics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registration',
+            name='disaster_id',
+            field=models.IntegerField(editable=False, null=True),
+        ),
+        # Backfill; keep in sync with duplicates.parse_disaster_id
+        migrations.RunSQL(
+            """
+            UPDATE registration SET disaster_id =
+                CASE WHEN jsonb_typeof(latest_data -> 'disaster_id') = 'number'
+                     THEN CASE WHEN mod((latest_data ->> 'disaster_id')
+                                        ::numeric, 1) = 0
+                                AND (latest_data ->> 'disaster_id')::numeric
+                                    BETWEEN -2147483648 AND 2147483647
+                               THEN (latest_data ->> 'disaster_id')
+                                    ::numeric::integer
+                          END
+                END
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='matchkey',
+            name='registration',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='match_keys', to='dsnap_registration.Registration'),
+        ),
+        migrations.AddIndex(
+            model_name='registration',
+            index=models.Index(fields=['disaster_id'], name='registration_disaster_id_idx'),
+        ),
+        migrations.RunPython(partition_registration, unpartition_registration),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 2.2.8 on 2026-10-18 14:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('dsnap_registration', '0010_partition_registration_by_disaster'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedRegistration',
+            fields=[
+                ('id', models.IntegerField(primary_key=True, serialize=False)),
+                ('disaster_id', models.IntegerField()),
+                ('county', models.TextField()),
+                ('preferred_language', models.TextField()),
+                ('packed_original_data', models.BinaryField()),
+                ('packed_latest_data_delta', models.BinaryField(null=True)),
+                ('rules_service_approved', models.BooleanField(null=True)),
+                ('user_approved', models.BooleanField(null=True)),
+                ('created_at', models.DateTimeField()),
+                ('modified_at', models.DateTimeField()),
+                ('approved_at', models.DateTimeField(null=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('approved_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='archived_registrations', to=settings.AUTH_USER_MODEL)),
+                ('modified_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'db_table': 'archived_registration',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='archivedregistration',
+            index=models.Index(fields=['disaster_id'], name='archived_disaster_id_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 2.2.8 on 2026-10-18 14:52
+
+from django.conf import settings
+import django.contrib.postgres.fields.jsonb
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('dsnap_registration', '0011_archived_registration'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.IntegerField()),
+                ('delta', django.contrib.postgres.fields.jsonb.JSONField()),
+                ('checkpoint', django.contrib.postgres.fields.jsonb.JSONField(null=True)),
+                ('modified_at', models.DateTimeField()),
+                ('modified_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('registration', models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='dsnap_registration.Registration')),
+            ],
+            options={
+                'db_table': 'registration_revision',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='registrationrevision',
+            constraint=models.UniqueConstraint(fields=('registration', 'number'), name='registration_revision_number'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0012_registration_revision'),
+    ]
+
+    operations = [
+        # Applies a JSON Merge Patch (RFC 7396) to a jsonb document: members
+        # of an object patch replace or merge into the target's, null
+        # members remove them, and anything else replaces the target whole
+        migrations.RunSQL(
+            """
+            CREATE FUNCTION jsonb_merge_patch(target jsonb, patch jsonb)
+            RETURNS jsonb LANGUAGE plpgsql IMMUTABLE AS $$
+            DECLARE
+                member record;
+            BEGIN
+                IF jsonb_typeof(patch) IS DISTINCT FROM 'object' THEN
+                    RETURN patch;
+                END IF;
+                IF jsonb_typeof(target) IS DISTINCT FROM 'object' THEN
+                    target := '{}';
+                END IF;
+                FOR member IN SELECT key, value FROM jsonb_each(patch) LOOP
+                    IF jsonb_typeof(member.value) = 'null' THEN
+                        target := target - member.key;
+                    ELSE
+                        target := jsonb_set(
+                            target, ARRAY[member.key],
+                            jsonb_merge_patch(target -> member.key,
+                                              member.value));
+                    END IF;
+                END LOOP;
+                RETURN target;
+            END
+            $$
+            """,
+            "DROP FUNCTION jsonb_merge_patch(jsonb, jsonb)",
+        ),
+    ]
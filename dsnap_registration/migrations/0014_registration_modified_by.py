@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0013_jsonb_merge_patch'),
+    ]
+
+    operations = [
+        # Catches the migrations up with the model's related_name, which
+        # has no effect on the table; a plain AlterField would drop and
+        # re-validate the foreign key on every partition
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='registration',
+                    name='modified_by',
+                    field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to=settings.AUTH_USER_MODEL),
+                ),
+            ],
+        ),
+    ]
@@ -0,0 +1,43 @@
+from django.db import migrations
+
+# 0007 upper-cased the case-insensitive search fields with Postgres' UPPER(),
+# which maps each character to one character. Python's str.upper(), which
+# Registration.sync_search_fields and the searches use, also expands some
+# (e.g. 'ß' to 'SS'), so registrations backfilled by 0007 with such names
+# could not be found. Both only differ for non-ASCII text.
+REFOLD_SELECT_SQL = r"""
+    SELECT id, latest_data ->> 'state_id',
+           latest_data #>> '{household,0,last_name}'
+    FROM registration
+    WHERE latest_data ->> 'state_id' ~ '[^\x01-\x7f]'
+       OR latest_data #>> '{household,0,last_name}' ~ '[^\x01-\x7f]'
+"""
+REFOLD_UPDATE_SQL = """
+    UPDATE registration SET state_id = %s, registrant_last_name = %s
+    WHERE id = %s
+"""
+
+
+def fold_case(value):
+    # Keep in sync with models.fold_case
+    return value.upper() if isinstance(value, str) else value
+
+
+def refold_search_fields(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(REFOLD_SELECT_SQL)
+        rows = cursor.fetchall()
+        cursor.executemany(REFOLD_UPDATE_SQL, [
+            (fold_case(state_id), fold_case(last_name), registration_id)
+            for registration_id, state_id, last_name in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0014_registration_modified_by'),
+    ]
+
+    operations = [
+        migrations.RunPython(refold_search_fields, migrations.RunPython.noop),
+    ]
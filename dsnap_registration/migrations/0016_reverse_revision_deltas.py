@@ -0,0 +1,103 @@
+import json
+import zlib
+
+from django.db import migrations
+
+from dsnap_registration.deltas import apply_patch, make_patch
+
+# Revisions were stored as the JSON Patch each one made, starting from
+# original_data, with a copy of the whole document every so often. They are
+# now stored as the JSON Patch undoing each one, starting from latest_data,
+# which needs no copies. Archived registrations keep their revisions, so
+# their documents come from the archive.
+DOCUMENTS_SQL = """
+    SELECT id, original_data, latest_data FROM registration
+    WHERE id IN (SELECT registration_id FROM registration_revision)
+"""
+ARCHIVED_DOCUMENTS_SQL = """
+    SELECT id, packed_original_data, packed_latest_data_delta
+    FROM archived_registration
+    WHERE id IN (SELECT registration_id FROM registration_revision)
+"""
+REVISIONS_SQL = """
+    SELECT id, registration_id, delta FROM registration_revision
+    ORDER BY registration_id, number
+"""
+UPDATE_SQL = "UPDATE registration_revision SET delta = %s WHERE id = %s"
+
+
+def unpack(packed):
+    # Keep in sync with archive.unpack
+    return json.loads(zlib.decompress(packed).decode())
+
+
+def documents(cursor):
+    """
+    {registration id: (original_data, latest_data)} for the registrations,
+    archived or not, that have revisions
+    """
+    cursor.execute(DOCUMENTS_SQL)
+    documents = {registration_id: (original_data, latest_data)
+                 for registration_id, original_data, latest_data
+                 in cursor.fetchall()}
+    cursor.execute(ARCHIVED_DOCUMENTS_SQL)
+    for registration_id, packed_original, packed_delta in cursor.fetchall():
+        original_data = unpack(packed_original)
+        latest_data = original_data if packed_delta is None else \
+            apply_patch(original_data, unpack(packed_delta))
+        documents[registration_id] = (original_data, latest_data)
+    return documents
+
+
+def revisions(cursor):
+    """
+    {registration id: [(revision id, delta)]}, oldest revision first
+    """
+    cursor.execute(REVISIONS_SQL)
+    revisions = {}
+    for revision_id, registration_id, delta in cursor.fetchall():
+        revisions.setdefault(registration_id, []).append((revision_id, delta))
+    return revisions
+
+
+def reverse_deltas(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        docs = documents(cursor)
+        updates = []
+        for registration_id, history in revisions(cursor).items():
+            data = docs[registration_id][0]
+            for revision_id, delta in history:
+                next_data = apply_patch(data, delta)
+                updates.append((json.dumps(make_patch(next_data, data)),
+                                revision_id))
+                data = next_data
+        cursor.executemany(UPDATE_SQL, updates)
+
+
+def forward_deltas(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        docs = documents(cursor)
+        updates = []
+        for registration_id, history in revisions(cursor).items():
+            data = docs[registration_id][1]
+            for revision_id, delta in reversed(history):
+                previous_data = apply_patch(data, delta)
+                updates.append((json.dumps(make_patch(previous_data, data)),
+                                revision_id))
+                data = previous_data
+        cursor.executemany(UPDATE_SQL, updates)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dsnap_registration', '0015_fold_search_fields_like_python'),
+    ]
+
+    operations = [
+        migrations.RunPython(reverse_deltas, forward_deltas),
+        migrations.RemoveField(
+            model_name='registrationrevision',
+            name='checkpoint',
+        ),
+    ]
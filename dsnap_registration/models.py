@@ -1,10 +1,152 @@
+import json
+from collections import Counter
+
 from django.contrib.postgres.fields import JSONField
-from django.db import models
+from django.db import connections, models, transaction
+from django.utils import timezone
+
+from .archive import pack, unpack
+from .deltas import apply_patch, make_patch
+from .duplicates import match_keys, parse_disaster_id
+from .partitions import ensure_partitions
+from .statistics import adjust_statistics, statistic_key
+
+# Search keys copied out of latest_data into their own indexed columns. Keys
+# that are searched case-insensitively are stored upper-cased. disaster_id is
+# also the partition key of the registration table (see partitions.py).
+SEARCH_FIELDS = (
+    'disaster_id',
+    'state_id',
+    'registrant_ssn',
+    'registrant_dob',
+    'registrant_last_name',
+)
+
+
+# Fields that decide which DisasterStatistic a registration is counted under
+STATISTIC_FIELDS = ('latest_data', 'rules_service_approved', 'user_approved')
+
+
+# Merges a JSON Merge Patch into a registration's latest_data with
+# jsonb_merge_patch (see migration 0013), returning the latest_data it had
+# before and the updated row
+MERGE_PATCH_SQL = """
+    WITH old AS (
+        SELECT id, latest_data FROM registration
+        WHERE id = %s
+        FOR UPDATE
+    )
+    UPDATE registration
+    SET latest_data = jsonb_merge_patch(old.latest_data, %s::jsonb),
+        modified_by_id = %s, modified_at = %s
+    FROM old
+    WHERE registration.id = old.id
+    RETURNING old.latest_data, {columns}
+"""
+
+
+def fold_case(value):
+    return value.upper() if isinstance(value, str) else value
+
+
+def sync_search_fields(registrations):
+    """
+    Sync the search fields of `registrations`, which may be any iterable
+    (a generator included), and return them as a list
+    """
+    synced = []
+    for registration in registrations:
+        registration.sync_search_fields()
+        synced.append(registration)
+    return synced
+
+
+class RegistrationQuerySet(models.QuerySet):
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = sync_search_fields(objs)
+        with transaction.atomic(using=self.db, savepoint=False):
+            ensure_partitions({obj.disaster_id for obj in objs},
+                              using=self.db)
+            created = super().bulk_create(objs, *args, **kwargs)
+            MatchKey.objects.using(self.db).bulk_create(
+                (key for obj in created for key in obj.build_match_keys()),
+                batch_size=kwargs.get('batch_size'))
+            adjust_statistics(Counter(obj.statistic_key() for obj in created),
+                              using=self.db)
+        for obj in created:
+            obj._stored_statistic_key = obj.statistic_key()
+        return created
+
+    def merge_patch(self, pk, patch, modified_by=None, validate=None):
+        """
+        Apply a JSON Merge Patch (RFC 7396) to a registration's latest_data
+        with one UPDATE, which merges it in the database, and keep the
+        search fields, match keys, statistics and revisions in step.
+        `validate` is called with the merged latest_data before anything
+        else is written; whatever it raises rolls the UPDATE back. Returns
+        the updated Registration, or None if there is none with `pk`.
+        """
+        connection = connections[self.db]
+        fields = self.model._meta.concrete_fields
+        columns = ', '.join(
+            f'registration.{connection.ops.quote_name(field.column)}'
+            for field in fields)
+        with transaction.atomic(using=self.db, savepoint=False):
+            with connection.cursor() as cursor:
+                cursor.execute(MERGE_PATCH_SQL.format(columns=columns), [
+                    pk, json.dumps(patch),
+                    modified_by.pk if modified_by else None, timezone.now()])
+                row = cursor.fetchone()
+            if row is None:
+                return None
+            previous_data, *values = row
+            registration = self.model.from_db(
+                self.db, [field.attname for field in fields], values)
+            if validate is not None:
+                validate(registration.latest_data)
+
+            stored_search_fields = [getattr(registration, name)
+                                    for name in SEARCH_FIELDS]
+            registration.sync_search_fields()
+            search_fields = {name: getattr(registration, name)
+                             for name in SEARCH_FIELDS}
+            if list(search_fields.values()) != stored_search_fields:
+                ensure_partitions([registration.disaster_id], using=self.db)
+                self.filter(pk=pk, disaster_id=stored_search_fields[0]) \
+                    .update(**search_fields)
+            if (search_fields['disaster_id'] != stored_search_fields[0] or
+                    match_keys(previous_data) !=
+                    match_keys(registration.latest_data)):
+                registration.sync_match_keys()
+
+            new_key = registration.statistic_key()
+            deltas = Counter()
+            deltas[statistic_key(previous_data,
+                                 registration.rules_service_approved,
+                                 registration.user_approved)] -= 1
+            deltas[new_key] += 1
+            adjust_statistics(deltas, using=self.db)
+            registration.record_revision(previous_data, using=self.db)
+        return registration
 
 
 class Registration(models.Model):
     class Meta:
         db_table = "registration"
+        indexes = [
+            models.Index(fields=['disaster_id'],
+                         name='registration_disaster_id_idx'),
+            models.Index(fields=['state_id'],
+                         name='registration_state_id_idx'),
+            models.Index(fields=['registrant_ssn'],
+                         name='registration_reg_ssn_idx'),
+            models.Index(fields=['registrant_dob'],
+                         name='registration_reg_dob_idx'),
+            models.Index(fields=['registrant_last_name'],
+                         name='registration_reg_last_name_idx'),
+        ]
+    objects = RegistrationQuerySet.as_manager()
+
     original_data = JSONField(editable=False)
     latest_data = JSONField()
     rules_service_approved = models.BooleanField(null=True)
@@ -20,3 +162,337 @@ class Registration(models.Model):
                                     related_name='registrations',
                                     on_delete=models.PROTECT)
     approved_at = models.DateTimeField(null=True)
+    disaster_id = models.IntegerField(null=True, editable=False)
+    state_id = models.TextField(null=True, editable=False)
+    registrant_ssn = models.TextField(null=True, editable=False)
+    registrant_dob = models.TextField(null=True, editable=False)
+    registrant_last_name = models.TextField(null=True, editable=False)
+
+    def sync_search_fields(self):
+        """
+        Copy the search keys out of latest_data. The registrant is always the
+        1st member of the household.
+        """
+        data = self.latest_data if isinstance(self.latest_data, dict) else {}
+        registrant = (data.get('household') or [{}])[0]
+        self.disaster_id = parse_disaster_id(data)
+        self.state_id = fold_case(data.get('state_id'))
+        self.registrant_ssn = registrant.get('ssn')
+        self.registrant_dob = registrant.get('dob')
+        self.registrant_last_name = fold_case(registrant.get('last_name'))
+
+    def build_match_keys(self):
+        """
+        Unsaved MatchKeys for the registration's current latest_data
+        """
+        disaster = parse_disaster_id(self.latest_data)
+        if disaster is None:
+            return []
+        return [MatchKey(registration=self, disaster_id=disaster, kind=kind,
+                         value=value)
+                for kind, value in sorted(match_keys(self.latest_data))]
+
+    def sync_match_keys(self, adding=False):
+        if not adding:
+            self.match_keys.all().delete()
+        MatchKey.objects.bulk_create(self.build_match_keys())
+
+    def find_duplicates(self):
+        """
+        Return {registration id: sorted kinds of match} for the other
+        registrations in the same disaster sharing a match key with this one
+        """
+        keys = self.match_keys.values_list('disaster_id', 'kind', 'value')
+        matches = models.Q()
+        for disaster, kind, value in keys:
+            matches |= models.Q(disaster_id=disaster, kind=kind, value=value)
+        if not matches:
+            return {}
+        candidates = {}
+        rows = MatchKey.objects.filter(matches).exclude(
+            registration_id=self.pk).values_list('registration_id', 'kind')
+        for registration_id, kind in rows:
+            candidates.setdefault(registration_id, set()).add(kind)
+        return {registration_id: sorted(kinds)
+                for registration_id, kinds in sorted(candidates.items())}
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the counter the registration is stored under, to move it
+        # out of it when it is saved or deleted
+        if not instance.get_deferred_fields() & set(STATISTIC_FIELDS):
+            instance._stored_statistic_key = instance.statistic_key()
+        # And the data it had, to record what a save changes in it. Saves
+        # replace latest_data rather than change it in place.
+        if 'latest_data' not in instance.get_deferred_fields():
+            instance._stored_latest_data = instance.latest_data
+        return instance
+
+    def statistic_key(self):
+        return statistic_key(self.latest_data, self.rules_service_approved,
+                             self.user_approved)
+
+    def stored_statistic_key(self, using=None):
+        """
+        The counter the registration is currently stored under. Only exact
+        if the row was locked when it was loaded (or is locked now, when it
+        has to be read again).
+        """
+        if hasattr(self, '_stored_statistic_key'):
+            return self._stored_statistic_key
+        stored = Registration.objects.using(using).select_for_update() \
+            .filter(pk=self.pk).values_list(*STATISTIC_FIELDS).first()
+        return statistic_key(*stored) if stored else None
+
+    def stored_latest_data(self, using=None):
+        """
+        The latest_data currently stored, with the same caveat as
+        stored_statistic_key
+        """
+        if hasattr(self, '_stored_latest_data'):
+            return self._stored_latest_data
+        return Registration.objects.using(using).select_for_update() \
+            .filter(pk=self.pk).values_list('latest_data', flat=True).first()
+
+    def record_revision(self, previous_data, using=None):
+        """
+        Save a RegistrationRevision with the JSON Patch that takes the
+        current latest_data back to `previous_data`, unless nothing changed
+        """
+        delta = make_patch(self.latest_data, previous_data)
+        if not delta:
+            return None
+        revisions = RegistrationRevision.objects.using(using)
+        last = revisions.filter(registration_id=self.pk).order_by(
+            '-number').values_list('number', flat=True).first()
+        return revisions.create(
+            registration_id=self.pk, number=(last or 0) + 1, delta=delta,
+            modified_by_id=self.modified_by_id, modified_at=self.modified_at)
+
+    def revision_history(self, since=1):
+        """
+        The registration's revisions numbered `since` and later, newest
+        first, as (revision, data before it, data after it). They are
+        undone one at a time from the stored latest_data, which is locked
+        while the revisions are read so no update comes in between.
+        """
+        with transaction.atomic():
+            data = self.stored_latest_data()
+            if data is None:
+                # Archived, so there are no updates to race with
+                data = self.latest_data
+            revisions = list(RegistrationRevision.objects.filter(
+                registration_id=self.pk, number__gte=since).select_related(
+                'modified_by').order_by('-number'))
+        history = []
+        for revision in revisions:
+            previous_data = apply_patch(data, revision.delta)
+            history.append((revision, previous_data, data))
+            data = previous_data
+        return history
+
+    def save(self, *args, **kwargs):
+        self.sync_search_fields()
+        adding = self._state.adding
+        using = kwargs.get('using')
+        update_fields = kwargs.get('update_fields')
+        data_changed = update_fields is None or 'latest_data' in update_fields
+        with transaction.atomic(using=using, savepoint=False):
+            old_key = None if adding else self.stored_statistic_key(using)
+            previous_data = None
+            if data_changed and not adding:
+                previous_data = self.stored_latest_data(using)
+                # Saving the document as it was leaves its match keys and
+                # history alone
+                data_changed = previous_data != self.latest_data
+            ensure_partitions([self.disaster_id],
+                              using=using or self._state.db or 'default')
+            super().save(*args, **kwargs)
+            if data_changed:
+                self.sync_match_keys(adding=adding)
+                if previous_data is not None:
+                    self.record_revision(previous_data, using=self._state.db)
+            new_key = self.statistic_key()
+            deltas = Counter()
+            deltas[old_key] -= 1
+            deltas[new_key] += 1
+            adjust_statistics(deltas, using=self._state.db)
+        self._stored_statistic_key = new_key
+        if data_changed:
+            self._stored_latest_data = self.latest_data
+
+    def delete(self, *args, **kwargs):
+        using = kwargs.get('using')
+        with transaction.atomic(using=using, savepoint=False):
+            old_key = self.stored_statistic_key(using)
+            deleted = super().delete(*args, **kwargs)
+            adjust_statistics(Counter({old_key: -1}), using=self._state.db)
+        return deleted
+
+
+class MatchKey(models.Model):
+    """
+    A normalized key that duplicate applications would share; see
+    duplicates.py
+    """
+    class Meta:
+        db_table = "registration_match_key"
+        indexes = [
+            models.Index(fields=['disaster_id', 'kind', 'value'],
+                         name='match_key_lookup_idx'),
+        ]
+
+    # The partitioned registration table has no table-wide primary key for a
+    # foreign key constraint to reference; deletes still cascade in the ORM
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE,
+                                     related_name='match_keys',
+                                     db_constraint=False)
+    disaster_id = models.IntegerField()
+    kind = models.TextField()
+    value = models.TextField()
+
+
+class RegistrationRevision(models.Model):
+    """
+    One change to a registration's latest_data, stored as the JSON Patch
+    (see deltas.py) that undoes it, so only the current latest_data is kept
+    whole and older versions are rebuilt backwards from it; revision 0 is
+    the registration's original_data. Revisions are numbered from 1 for
+    each registration.
+    """
+    class Meta:
+        db_table = "registration_revision"
+        constraints = [
+            models.UniqueConstraint(fields=['registration', 'number'],
+                                    name='registration_revision_number'),
+        ]
+
+    # As with MatchKey, there is no foreign key constraint. Revisions are
+    # kept when their registration is archived, so they still apply to it.
+    # The unique constraint's index serves lookups by registration
+    registration = models.ForeignKey(Registration, on_delete=models.CASCADE,
+                                     related_name='revisions',
+                                     db_constraint=False, db_index=False)
+    number = models.IntegerField()
+    delta = JSONField()
+    modified_by = models.ForeignKey('auth.User', null=True,
+                                    related_name='+',
+                                    on_delete=models.PROTECT)
+    modified_at = models.DateTimeField()
+
+
+class DisasterStatistic(models.Model):
+    """
+    The number of registrations with one combination of disaster_id, county,
+    preferred_language and approval states; see statistics.py
+    """
+    class Meta:
+        db_table = "disaster_statistic"
+        constraints = [
+            models.UniqueConstraint(
+                fields=['disaster_id', 'county', 'preferred_language',
+                        'rules_service_approved', 'user_approved'],
+                name='disaster_statistic_key'),
+        ]
+
+    disaster_id = models.IntegerField()
+    county = models.TextField()
+    preferred_language = models.TextField()
+    rules_service_approved = models.TextField()
+    user_approved = models.TextField()
+    count = models.BigIntegerField(default=0)
+
+
+class ArchivedRegistration(models.Model):
+    """
+    A registration of a closed disaster, moved out of the registration table
+    by ``archive_disaster``; see archive.py. original_data is stored once
+    and latest_data as a JSON Patch against it, both zlib-compressed.
+    """
+    class Meta:
+        db_table = "archived_registration"
+        indexes = [
+            models.Index(fields=['disaster_id'],
+                         name='archived_disaster_id_idx'),
+        ]
+
+    # The id the registration had in the registration table
+    id = models.IntegerField(primary_key=True)
+    disaster_id = models.IntegerField()
+    # The registration's statistic key (see statistics.py), so the counters
+    # can be rebuilt without unpacking the data
+    county = models.TextField()
+    preferred_language = models.TextField()
+    packed_original_data = models.BinaryField()
+    # Null when latest_data is the same as original_data
+    packed_latest_data_delta = models.BinaryField(null=True)
+    rules_service_approved = models.BooleanField(null=True)
+    user_approved = models.BooleanField(null=True)
+    created_at = models.DateTimeField()
+    modified_by = models.ForeignKey('auth.User', null=True,
+                                    related_name='+',
+                                    on_delete=models.PROTECT)
+    modified_at = models.DateTimeField()
+    approved_by = models.ForeignKey('auth.User', null=True,
+                                    related_name='archived_registrations',
+                                    on_delete=models.PROTECT)
+    approved_at = models.DateTimeField(null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    @classmethod
+    def from_registration(cls, registration):
+        """
+        An unsaved ArchivedRegistration holding all of `registration`
+        """
+        key = registration.statistic_key()
+        delta = make_patch(registration.original_data,
+                           registration.latest_data)
+        return cls(
+            id=registration.pk,
+            disaster_id=registration.disaster_id,
+            county=key[1] if key else '',
+            preferred_language=key[2] if key else '',
+            packed_original_data=pack(registration.original_data),
+            packed_latest_data_delta=pack(delta) if delta else None,
+            rules_service_approved=registration.rules_service_approved,
+            user_approved=registration.user_approved,
+            created_at=registration.created_at,
+            modified_by_id=registration.modified_by_id,
+            modified_at=registration.modified_at,
+            approved_by_id=registration.approved_by_id,
+            approved_at=registration.approved_at,
+        )
+
+    def unpack_data(self):
+        """
+        Return the registration's (original_data, latest_data)
+        """
+        original_data = unpack(self.packed_original_data)
+        if self.packed_latest_data_delta is None:
+            return original_data, original_data
+        return original_data, apply_patch(
+            original_data, unpack(self.packed_latest_data_delta))
+
+    def to_registration(self):
+        """
+        An unsaved Registration with the archived data, for reading it the
+        same way as the registrations that are not archived
+        """
+        original_data, latest_data = self.unpack_data()
+        registration = Registration(
+            id=self.pk,
+            original_data=original_data,
+            latest_data=latest_data,
+            rules_service_approved=self.rules_service_approved,
+            user_approved=self.user_approved,
+            created_at=self.created_at,
+            modified_by_id=self.modified_by_id,
+            modified_at=self.modified_at,
+            approved_by_id=self.approved_by_id,
+            approved_at=self.approved_at,
+        )
+        if self._meta.get_field('approved_by').is_cached(self):
+            registration.approved_by = self.approved_by
+        registration.sync_search_fields()
+        return registration
@@ -0,0 +1,46 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class RegistrationCursorPagination(CursorPagination):
+    """
+    Keyset pagination on the primary key: every page is an indexed range scan
+    with no COUNT, and rows created while a client walks the list only ever
+    show up after its current position
+    """
+    ordering = 'id'
+    page_size = 100
+    page_size_query_param = 'limit'
+    max_page_size = 1000
+
+
+class RegistrationPagination(LimitOffsetPagination):
+    """
+    Limit/offset pagination, unless the request opts into cursor pagination
+    by including a `cursor` query param (empty for the first page)
+    """
+    cursor_pagination = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if RegistrationCursorPagination.cursor_query_param in \
+                request.query_params:
+            self.cursor_pagination = RegistrationCursorPagination()
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view)
+        # Without a limit the list is not paginated, so skip the COUNT
+        if self.get_limit(request) is None:
+            return None
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_page_state(self):
+        """
+        What the paginated response says about the list besides its rows
+        """
+        if self.cursor_pagination is not None:
+            return (self.cursor_pagination.get_next_link(),
+                    self.cursor_pagination.get_previous_link())
+        return (self.count, self.get_next_link(), self.get_previous_link())
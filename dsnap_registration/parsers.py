@@ -0,0 +1,73 @@
+import codecs
+import io
+import re
+
+from django.conf import settings
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser, JSONParser
+from rest_framework.settings import api_settings
+from rest_framework.utils import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# orjson reads integers beyond 64 bits as floats, so bodies with a run of 19
+# or more digits are left to the stdlib parser, which keeps them exact
+LONG_DIGIT_RUN = re.compile(rb'\d{19}')
+
+
+class NDJSONParser(BaseParser):
+    """
+    Parses newline-delimited JSON into a list with one item per non-blank line
+    """
+    media_type = 'application/x-ndjson'
+    strict = api_settings.STRICT_JSON
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        parse_constant = json.strict_constant if self.strict else None
+
+        items = []
+        decoded_stream = codecs.getreader(encoding)(stream)
+        for line_number, line in enumerate(decoded_stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                items.append(json.loads(line, parse_constant=parse_constant))
+            except ValueError as exc:
+                raise ParseError(
+                    f'NDJSON parse error on line {line_number} - {exc}')
+        return items
+
+
+class FastJSONParser(JSONParser):
+    """
+    JSONParser that decodes UTF-8 bodies with orjson when it is installed.
+
+    Anything orjson rejects is parsed again with the stock parser, so invalid
+    bodies (and NaN or Infinity, which orjson never accepts) get exactly the
+    same result and error message as before.
+    """
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or codecs.lookup(encoding).name != 'utf-8':
+            return super().parse(stream, media_type, parser_context)
+
+        body = stream.read()
+        if not LONG_DIGIT_RUN.search(body):
+            try:
+                return orjson.loads(body)
+            except orjson.JSONDecodeError:
+                pass
+        return super().parse(io.BytesIO(body), media_type, parser_context)
+
+
+class MergePatchParser(FastJSONParser):
+    """
+    Parses JSON Merge Patch (RFC 7396) bodies, which are plain JSON
+    """
+    media_type = 'application/merge-patch+json'
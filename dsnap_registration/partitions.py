@@ -0,0 +1,126 @@
+"""
+One partition of the registration table per disaster.
+
+On Postgres 11 and later, migration 0010 turns ``registration`` into a table
+partitioned by LIST (disaster_id). Each disaster's registrations live in
+their own ``registration_disaster_<id>`` table, so queries that filter on
+disaster_id only touch that table, and an old disaster's rows can be
+archived or dropped without bloating the indexes of the current one.
+Registrations without a usable disaster_id go to ``registration_default``.
+
+Partitions are created on demand by ``ensure_partitions`` before a
+registration is written. Partitions known to exist are remembered for the
+life of the process, once the transaction that created or found them has
+committed; if it is rolled back, the partition is looked for again on the
+next write.
+
+``drop_partition`` removes the partition of a disaster whose registrations
+have all been archived (see archive.py).
+
+On older Postgres versions the table is left unpartitioned and
+``ensure_partitions`` and ``drop_partition`` do nothing.
+"""
+from django.db import connections, transaction
+
+DEFAULT_PARTITION = 'registration_default'
+
+# First key of the advisory lock taken while creating a partition; the
+# second is the disaster_id
+PARTITION_LOCK_KEY = 0x72656730
+
+_partitioned = {}
+_known_partitions = set()
+
+
+def partition_name(disaster_id):
+    # Keep in sync with migration 0010
+    return f'registration_disaster_{disaster_id}'
+
+
+def is_partitioned(using='default'):
+    if using not in _partitioned:
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                "SELECT relkind FROM pg_class "
+                "WHERE oid = to_regclass('registration')")
+            row = cursor.fetchone()
+        _partitioned[using] = row is not None and row[0] == 'p'
+    return _partitioned[using]
+
+
+def ensure_partitions(disaster_ids, using='default'):
+    """
+    Create the partitions for any of `disaster_ids` that do not exist yet,
+    in the current transaction
+    """
+    missing = sorted({disaster_id for disaster_id in disaster_ids
+                      if disaster_id is not None and
+                      (using, disaster_id) not in _known_partitions})
+    if not missing or not is_partitioned(using):
+        return
+    connection = connections[using]
+    with transaction.atomic(using=using, savepoint=False), \
+            connection.cursor() as cursor:
+        for disaster_id in missing:
+            create_partition(cursor, disaster_id, connection.ops.quote_name)
+        transaction.on_commit(
+            lambda: _known_partitions.update(
+                (using, disaster_id) for disaster_id in missing),
+            using=using)
+
+
+def create_partition(cursor, disaster_id, quote_name):
+    """
+    Create and attach the partition for `disaster_id` unless it exists,
+    moving in any of its registrations that are in the default partition
+    """
+    # Serializes processes creating the same partition
+    cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                   [PARTITION_LOCK_KEY, disaster_id])
+    table = quote_name(partition_name(disaster_id))
+    cursor.execute("SELECT to_regclass(%s)", [table])
+    if cursor.fetchone()[0] is not None:
+        return
+    cursor.execute(f"CREATE TABLE {table} (LIKE registration "
+                   f"INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+    cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id)")
+    cursor.execute(f"""
+        WITH moved AS (
+            DELETE FROM {DEFAULT_PARTITION} WHERE disaster_id = %s
+            RETURNING *
+        )
+        INSERT INTO {table} SELECT * FROM moved
+    """, [disaster_id])
+    cursor.execute(f"ALTER TABLE registration ATTACH PARTITION {table} "
+                   f"FOR VALUES IN (%s)", [disaster_id])
+
+
+def drop_partition(disaster_id, using='default'):
+    """
+    Detach and drop the partition for `disaster_id` if it exists and is
+    empty. Returns whether it was dropped.
+    """
+    if not is_partitioned(using):
+        return False
+    connection = connections[using]
+    table = connection.ops.quote_name(partition_name(disaster_id))
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_xact_lock(%s, %s)",
+                       [PARTITION_LOCK_KEY, disaster_id])
+        cursor.execute("SELECT to_regclass(%s)", [table])
+        if cursor.fetchone()[0] is None:
+            _known_partitions.discard((using, disaster_id))
+            return False
+        # Detaching locks the parent table anyway; locking it first keeps
+        # rows from being added between the check and the drop
+        cursor.execute("LOCK TABLE ONLY registration IN ACCESS EXCLUSIVE MODE")
+        cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table})")
+        if cursor.fetchone()[0]:
+            return False
+        # A table with deferred foreign key checks still pending in this
+        # transaction cannot be dropped
+        cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        cursor.execute(f"ALTER TABLE registration DETACH PARTITION {table}")
+        cursor.execute(f"DROP TABLE {table}")
+    _known_partitions.discard((using, disaster_id))
+    return True
@@ -0,0 +1,109 @@
+"""
+Profiles of single requests, for staff users.
+
+A request with an ``X-Profile`` header, made by a staff user, is run under
+cProfile and the profile is saved to ``PROFILE_DIR``, for reading with
+``pstats`` or a viewer such as snakeviz. The response names the file in
+its own ``X-Profile`` header. The header is ignored for everyone else, so
+it cannot be used to slow the service down.
+
+Only one request per process is profiled at a time; requests that ask
+while another is being profiled are served without. Under gevent, the
+profile also takes in whatever other greenlets run while the request waits
+on I/O.
+
+Saving a profile removes the oldest profiles beyond ``PROFILE_DIR_MAX_BYTES``
+in total and any older than ``PROFILE_MAX_AGE`` seconds.
+"""
+import cProfile
+import itertools
+import os
+import re
+import threading
+import time
+
+from django.conf import settings
+from rest_framework.exceptions import APIException
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+PROFILE_HEADER = 'HTTP_X_PROFILE'
+PROFILE_SUFFIX = '.prof'
+
+_profiling = threading.Lock()
+_counter = itertools.count()
+
+
+def is_staff(request):
+    """
+    Whether `request` authenticates, the way the API views do, as a staff
+    user
+    """
+    api_request = Request(request, authenticators=[
+        authentication() for authentication in
+        api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+    try:
+        return api_request.user.is_staff
+    except APIException:
+        return False
+
+
+def profile_filename(request):
+    path = re.sub(r'[^A-Za-z0-9]+', '-', request.path).strip('-')[:60]
+    return (f"{time.strftime('%Y%m%dT%H%M%S')}-{request.method}-"
+            f"{path or 'root'}-{os.getpid()}-{next(_counter)}{PROFILE_SUFFIX}")
+
+
+def clean_up(directory, max_bytes, max_age):
+    """
+    Remove the oldest profiles in `directory` beyond `max_bytes` in total,
+    and any older than `max_age` seconds
+    """
+    profiles = []
+    for entry in os.scandir(directory):
+        if not entry.name.endswith(PROFILE_SUFFIX):
+            continue
+        try:
+            stat = entry.stat()
+        except FileNotFoundError:
+            continue
+        profiles.append((stat.st_mtime, stat.st_size, entry.path))
+
+    oldest_kept = time.time() - max_age
+    total = 0
+    for modified, size, path in sorted(profiles, reverse=True):
+        total += size
+        if total > max_bytes or modified < oldest_kept:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if PROFILE_HEADER not in request.META or not is_staff(request):
+            return self.get_response(request)
+        if not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                profiler.disable()
+        finally:
+            _profiling.release()
+
+        directory = settings.PROFILE_DIR
+        os.makedirs(directory, exist_ok=True)
+        filename = profile_filename(request)
+        profiler.dump_stats(os.path.join(directory, filename))
+        response['X-Profile'] = filename
+        clean_up(directory, settings.PROFILE_DIR_MAX_BYTES,
+                 settings.PROFILE_MAX_AGE)
+        return response
@@ -0,0 +1,157 @@
+import csv
+import gc
+import io
+from itertools import compress
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils import json
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+else:
+    # Datetimes go through DRF's encoder so they are formatted the same way
+    ORJSON_OPTIONS = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+
+class NDJSONRenderer(BaseRenderer):
+    """
+    Renders a list as newline-delimited JSON, one item per line
+    """
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        return ''.join(
+            json.dumps(item, cls=JSONEncoder, ensure_ascii=False,
+                       separators=(',', ':')) + '\n'
+            for item in data
+        ).encode(self.charset)
+
+
+class CSVRenderer(BaseRenderer):
+    """
+    Renders a list of flat dicts as CSV with a header row
+    """
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, list):
+            data = [data]
+        output = io.StringIO()
+        if data:
+            writer = csv.DictWriter(output, fieldnames=list(data[0]))
+            writer.writeheader()
+            writer.writerows(data)
+        return output.getvalue().encode(self.charset)
+
+
+class PrometheusTextRenderer(BaseRenderer):
+    """
+    Passes through metrics already in the Prometheus text format. Anything
+    else, such as an error, is rendered as JSON.
+    """
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if not isinstance(data, str):
+            data = json.dumps(data, cls=JSONEncoder, ensure_ascii=False)
+        return data.encode(self.charset)
+
+
+# Deeper data (including data that contains itself) is not orjson's to render
+MAX_DEPTH = 255
+# Types has_odd_floats has met, by how it treats them; extended as it goes
+_CONTAINER_TYPES = {dict, list, tuple}
+_FLOAT_TYPES = {float}
+_OTHER_TYPES = {str, int, bool, type(None)}
+
+
+def has_odd_floats(data):
+    """
+    Whether `data` holds a float that orjson would not write the way the
+    json module does: NaN or infinity, which orjson writes as null, or one
+    below 1e-4 or from 1e16 up, which it writes without the exponent's sign
+    and leading zeros (``1e16`` rather than ``1e+16``). Other floats come
+    out the same. Also true of data nested more than MAX_DEPTH deep.
+
+    Containers are read a level at a time with gc.get_referents, which lists
+    the items of all of them in one call, so that only floats are looked at
+    one by one; a loop over every item in Python would take longer than the
+    stock renderer does.
+    """
+    items = [data]
+    for _ in range(MAX_DEPTH + 1):
+        if not items:
+            return False
+        types = list(map(type, items))
+        kinds = set(types)
+        for kind in kinds.difference(_CONTAINER_TYPES, _FLOAT_TYPES,
+                                     _OTHER_TYPES):
+            if issubclass(kind, (dict, list, tuple)):
+                _CONTAINER_TYPES.add(kind)
+            elif issubclass(kind, float):
+                _FLOAT_TYPES.add(kind)
+            else:
+                _OTHER_TYPES.add(kind)
+        if not kinds.isdisjoint(_FLOAT_TYPES):
+            for value in compress(items, map(_FLOAT_TYPES.__contains__,
+                                             types)):
+                if not (value == 0 or 1e-4 <= abs(value) < 1e16):
+                    # Also true of NaN
+                    return True
+        items = gc.get_referents(*compress(
+            items, map(_CONTAINER_TYPES.__contains__, types)))
+    return True
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed.
+
+    Output is the same as the stock renderer's compact, unescaped UTF-8 form:
+    values orjson does not handle natively (datetimes, decimals, lazy
+    strings...) are converted by DRF's JSONEncoder, and U+2028/U+2029 are
+    escaped the same way. Data with floats orjson writes differently (see
+    has_odd_floats), including NaN and infinity, which the stock renderer
+    refuses, goes through the stock renderer, as do indented output,
+    non-default JSON settings and anything orjson cannot encode.
+    """
+    _encoder = JSONEncoder()
+
+    def default(self, obj):
+        value = self._encoder.default(obj)
+        if has_odd_floats(value):
+            # orjson gives up, and the stock renderer takes over
+            raise TypeError(f"{value!r} is left to the stock renderer")
+        return value
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (orjson is None or data is None or self.ensure_ascii or
+                not self.compact or not self.strict or
+                self.get_indent(accepted_media_type, renderer_context or {}) or
+                has_odd_floats(data)):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(data, default=self.default,
+                               option=ORJSON_OPTIONS)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer, so the output is valid JavaScript
+        return ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(
+            b'\xe2\x80\xa9', b'\\u2029')
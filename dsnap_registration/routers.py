@@ -0,0 +1,107 @@
+"""
+Read-replica routing.
+
+When ``REPLICA_DATABASE_URL`` is set, settings add a ``replica`` database
+alias and ``ReplicaRouter`` sends reads to it while a request has opted in
+with ``replica_reads()``. The views do that for safe-method requests (see
+``ReplicaRoutingMixin`` in views.py). Everything else, including every
+write, goes to the primary (``default``).
+
+Replicas lag behind the primary, so a user who has just written is pinned
+to the primary for ``REPLICA_PIN_SECONDS`` and reads their own writes. Pins
+are kept in the ``REPLICA_PIN_CACHE`` cache, which must be shared between
+processes (the database cache, memcached or redis): gunicorn's next request
+from the user usually lands on another worker. ``check_pin_cache`` stops
+the app from starting with a replica and an in-process cache.
+
+The flag is thread-local, which gevent patches into greenlet-local.
+"""
+import threading
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA = 'replica'
+PIN_KEY = 'replica-pin:{}'
+# The models of Django's database cache, which holds pins by default
+CACHE_APP_LABEL = 'django_cache'
+
+_state = threading.local()
+
+
+def has_replica():
+    return REPLICA in connections.databases
+
+
+@contextmanager
+def replica_reads(enabled=True):
+    """
+    Route the reads made inside the block to the replica, if there is one
+    """
+    previous = getattr(_state, 'replica_reads', False)
+    _state.replica_reads = enabled
+    try:
+        yield
+    finally:
+        _state.replica_reads = previous
+
+
+def set_replica_reads(enabled):
+    """
+    Change the routing of the current replica_reads() block
+    """
+    _state.replica_reads = enabled
+
+
+def pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE]
+
+
+def check_pin_cache():
+    """
+    Raise ImproperlyConfigured if there is a replica and the pins would be
+    kept in each process's own memory
+    """
+    if has_replica() and isinstance(pin_cache(), LocMemCache):
+        raise ImproperlyConfigured(
+            f"REPLICA_PIN_CACHE ({settings.REPLICA_PIN_CACHE!r}) must be a "
+            "cache shared by every app process when there is a replica")
+
+
+def pin_to_primary(user):
+    """
+    Have `user` read from the primary for the next REPLICA_PIN_SECONDS
+    """
+    if has_replica() and user.is_authenticated:
+        pin_cache().set(PIN_KEY.format(user.pk), True,
+                        settings.REPLICA_PIN_SECONDS)
+
+
+def is_pinned(user):
+    return (user.is_authenticated and
+            pin_cache().get(PIN_KEY.format(user.pk), False))
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # A lagging replica could miss a pin that was just set
+        if model._meta.app_label == CACHE_APP_LABEL:
+            return None
+        if getattr(_state, 'replica_reads', False) and has_replica():
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return db != REPLICA
@@ -0,0 +1,65 @@
+from django.db.models import Exists, OuterRef
+from rest_framework.exceptions import ValidationError
+
+from .models import MatchKey, fold_case
+
+REGISTRATION_SEARCH_PARAMS = (
+    ('state_id', True),
+)
+REGISTRANT_SEARCH_PARAMS = (
+    ('ssn', False),
+    ('dob', False),
+    ('last_name', True)
+)
+
+
+def get_search_filters(params):
+    """
+    Turn search params (e.g. the query string) into filters on the indexed
+    columns Registration keeps in sync with latest_data. Case-insensitive keys
+    are stored upper-cased.
+    """
+    search_filters = {}
+    for param, case_insensitive_search in REGISTRATION_SEARCH_PARAMS:
+        value = params.get(param)
+        if value is not None:
+            search_filters[param] = \
+                fold_case(value) if case_insensitive_search else value
+    for param, case_insensitive_search in REGISTRANT_SEARCH_PARAMS:
+        value = params.get(f'registrant_{param}')
+        if value is not None:
+            search_filters[f'registrant_{param}'] = \
+                fold_case(value) if case_insensitive_search else value
+
+    disaster_id = params.get('disaster_id')
+    if disaster_id is not None:
+        try:
+            search_filters['disaster_id'] = int(disaster_id)
+        except ValueError:
+            raise ValidationError(
+                {'disaster_id': ['A valid integer is required.']})
+
+    possible_duplicates = params.get('possible_duplicates')
+    if possible_duplicates is not None:
+        if possible_duplicates != 'true':
+            raise ValidationError(
+                {'possible_duplicates': ['Only "true" is allowed.']})
+        search_filters['pk__in'] = possible_duplicate_ids(
+            search_filters.get('disaster_id'))
+    return search_filters
+
+
+def possible_duplicate_ids(disaster_id=None):
+    """
+    The ids of the registrations sharing a match key with another
+    registration of the same disaster (see duplicates.py), as a subquery
+    """
+    shared = MatchKey.objects.filter(
+        disaster_id=OuterRef('disaster_id'), kind=OuterRef('kind'),
+        value=OuterRef('value')).exclude(
+        registration_id=OuterRef('registration_id'))
+    keys = MatchKey.objects.annotate(shared=Exists(shared)).filter(
+        shared=True)
+    if disaster_id is not None:
+        keys = keys.filter(disaster_id=disaster_id)
+    return keys.values('registration_id')
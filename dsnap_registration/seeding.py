@@ -0,0 +1,197 @@
+"""
+Loading large synthetic datasets for scale testing.
+
+Registrations are made by ``synthetic.RegistrationGenerator`` in chunks of
+rows and written with ``COPY``, together with their match keys, one
+transaction per chunk. Chunks can be loaded by parallel worker processes.
+The ids of all the rows are reserved from the registration id sequence up
+front, and each chunk is generated from the seed and its own position only,
+so the same seed and chunk size give the same dataset however many workers
+load it and in whatever order.
+
+Disasters get registrations in proportion to 1/rank, so there are a few
+large disasters and a tail of small ones. A share of the registrations
+(``duplicate_rate``) repeat an earlier registration from the same chunk:
+its whole household, its registrant's SSN, or its registrant's name and
+date of birth, so that duplicate detection has something to find.
+
+COPY does not go through ``Registration.save``, so the caller rebuilds the
+disaster statistics once every chunk is loaded.
+"""
+import datetime
+import io
+import json
+from collections import namedtuple
+from random import Random
+
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .models import MatchKey, Registration
+from .synthetic import RegistrationGenerator
+
+DEFAULT_CHUNK_SIZE = 10000
+# created_at of the first row; later rows follow ROW_INTERVAL apart
+SEED_EPOCH = datetime.datetime(2019, 1, 1, tzinfo=timezone.utc)
+ROW_INTERVAL = datetime.timedelta(seconds=5)
+# (rules_service_approved, user_approved, weight)
+APPROVALS = (
+    (None, None, 50),
+    (True, None, 15),
+    (True, True, 20),
+    (True, False, 5),
+    (False, False, 10),
+)
+# (what a duplicate repeats, weight)
+DUPLICATE_KINDS = (
+    ('household', 4),
+    ('ssn', 3),
+    ('name', 3),
+)
+
+Chunk = namedtuple('Chunk', ['index', 'first_row', 'first_id', 'count'])
+
+
+def plan_chunks(count, chunk_size, first_id):
+    """
+    Split `count` rows, with ids from `first_id`, into chunks
+    """
+    return [Chunk(index, first_row, first_id + first_row,
+                  min(chunk_size, count - first_row))
+            for index, first_row in enumerate(range(0, count, chunk_size))]
+
+
+def disaster_weights(disaster_ids):
+    return [1 / rank for rank in range(1, len(disaster_ids) + 1)]
+
+
+def reserve_ids(count, using='default'):
+    """
+    Take `count` consecutive ids from the registration id sequence and
+    return the first
+    """
+    with transaction.atomic(using=using), \
+            connections[using].cursor() as cursor:
+        # Inserts draw their ids after taking a lock that conflicts with
+        # this one, so none of them can take an id inside the block
+        cursor.execute("LOCK TABLE registration IN SHARE MODE")
+        cursor.execute("SELECT pg_get_serial_sequence('registration', 'id')")
+        sequence = cursor.fetchone()[0]
+        cursor.execute("SELECT nextval(%s)", [sequence])
+        first_id = cursor.fetchone()[0]
+        cursor.execute("SELECT setval(%s, %s)",
+                       [sequence, first_id + count - 1])
+    return first_id
+
+
+def chunk_registrations(chunk, seed, disaster_ids, duplicate_rate):
+    """
+    Yield the unsaved registrations of `chunk`
+    """
+    generator = RegistrationGenerator(
+        seed=f'{seed}:{chunk.index}', disaster_ids=disaster_ids,
+        disaster_weights=disaster_weights(disaster_ids))
+    # Separate from the generator's, so payloads do not depend on it
+    random = Random(f'{seed}:{chunk.index}:rows')
+    approvals = [approval[:2] for approval in APPROVALS]
+    approval_weights = [approval[2] for approval in APPROVALS]
+    duplicate_kinds = [kind for kind, _ in DUPLICATE_KINDS]
+    duplicate_weights = [weight for _, weight in DUPLICATE_KINDS]
+
+    earlier = []
+    for offset in range(chunk.count):
+        data = generator.registration()
+        if earlier and random.random() < duplicate_rate:
+            kind = random.choices(duplicate_kinds, duplicate_weights)[0]
+            repeat_registration(data, random.choice(earlier), kind)
+        earlier.append(data)
+
+        rules_service_approved, user_approved = random.choices(
+            approvals, approval_weights)[0]
+        created_at = SEED_EPOCH + (chunk.first_row + offset) * ROW_INTERVAL
+        approved_at = None
+        if user_approved is not None:
+            approved_at = created_at + datetime.timedelta(
+                minutes=random.randint(10, 72 * 60))
+        registration = Registration(
+            id=chunk.first_id + offset,
+            original_data=data,
+            latest_data=data,
+            rules_service_approved=rules_service_approved,
+            user_approved=user_approved,
+            created_at=created_at,
+            modified_at=approved_at or created_at,
+            approved_at=approved_at,
+        )
+        registration.sync_search_fields()
+        yield registration
+
+
+def repeat_registration(data, earlier, kind):
+    """
+    Make `data` a likely duplicate of the `earlier` registration's data
+    """
+    data['disaster_id'] = earlier['disaster_id']
+    registrant = data['household'][0]
+    earlier_registrant = earlier['household'][0]
+    if kind == 'household':
+        data['household'] = json.loads(json.dumps(earlier['household']))
+    elif kind == 'ssn':
+        registrant['ssn'] = earlier_registrant['ssn']
+    else:
+        for field in ('first_name', 'last_name', 'dob'):
+            registrant[field] = earlier_registrant[field]
+
+
+def copy_text(value):
+    """
+    `value` in the text format of COPY
+    """
+    if value is None:
+        return '\\N'
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+    elif isinstance(value, datetime.datetime):
+        value = value.isoformat()
+    else:
+        value = str(value)
+    return value.replace('\\', '\\\\').replace('\t', '\\t') \
+        .replace('\n', '\\n').replace('\r', '\\r')
+
+
+def copy_objects(cursor, model, objects, quote_name, with_pk=True):
+    """
+    COPY `objects` into the table of `model`. Without `with_pk`, the
+    database assigns the primary keys.
+    """
+    fields = [field for field in model._meta.concrete_fields
+              if with_pk or not field.primary_key]
+    buffer = io.StringIO()
+    for obj in objects:
+        buffer.write('\t'.join(copy_text(getattr(obj, field.attname))
+                               for field in fields))
+        buffer.write('\n')
+    buffer.seek(0)
+    columns = ', '.join(quote_name(field.column) for field in fields)
+    cursor.copy_expert(f"COPY {quote_name(model._meta.db_table)} "
+                       f"({columns}) FROM STDIN", buffer)
+
+
+def load_chunk(chunk, seed, disaster_ids, duplicate_rate, using='default'):
+    """
+    Generate the registrations of `chunk` and COPY them and their match keys
+    in one transaction. Returns the number of registrations loaded.
+    """
+    registrations = list(chunk_registrations(chunk, seed, disaster_ids,
+                                             duplicate_rate))
+    connection = connections[using]
+    quote_name = connection.ops.quote_name
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        copy_objects(cursor, Registration, registrations, quote_name)
+        copy_objects(cursor, MatchKey,
+                     (key for registration in registrations
+                      for key in registration.build_match_keys()),
+                     quote_name, with_pk=False)
+    return len(registrations)
@@ -1,8 +1,16 @@
+from collections import defaultdict
+
+from django.db import transaction
 from django.utils import timezone
-from jsonschema import Draft7Validator
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
-from .models import Registration
+from .group_commit import create_registration
+from .metrics import phase
+from .models import SEARCH_FIELDS, Registration, RegistrationRevision
+from .search import get_search_filters
+from .statistics import update_statuses
+from .validation import CompiledSchema
 
 REGISTRATION_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
@@ -165,23 +173,149 @@ REGISTRATION_STATUS_SCHEMA = {
     "additionalProperties": False
 }
 
-class RegistrationSerializer(serializers.ModelSerializer):
+REGISTRATION_BULK_STATUS_SCHEMA = {
+    "$schema": "http://json-schema.org/draft-07/schema#",
+
+    "definitions": {
+        "approval": {"type": "boolean"},
+        "search_filter": {
+            "type": "object",
+            "properties": {
+                "disaster_id": {"type": "integer", "minimum": 0},
+                "state_id": {"type": "string"},
+                "registrant_ssn": {"type": "string"},
+                "registrant_dob": {"type": "string"},
+                "registrant_last_name": {"type": "string"},
+            },
+            "minProperties": 1,
+            "additionalProperties": False
+        },
+    },
+
+    "oneOf": [
+        {
+            "type": "object",
+            "properties": {
+                "registrations": {
+                    "type": "array",
+                    "minItems": 1,
+                    "maxItems": 10000,
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "id": {"type": "integer"},
+                            "rules_service_approved": {
+                                "$ref": "#/definitions/approval"},
+                            "user_approved": {
+                                "$ref": "#/definitions/approval"},
+                        },
+                        "required": [
+                            "id",
+                            "rules_service_approved",
+                            "user_approved",
+                        ],
+                        "additionalProperties": False
+                    }
+                },
+            },
+            "required": ["registrations"],
+            "additionalProperties": False
+        },
+        {
+            "type": "object",
+            "properties": {
+                "filter": {"$ref": "#/definitions/search_filter"},
+                "rules_service_approved": {"$ref": "#/definitions/approval"},
+                "user_approved": {"$ref": "#/definitions/approval"},
+            },
+            "required": [
+                "filter",
+                "rules_service_approved",
+                "user_approved",
+            ],
+            "additionalProperties": False
+        },
+    ]
+}
+
+# Compiled once per process; see validation.py
+REGISTRATION_VALIDATOR = CompiledSchema(REGISTRATION_SCHEMA)
+REGISTRATION_STATUS_VALIDATOR = CompiledSchema(REGISTRATION_STATUS_SCHEMA)
+REGISTRATION_BULK_STATUS_VALIDATOR = CompiledSchema(
+    REGISTRATION_BULK_STATUS_SCHEMA)
+
+# Maximum number of rows per INSERT statement when creating in bulk
+BULK_CREATE_BATCH_SIZE = 500
+
+# Columns written by a status update
+STATUS_UPDATE_FIELDS = ('rules_service_approved', 'user_approved',
+                        'approved_by', 'approved_at', 'modified_at')
+
+
+def validate_latest_data(data):
+    """
+    Raise the ValidationError that RegistrationSerializer would if `data`
+    is not a valid registration
+    """
+    errors = REGISTRATION_VALIDATOR.error_messages(data)
+    if errors:
+        raise serializers.ValidationError({
+            api_settings.NON_FIELD_ERRORS_KEY: [
+                f"Validation failed: {errors}"]})
+
+
+class RegistrationListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        """
+        Insert all of the registrations with batched multi-row INSERTs
+        """
+        registrations = [self.child.build_registration(attrs)
+                         for attrs in validated_data]
+        return Registration.objects.bulk_create(
+            registrations, batch_size=BULK_CREATE_BATCH_SIZE)
+
+
+class TimedRepresentationMixin:
+    """
+    Counts turning instances into primitive data as the request's
+    serialization phase
+    """
+    def to_representation(self, instance):
+        with phase('serialization'):
+            return super().to_representation(instance)
+
+
+class RegistrationSerializer(TimedRepresentationMixin,
+                             serializers.ModelSerializer):
     approved_by = serializers.ReadOnlyField(source='approved_by.username')
     class Meta:
         model = Registration
-        fields = '__all__'
+        exclude = SEARCH_FIELDS
+        list_serializer_class = RegistrationListSerializer
 
-    def create(self, validated_data):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        fieldset = self.context.get('fieldset')
+        if fieldset is not None:
+            for name in set(self.fields) - fieldset.fields:
+                self.fields.pop(name)
+            for path, alias in fieldset.json_paths.items():
+                self.fields[path] = serializers.ReadOnlyField(source=alias)
+
+    def build_registration(self, validated_data):
         """
-        Set original_data (which is set to be not editable) to the latest_data
-        on creation
+        Return an unsaved Registration with original_data (which is set to be
+        not editable) set to the latest_data
         """
         # Force null on original creation
         validated_data['latest_data']['ebt_card_number'] = None
 
-        return Registration.objects.create(
+        return Registration(
             original_data=validated_data['latest_data'], **validated_data)
 
+    def create(self, validated_data):
+        return create_registration(self.build_registration(validated_data))
+
     def to_internal_value(self, data):
         """
         Eliminate the need to have POST and other submissions to have the
@@ -193,29 +327,97 @@ class RegistrationSerializer(serializers.ModelSerializer):
         return super().to_internal_value(new_data)
 
     def validate(self, data):
-        errors = [e.message for e in
-                  Draft7Validator(REGISTRATION_SCHEMA).iter_errors(data['latest_data'])]
+        errors = REGISTRATION_VALIDATOR.error_messages(data['latest_data'])
         if errors:
             raise serializers.ValidationError(f"Validation failed: {errors}")
         return data
 
 
-class RegistrationStatusSerializer(serializers.ModelSerializer):
+class RegistrationStatusSerializer(TimedRepresentationMixin,
+                                   serializers.ModelSerializer):
     class Meta:
         model = Registration
-        fields = '__all__'
+        exclude = SEARCH_FIELDS
 
     def update(self, instance, validated_data):
         instance.rules_service_approved = validated_data['rules_service_approved']
         instance.user_approved = validated_data['user_approved']
         instance.approved_by = validated_data['approved_by']
         instance.approved_at = timezone.now()
-        instance.save()
+        instance.save(update_fields=STATUS_UPDATE_FIELDS)
         return instance
 
     def validate(self, data):
-        errors = [e.message for e in
-                  Draft7Validator(REGISTRATION_STATUS_SCHEMA).iter_errors(data)]
+        errors = REGISTRATION_STATUS_VALIDATOR.error_messages(data)
         if errors:
             raise serializers.ValidationError(f"Validation failed: {errors}")
         return data
+
+
+class RegistrationRevisionSerializer(TimedRepresentationMixin,
+                                     serializers.ModelSerializer):
+    modified_by = serializers.ReadOnlyField(source='modified_by.username')
+    # The JSON Patch the revision made, which the views work out from the
+    # stored one undoing it
+    delta = serializers.ReadOnlyField(source='change')
+
+    class Meta:
+        model = RegistrationRevision
+        fields = ('number', 'delta', 'modified_by', 'modified_at')
+
+
+class RegistrationBulkStatusSerializer(serializers.Serializer):
+    """
+    Approves or denies many registrations at once with set-based UPDATEs,
+    either from a list of {id, rules_service_approved, user_approved}
+    entries or for every registration matching a search filter
+    """
+    def to_internal_value(self, data):
+        return data
+
+    def validate(self, data):
+        errors = REGISTRATION_BULK_STATUS_VALIDATOR.error_messages(data)
+        if errors:
+            raise serializers.ValidationError(f"Validation failed: {errors}")
+        return data
+
+    def create(self, validated_data):
+        """
+        Stamp approved_by and approved_at the way
+        RegistrationStatusSerializer.update does, without loading any
+        registrations (keeping the disaster statistics in step), and return
+        a summary of the outcome
+        """
+        now = timezone.now()
+        approved_by = validated_data['approved_by']
+
+        if 'filter' in validated_data:
+            queryset = Registration.objects.filter(
+                **get_search_filters(validated_data['filter']))
+            with transaction.atomic():
+                updated_count = update_statuses(
+                    queryset, validated_data['rules_service_approved'],
+                    validated_data['user_approved'], approved_by, now)
+            return {"updated_count": updated_count}
+
+        # Later entries for the same id win
+        statuses = {int(entry['id']): (entry['rules_service_approved'],
+                                       entry['user_approved'])
+                    for entry in validated_data['registrations']}
+        with transaction.atomic():
+            found = set(Registration.objects.select_for_update().filter(
+                pk__in=statuses).values_list('pk', flat=True))
+            ids_by_status = defaultdict(list)
+            for pk in found:
+                ids_by_status[statuses[pk]].append(pk)
+            for (rules_service_approved, user_approved), ids in \
+                    ids_by_status.items():
+                update_statuses(Registration.objects.filter(pk__in=ids),
+                                rules_service_approved, user_approved,
+                                approved_by, now)
+
+        return {
+            "updated_count": len(found),
+            "updated": sorted(found),
+            "not_found": sorted(statuses.keys() - found),
+        }
@@ -0,0 +1,169 @@
+"""
+Per-disaster registration counts, maintained as registrations change.
+
+The disaster_statistic table holds one counter per combination of
+disaster_id, county, preferred_language and approval states. Every write to
+a registration moves it from its old combination to its new one with a
+single upsert in the same transaction, so reading the counts for a disaster
+never touches the registration table. Archived registrations stay counted.
+``rebuild_statistics`` recomputes every counter from scratch.
+
+Missing counties and languages are counted under ''. Approval states are
+stored as 'true', 'false' or 'null'.
+"""
+from collections import Counter
+
+from django.db import connections
+
+from .duplicates import parse_disaster_id
+
+STATISTIC_TABLE = 'disaster_statistic'
+KEY_COLUMNS = ('disaster_id', 'county', 'preferred_language',
+               'rules_service_approved', 'user_approved')
+
+APPROVAL_STATES = {True: 'true', False: 'false', None: 'null'}
+
+# The key of a row of the registration table aliased as {table}, computed
+# the same way as statistic_key()
+KEY_SQL = """
+    {table}.disaster_id AS disaster_id,
+    CASE WHEN jsonb_typeof({table}.latest_data -> 'county') = 'string'
+         THEN {table}.latest_data ->> 'county' ELSE '' END AS county,
+    CASE WHEN jsonb_typeof({table}.latest_data -> 'preferred_language')
+              = 'string'
+         THEN {table}.latest_data ->> 'preferred_language' ELSE ''
+    END AS preferred_language,
+    CASE {table}.rules_service_approved
+         WHEN true THEN 'true' WHEN false THEN 'false' ELSE 'null'
+    END AS rules_service_approved,
+    CASE {table}.user_approved
+         WHEN true THEN 'true' WHEN false THEN 'false' ELSE 'null'
+    END AS user_approved
+"""
+
+UPSERT_SQL = f"""
+    INSERT INTO {STATISTIC_TABLE} ({', '.join(KEY_COLUMNS)}, count)
+    VALUES {{values}}
+    ON CONFLICT ({', '.join(KEY_COLUMNS)})
+    DO UPDATE SET count = {STATISTIC_TABLE}.count + EXCLUDED.count
+"""
+
+UPDATE_STATUSES_SQL = f"""
+    WITH old AS (
+        SELECT registration.id, {KEY_SQL.format(table='registration')}
+        FROM registration
+        WHERE registration.id IN ({{registration_ids}})
+        FOR UPDATE
+    ), updated AS (
+        UPDATE registration
+        SET rules_service_approved = %s, user_approved = %s,
+            approved_by_id = %s, approved_at = %s, modified_at = %s
+        FROM old
+        WHERE registration.id = old.id
+        RETURNING {', '.join(f'old.{column}' for column in KEY_COLUMNS)}
+    )
+    SELECT {', '.join(KEY_COLUMNS)}, count(*) FROM updated
+    GROUP BY {', '.join(KEY_COLUMNS)}
+"""
+
+# The key of an archived registration, which stores its county and
+# preferred_language (see archive.py)
+ARCHIVED_KEY_SQL = """
+    disaster_id, county, preferred_language,
+    CASE rules_service_approved
+         WHEN true THEN 'true' WHEN false THEN 'false' ELSE 'null'
+    END AS rules_service_approved,
+    CASE user_approved
+         WHEN true THEN 'true' WHEN false THEN 'false' ELSE 'null'
+    END AS user_approved
+"""
+
+REBUILD_SQL = [
+    "LOCK TABLE registration, archived_registration IN SHARE MODE",
+    f"DELETE FROM {STATISTIC_TABLE}",
+    f"""
+    INSERT INTO {STATISTIC_TABLE} ({', '.join(KEY_COLUMNS)}, count)
+    SELECT {', '.join(KEY_COLUMNS)}, count(*)
+    FROM (SELECT {KEY_SQL.format(table='registration')}
+          FROM registration
+          UNION ALL
+          SELECT {ARCHIVED_KEY_SQL}
+          FROM archived_registration) AS registration_keys
+    WHERE disaster_id IS NOT NULL
+    GROUP BY {', '.join(KEY_COLUMNS)}
+    """,
+]
+
+
+def _text(value):
+    return value if isinstance(value, str) else ''
+
+
+def statistic_key(data, rules_service_approved, user_approved):
+    """
+    The counter a registration is counted under, or None if it has no
+    usable disaster_id
+    """
+    disaster = parse_disaster_id(data)
+    if disaster is None:
+        return None
+    data = data if isinstance(data, dict) else {}
+    return (disaster, _text(data.get('county')),
+            _text(data.get('preferred_language')),
+            APPROVAL_STATES[rules_service_approved],
+            APPROVAL_STATES[user_approved])
+
+
+def adjust_statistics(deltas, using='default'):
+    """
+    Add each {key: delta} to its counter with one upsert. Keys are written
+    in sorted order so concurrent writers lock the counters in the same
+    order.
+    """
+    changes = sorted((key, delta) for key, delta in deltas.items()
+                     if key is not None and delta)
+    if not changes:
+        return
+    values = ', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(changes))
+    params = [value for key, delta in changes for value in (*key, delta)]
+    with connections[using].cursor() as cursor:
+        cursor.execute(UPSERT_SQL.format(values=values), params)
+
+
+def update_statuses(queryset, rules_service_approved, user_approved,
+                    approved_by, now):
+    """
+    Approve or deny every registration in `queryset` with one statement that
+    also reports the counters they were counted under, and move them to
+    their new counters. Returns the number of registrations updated.
+    """
+    registration_ids, params = queryset.values('pk').query.sql_with_params()
+    with connections[queryset.db].cursor() as cursor:
+        cursor.execute(
+            UPDATE_STATUSES_SQL.format(registration_ids=registration_ids),
+            (*params, rules_service_approved, user_approved,
+             approved_by.pk if approved_by else None, now, now))
+        rows = cursor.fetchall()
+
+    deltas = Counter()
+    for *key, count in rows:
+        if key[0] is None:
+            continue
+        disaster, county, preferred_language, _, _ = key
+        deltas[tuple(key)] -= count
+        deltas[(disaster, county, preferred_language,
+                APPROVAL_STATES[rules_service_approved],
+                APPROVAL_STATES[user_approved])] += count
+    adjust_statistics(deltas, using=queryset.db)
+    return sum(count for *_, count in rows)
+
+
+def rebuild_statistics(using='default'):
+    """
+    Recompute every counter from the registration and archived_registration
+    tables. Writes to registrations wait until the rebuild is done, so no
+    change is missed.
+    """
+    with connections[using].cursor() as cursor:
+        for sql in REBUILD_SQL:
+            cursor.execute(sql)
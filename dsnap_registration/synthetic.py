@@ -0,0 +1,341 @@
+"""
+Synthetic registrations for load tests and seeding.
+
+``RegistrationGenerator`` walks ``REGISTRATION_SCHEMA`` and fills in each
+property, so every payload it makes is valid and new properties are picked
+up as the schema grows. Properties it knows about get realistic values:
+households of one to eight people that mostly share a last name, adults and
+children of plausible ages, jobs and pay for working-age members, and income
+sources that are usually empty. Anything else gets a value of the type the
+schema asks for.
+
+Given the same seed, a generator makes the same registrations in the same
+order. Dates of birth are computed from ``REFERENCE_YEAR`` rather than from
+today, so that holds across days too.
+"""
+import datetime
+import random
+import re
+import string
+
+from .serializers import REGISTRATION_SCHEMA
+from .validation import inline_refs
+
+REFERENCE_YEAR = 2019
+
+# Share of US households with 1 to 8 people
+HOUSEHOLD_SIZE_WEIGHTS = (28, 34, 15, 13, 6, 2.5, 1, 0.5)
+# Number of jobs held by a working-age member
+JOB_COUNT_WEIGHTS = (35, 50, 12, 3)
+# Chance that a member receives each kind of income
+INCOME_RATES = {
+    'self_employed': 0.08,
+    'unemployment': 0.06,
+    'cash_assistance': 0.04,
+    'disability': 0.05,
+    'social_security': 0.1,
+    'veterans_benefits': 0.03,
+    'alimony': 0.01,
+    'child_support': 0.05,
+    'other_sources': 0.03,
+}
+# Chance that an optional (nullable) value is left null
+NULL_RATE = 0.1
+
+FIRST_NAMES = {
+    'female': ('Mary', 'Patricia', 'Jennifer', 'Linda', 'Maria', 'Susan',
+               'Lisa', 'Angela', 'Rosa', 'Keisha', 'Mei', 'Guadalupe',
+               'Emily', 'Sofia', 'Aaliyah', 'Olivia'),
+    'male': ('James', 'John', 'Robert', 'Michael', 'David', 'Jose',
+             'Carlos', 'Daniel', 'Anthony', 'Darnell', 'Wei', 'Luis',
+             'Ethan', 'Mateo', 'Jamal', 'Noah'),
+}
+LAST_NAMES = ('Smith', 'Johnson', 'Williams', 'Brown', 'Jones', 'Garcia',
+              'Miller', 'Davis', 'Rodriguez', 'Martinez', 'Hernandez',
+              'Lopez', 'Gonzalez', 'Wilson', 'Anderson', 'Thomas', 'Taylor',
+              'Moore', 'Jackson', 'Martin', 'Lee', 'Nguyen', 'Thompson',
+              'White', 'Harris', 'Clark', 'Lewis', 'Robinson', 'Walker',
+              "O'Neil", 'St. James', 'Nuñez')
+STREET_NAMES = ('Main St', 'Oak Ave', 'Elm Rd', 'Pine St', 'Maple Dr',
+                'Cedar Ln', 'Washington Blvd', 'Lake Rd', 'Hill St',
+                'Park Ave', 'River Rd', 'Church St')
+EMPLOYERS = ('Acme', 'Walmart', 'USPS', 'County Schools', 'Kroger',
+             'Home Depot', "McDonald's", 'Regional Hospital', 'Amazon',
+             'City of Springfield', 'Shell', 'Self')
+# (city, state, county, zipcode prefix)
+PLACES = (
+    ('Houston', 'TX', 'Harris', '770'),
+    ('Beaumont', 'TX', 'Jefferson', '777'),
+    ('Corpus Christi', 'TX', 'Nueces', '784'),
+    ('New Orleans', 'LA', 'Orleans', '701'),
+    ('Lake Charles', 'LA', 'Calcasieu', '706'),
+    ('Panama City', 'FL', 'Bay', '324'),
+    ('Fort Myers', 'FL', 'Lee', '339'),
+    ('Wilmington', 'NC', 'New Hanover', '284'),
+    ('Paradise', 'CA', 'Butte', '959'),
+    ('Santa Rosa', 'CA', 'Sonoma', '954'),
+    ('San Juan', 'PR', 'San Juan', '009'),
+    ('Cedar Rapids', 'IA', 'Linn', '524'),
+)
+
+
+class RegistrationGenerator:
+    """
+    Makes registration payloads that are valid against `schema`, for the
+    disasters in `disaster_ids`, picked in proportion to `disaster_weights`
+    if given
+    """
+    def __init__(self, seed=None, disaster_ids=(1,), disaster_weights=None,
+                 schema=REGISTRATION_SCHEMA):
+        self.random = random.Random(seed)
+        self.disaster_ids = tuple(disaster_ids)
+        self.disaster_weights = disaster_weights
+        self.schema = inline_refs(schema)
+
+    def registration(self):
+        place = self.random.choice(PLACES)
+        context = {
+            'place': place,
+            'last_name': self.random.choice(LAST_NAMES),
+            'size': self.random.choices(
+                range(1, len(HOUSEHOLD_SIZE_WEIGHTS) + 1),
+                HOUSEHOLD_SIZE_WEIGHTS)[0],
+        }
+        return self._value(self.schema, (), context)
+
+    def registrations(self, count):
+        for _ in range(count):
+            yield self.registration()
+
+    def _value(self, schema, path, context):
+        hint = HINTS.get('.'.join(path))
+        if hint is not None:
+            return hint(self, schema, context)
+        return self._from_schema(schema, path, context)
+
+    def _from_schema(self, schema, path, context):
+        if 'anyOf' in schema:
+            options = [option for option in schema['anyOf']
+                       if option.get('type') != 'null']
+            if not options or (len(options) < len(schema['anyOf']) and
+                               self.random.random() < NULL_RATE):
+                return None
+            return self._value(self.random.choice(options), path, context)
+        if 'enum' in schema:
+            return self.random.choice(schema['enum'])
+        kind = schema.get('type')
+        if kind == 'object':
+            # The household goes first, since other values refer to it
+            properties = sorted(schema.get('properties', {}).items(),
+                                key=lambda item: item[0] != 'household')
+            document = {}
+            for key, subschema in properties:
+                document[key] = self._value(subschema, path + (key,), context)
+            return {key: document[key] for key in schema.get('properties')}
+        if kind == 'array':
+            return [self._from_schema(schema.get('items', {}), path, context)
+                    for _ in range(self.random.randint(0, 3))]
+        if kind == 'string':
+            if 'pattern' in schema:
+                return self._matching(schema['pattern'])
+            return ''.join(self.random.choices(string.ascii_lowercase, k=8))
+        if kind in ('number', 'integer'):
+            minimum = schema.get('minimum', 0)
+            return self.random.randint(minimum, minimum + 1000)
+        if kind == 'boolean':
+            return self.random.random() < 0.5
+        return None
+
+    def _matching(self, pattern):
+        match = re.match(r'^\^\\d(?:\{(\d+)\}|\*)\$$', pattern)
+        if match is None:
+            raise ValueError(f"Cannot generate strings matching {pattern!r}")
+        length = int(match.group(1) or 16)
+        return self._digits(length)
+
+    def _digits(self, length):
+        return ''.join(self.random.choices(string.digits, k=length))
+
+    def _money(self, median, rate=1.0):
+        """
+        An amount around `median`, given with probability `rate` and
+        otherwise null
+        """
+        if self.random.random() >= rate:
+            return None
+        return round(self.random.lognormvariate(0, 0.75) * median)
+
+    # Hints for properties of REGISTRATION_SCHEMA, by dotted path
+
+    def _disaster_id(self, schema, context):
+        return self.random.choices(self.disaster_ids,
+                                   self.disaster_weights)[0]
+
+    def _preferred_language(self, schema, context):
+        return 'es' if self.random.random() < 0.2 else 'en'
+
+    def _money_on_hand(self, schema, context):
+        return self._money(150, rate=0.9)
+
+    def _phone(self, schema, context):
+        if self.random.random() < NULL_RATE:
+            return None
+        return str(self.random.randint(2, 9)) + self._digits(9)
+
+    def _email(self, schema, context):
+        if self.random.random() < 0.25:
+            return ''
+        registrant = context['household'][0]
+        name = f"{registrant['first_name']}.{registrant['last_name']}"
+        name = re.sub(r'[^a-z.]', '', name.lower())
+        return f"{name}{self.random.randint(1, 99)}@example.com"
+
+    def _residential_address(self, schema, context):
+        return self._address(context['place'])
+
+    def _mailing_address(self, schema, context):
+        if self.random.random() < 0.8:
+            return self._address(context['place'])
+        return self._address(self.random.choice(PLACES))
+
+    def _address(self, place):
+        city, state, county, zipcode = place
+        street2 = ''
+        if self.random.random() < 0.2:
+            street2 = f"Apt {self.random.randint(1, 40)}"
+        return {
+            'street1': f"{self.random.randint(1, 9999)} "
+                       f"{self.random.choice(STREET_NAMES)}",
+            'street2': street2,
+            'city': city,
+            'state': state,
+            'zipcode': zipcode + self._digits(2),
+        }
+
+    def _county(self, schema, context):
+        return context['place'][2]
+
+    def _state_id(self, schema, context):
+        return self.random.choice(string.ascii_uppercase) + self._digits(7)
+
+    def _household(self, schema, context):
+        household = []
+        for index in range(context['size']):
+            if index == 0:
+                age = self.random.randint(18, 85)
+            elif index == 1 and self.random.random() < 0.6:
+                age = self.random.randint(18, 80)
+            elif self.random.random() < 0.1:
+                age = self.random.randint(60, 95)
+            else:
+                age = self.random.randint(0, 17)
+            member_context = dict(context, index=index, age=age,
+                                  sex=self.random.choice(['male', 'female']))
+            household.append(self._from_schema(
+                schema['items'], ('household',), member_context))
+        context['household'] = household
+        return household
+
+    def _first_name(self, schema, context):
+        return self.random.choice(FIRST_NAMES[context['sex']])
+
+    def _middle_name(self, schema, context):
+        if self.random.random() < 0.6:
+            return ''
+        return self.random.choice(FIRST_NAMES[context['sex']])
+
+    def _last_name(self, schema, context):
+        if context['index'] == 0 or self.random.random() < 0.8:
+            return context['last_name']
+        return self.random.choice(LAST_NAMES)
+
+    def _dob(self, schema, context):
+        born = datetime.date(REFERENCE_YEAR - context['age'], 1, 1)
+        born += datetime.timedelta(days=self.random.randint(0, 364))
+        return born.isoformat()
+
+    def _sex(self, schema, context):
+        return context['sex'] if self.random.random() < 0.95 else ''
+
+    def _ssn(self, schema, context):
+        if self.random.random() < 0.05:
+            return None
+        return (f"{self.random.randint(1, 665):03}"
+                f"{self.random.randint(1, 99):02}"
+                f"{self.random.randint(1, 9999):04}")
+
+    def _has_food_assistance(self, schema, context):
+        return self.random.random() < 0.15
+
+    def _income(self, schema, context):
+        income = {}
+        for source in schema['properties']:
+            rate = INCOME_RATES.get(source, 0.05)
+            if source == 'social_security' and context['age'] >= 62:
+                rate = 0.9
+            elif context['age'] < 18:
+                rate = rate / 10
+            income[source] = self._money(800, rate)
+        return income
+
+    def _jobs(self, schema, context):
+        if not 16 <= context['age'] < 70:
+            return []
+        count = self.random.choices(range(len(JOB_COUNT_WEIGHTS)),
+                                    JOB_COUNT_WEIGHTS)[0]
+        return [self._from_schema(schema['items'], ('household', 'jobs'),
+                                  context)
+                for _ in range(count)]
+
+    def _employer_name(self, schema, context):
+        return self.random.choice(EMPLOYERS)
+
+    def _pay(self, schema, context):
+        return self._money(2500)
+
+    def _is_dsnap_agency(self, schema, context):
+        return self.random.random() < 0.02
+
+    def _disaster_expense(self, schema, context):
+        return self._money(400, rate=0.4)
+
+    def _ebt_card_number(self, schema, context):
+        if self.random.random() < 0.7:
+            return None
+        return self._digits(16)
+
+
+HINTS = {
+    'disaster_id': RegistrationGenerator._disaster_id,
+    'preferred_language': RegistrationGenerator._preferred_language,
+    'money_on_hand': RegistrationGenerator._money_on_hand,
+    'phone': RegistrationGenerator._phone,
+    'email': RegistrationGenerator._email,
+    'residential_address': RegistrationGenerator._residential_address,
+    'mailing_address': RegistrationGenerator._mailing_address,
+    'county': RegistrationGenerator._county,
+    'state_id': RegistrationGenerator._state_id,
+    'household': RegistrationGenerator._household,
+    'household.first_name': RegistrationGenerator._first_name,
+    'household.middle_name': RegistrationGenerator._middle_name,
+    'household.last_name': RegistrationGenerator._last_name,
+    'household.dob': RegistrationGenerator._dob,
+    'household.sex': RegistrationGenerator._sex,
+    'household.ssn': RegistrationGenerator._ssn,
+    'household.has_food_assistance':
+        RegistrationGenerator._has_food_assistance,
+    'household.income': RegistrationGenerator._income,
+    'household.jobs': RegistrationGenerator._jobs,
+    'household.jobs.employer_name': RegistrationGenerator._employer_name,
+    'household.jobs.pay': RegistrationGenerator._pay,
+    'household.jobs.is_dsnap_agency': RegistrationGenerator._is_dsnap_agency,
+    'disaster_expenses.food_loss': RegistrationGenerator._disaster_expense,
+    'disaster_expenses.home_or_business_repairs':
+        RegistrationGenerator._disaster_expense,
+    'disaster_expenses.temporary_shelter_expenses':
+        RegistrationGenerator._disaster_expense,
+    'disaster_expenses.evacuation_expenses':
+        RegistrationGenerator._disaster_expense,
+    'disaster_expenses.other': RegistrationGenerator._disaster_expense,
+    'ebt_card_number': RegistrationGenerator._ebt_card_number,
+}
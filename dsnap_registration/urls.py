@@ -4,6 +4,15 @@ from . import views
 
 urlpatterns = [
     path('registrations', views.RegistrationList.as_view()),
+    path('registrations/bulk', views.RegistrationBulkCreate.as_view()),
+    path('registrations/export', views.RegistrationExport.as_view()),
+    path('registrations/status', views.RegistrationBulkStatusUpdate.as_view()),
     path('registrations/<int:pk>', views.RegistrationDetail.as_view()),
+    path('registrations/<int:pk>/duplicates', views.RegistrationDuplicates.as_view()),
+    path('registrations/<int:pk>/revisions', views.RegistrationRevisionList.as_view()),
+    path('registrations/<int:pk>/revisions/<int:number>', views.RegistrationRevisionDetail.as_view()),
     path('registrations/<int:pk>/status', views.RegistrationStatusUpdate.as_view()),
+    path('disasters/<int:disaster_id>/stats', views.DisasterStatistics.as_view()),
+    path('pool/stats', views.DatabasePoolStatistics.as_view()),
+    path('metrics', views.Metrics.as_view()),
 ]
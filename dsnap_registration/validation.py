@@ -0,0 +1,242 @@
+"""
+Compiled JSON schema validation.
+
+Validating a submission used to mean building a new ``Draft7Validator`` per
+request, which walks every ``$ref`` through the ref resolver each time.
+``CompiledSchema`` does that work once per process instead:
+
+* local ``#/definitions/...`` references are inlined up front, and
+* the schema is turned into generated Python source for a specialized
+  ``is_valid`` check that only answers "valid or not".
+
+Valid documents (the common case) only ever run the generated check. When it
+fails, the errors are collected with the regular jsonschema validator so that
+the error messages are exactly the ones jsonschema produces.
+"""
+import numbers
+import re
+
+from jsonschema import Draft7Validator
+
+from .metrics import phase
+
+# Keywords that do not affect validation
+ANNOTATION_KEYWORDS = {'$schema', '$id', 'definitions', 'title',
+                       'description', 'examples'}
+
+TYPE_CHECKS = {
+    'array': 'isinstance({0}, list)',
+    'boolean': 'isinstance({0}, bool)',
+    'integer': '_is_integer({0})',
+    'null': '{0} is None',
+    'number': '_is_number({0})',
+    'object': 'isinstance({0}, dict)',
+    'string': 'isinstance({0}, str)',
+}
+
+
+class UnsupportedSchema(Exception):
+    """
+    The schema uses a keyword the code generator does not know about
+    """
+
+
+def _is_number(instance):
+    return (isinstance(instance, numbers.Number) and
+            not isinstance(instance, bool))
+
+
+def _is_integer(instance):
+    # Draft 6 and later count floats like 1.0 as integers
+    if isinstance(instance, bool):
+        return False
+    return (isinstance(instance, int) or
+            isinstance(instance, float) and instance.is_integer())
+
+
+def inline_refs(schema, definitions=None):
+    """
+    Return a copy of `schema` with every local ``#/definitions/<name>``
+    reference replaced by the definition it points to
+    """
+    if definitions is None:
+        definitions = schema.get('definitions', {})
+    if isinstance(schema, dict):
+        if '$ref' in schema:
+            ref = schema['$ref']
+            if not ref.startswith('#/definitions/'):
+                raise UnsupportedSchema(f"Unsupported reference {ref}")
+            return inline_refs(definitions[ref[len('#/definitions/'):]],
+                               definitions)
+        return {key: inline_refs(value, definitions)
+                for key, value in schema.items() if key != 'definitions'}
+    if isinstance(schema, list):
+        return [inline_refs(value, definitions) for value in schema]
+    return schema
+
+
+class _CodeGenerator:
+    """
+    Generates one ``_check_<n>(x)`` function per subschema, each returning
+    whether ``x`` is valid under that subschema
+    """
+    def __init__(self):
+        self.lines = []
+        self.namespace = {'_is_number': _is_number,
+                          '_is_integer': _is_integer}
+        self.counter = 0
+
+    def constant(self, value):
+        name = f'_const_{len(self.namespace)}'
+        self.namespace[name] = value
+        return name
+
+    def function(self, schema):
+        if schema is True or schema == {}:
+            return self.constant(lambda instance: True)
+        if schema is False:
+            return self.constant(lambda instance: False)
+        unknown = set(schema) - ANNOTATION_KEYWORDS - set(KEYWORDS)
+        if unknown:
+            raise UnsupportedSchema(f"Unsupported keywords {sorted(unknown)}")
+
+        name = f'_check_{self.counter}'
+        self.counter += 1
+        body = []
+        for keyword, emit in KEYWORDS.items():
+            if keyword in schema:
+                body.extend(emit(self, schema[keyword], schema))
+        self.lines.append(f'def {name}(x):')
+        self.lines.extend(f'    {line}' for line in body)
+        self.lines.append('    return True')
+        return name
+
+    def build(self, schema):
+        name = self.function(schema)
+        exec('\n'.join(self.lines), self.namespace)
+        return self.namespace[name]
+
+
+def _emit_type(gen, types, schema):
+    if isinstance(types, str):
+        types = [types]
+    if not set(types) <= set(TYPE_CHECKS):
+        raise UnsupportedSchema(f"Unsupported type {types}")
+    checks = ' or '.join(TYPE_CHECKS[t].format('x') for t in types)
+    return [f'if not ({checks}): return False']
+
+
+def _emit_enum(gen, enums, schema):
+    return [f'if x not in {gen.constant(enums)}: return False']
+
+
+def _emit_minimum(gen, minimum, schema):
+    return [f'if _is_number(x) and x < {gen.constant(minimum)}: return False']
+
+
+def _emit_pattern(gen, pattern, schema):
+    search = gen.constant(re.compile(pattern).search)
+    return [f'if isinstance(x, str) and not {search}(x): return False']
+
+
+def _emit_properties(gen, properties, schema):
+    lines = ['if isinstance(x, dict):']
+    for key, subschema in properties.items():
+        check = gen.function(subschema)
+        key = gen.constant(key)
+        lines.append(f'    if {key} in x and not {check}(x[{key}]): '
+                     f'return False')
+    return lines
+
+
+def _emit_additional_properties(gen, additional, schema):
+    if additional is True:
+        return []
+    if 'patternProperties' in schema:
+        raise UnsupportedSchema("Unsupported keyword patternProperties")
+    known = gen.constant(frozenset(schema.get('properties', {})))
+    if additional is False:
+        return [f'if isinstance(x, dict) and not x.keys() <= {known}: '
+                f'return False']
+    check = gen.function(additional)
+    return ['if isinstance(x, dict):',
+            f'    for key in x.keys() - {known}:',
+            f'        if not {check}(x[key]): return False']
+
+
+def _emit_required(gen, required, schema):
+    required = gen.constant(frozenset(required))
+    return [f'if isinstance(x, dict) and not {required} <= x.keys(): '
+            f'return False']
+
+
+def _emit_items(gen, items, schema):
+    if isinstance(items, list):
+        raise UnsupportedSchema("Unsupported tuple-typed items")
+    check = gen.function(items)
+    return [f'if isinstance(x, list) and not all(map({check}, x)): '
+            f'return False']
+
+
+def _emit_min_items(gen, min_items, schema):
+    return [f'if isinstance(x, list) and len(x) < {min_items!r}: return False']
+
+
+def _emit_max_items(gen, max_items, schema):
+    return [f'if isinstance(x, list) and len(x) > {max_items!r}: return False']
+
+
+def _emit_min_properties(gen, min_properties, schema):
+    return [f'if isinstance(x, dict) and len(x) < {min_properties!r}: '
+            f'return False']
+
+
+def _emit_combinator(test):
+    def emit(gen, subschemas, schema):
+        checks = ', '.join(gen.function(s) for s in subschemas)
+        return [f'if not {test.format(checks)}: return False']
+    return emit
+
+
+KEYWORDS = {
+    'type': _emit_type,
+    'enum': _emit_enum,
+    'minimum': _emit_minimum,
+    'pattern': _emit_pattern,
+    'required': _emit_required,
+    'additionalProperties': _emit_additional_properties,
+    'properties': _emit_properties,
+    'items': _emit_items,
+    'minItems': _emit_min_items,
+    'maxItems': _emit_max_items,
+    'minProperties': _emit_min_properties,
+    'allOf': _emit_combinator('all(f(x) for f in ({0},))'),
+    'anyOf': _emit_combinator('any(f(x) for f in ({0},))'),
+    'oneOf': _emit_combinator('sum(1 for f in ({0},) if f(x)) == 1'),
+}
+
+
+class CompiledSchema:
+    """
+    A JSON schema prepared once and reused for every document validated
+    against it
+    """
+    def __init__(self, schema):
+        self.schema = schema
+        try:
+            inlined = inline_refs(schema)
+            self.validator = Draft7Validator(inlined)
+            self.is_valid = _CodeGenerator().build(inlined)
+        except UnsupportedSchema:
+            self.validator = Draft7Validator(schema)
+            self.is_valid = self.validator.is_valid
+
+    def error_messages(self, instance):
+        """
+        Return the jsonschema error messages for `instance`, or an empty list
+        if it is valid
+        """
+        with phase('validation'):
+            if self.is_valid(instance):
+                return []
+            return [e.message for e in self.validator.iter_errors(instance)]
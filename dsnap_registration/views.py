@@ -1,18 +1,43 @@
-from rest_framework import generics
+import os
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, status
+from rest_framework.exceptions import ParseError, ValidationError
 from rest_framework.permissions import (SAFE_METHODS, BasePermission,
-                                        IsAuthenticated)
+                                        IsAdminUser, IsAuthenticated)
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from dsnap_registration_service.postgresql_pool.pool import pools
 
-from .models import Registration
-from .serializers import RegistrationSerializer, RegistrationStatusSerializer
+from .admission import (ServiceUnavailable, SubmissionGlobalRateThrottle,
+                        SubmissionRateThrottle, is_anonymous_submission,
+                        submission_slots)
+from .conditional import (evaluate_preconditions, is_conditional,
+                          list_validators, registration_validators,
+                          set_validators)
+from .deltas import make_patch
+from .export import EXPORT_FORMATS
+from .fieldsets import Fieldset
+from .metrics import exposition
+from .models import (ArchivedRegistration, DisasterStatistic, Registration,
+                     RegistrationRevision)
+from .pagination import RegistrationPagination
+from .parsers import MergePatchParser, NDJSONParser
+from .renderers import CSVRenderer, NDJSONRenderer, PrometheusTextRenderer
+from .routers import (has_replica, is_pinned, pin_to_primary, replica_reads,
+                      set_replica_reads)
+from .search import get_search_filters
+from .statistics import APPROVAL_STATES
+from .serializers import (RegistrationBulkStatusSerializer,
+                          RegistrationRevisionSerializer,
+                          RegistrationSerializer, RegistrationStatusSerializer,
+                          validate_latest_data)
 
-REGISTRATION_SEARCH_PARAMS = (
-    ('state_id', True),
-)
-REGISTRANT_SEARCH_PARAMS = (
-    ('ssn', False),
-    ('dob', False),
-    ('last_name', True)
-)
+BULK_CREATE_MAX_ITEMS = 1000
 
 
 class AnonymousPost(BasePermission):
@@ -20,12 +45,91 @@ class AnonymousPost(BasePermission):
         return request.method == 'POST'
 
 
-class RegistrationList(generics.ListCreateAPIView):
+class SparseFieldsetMixin:
+    """
+    Trims safe-method responses to the `fields`/`exclude` query params and
+    only reads what they need from the database
+    """
+    def get_fieldset(self):
+        if self.request.method not in SAFE_METHODS:
+            return None
+        if not hasattr(self, '_fieldset'):
+            self._fieldset = Fieldset.from_params(
+                self.request.query_params,
+                self.get_serializer_class()().fields.keys())
+        return self._fieldset
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            queryset = fieldset.apply(queryset)
+        return queryset
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['fieldset'] = self.get_fieldset()
+        return context
+
+
+class ReplicaRoutingMixin:
+    """
+    Serves safe-method requests from the read replica, if one is configured,
+    except to users who wrote recently; successful writes pin the user to
+    the primary for a while. See routers.py.
+    """
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(False):
+            return super().dispatch(request, *args, **kwargs)
+
+    def initial(self, request, *args, **kwargs):
+        # Authentication and permission checks read from the primary
+        super().initial(request, *args, **kwargs)
+        if (request.method in SAFE_METHODS and has_replica() and
+                not is_pinned(request.user)):
+            set_replica_reads(True)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if (request.method not in SAFE_METHODS and
+                status.is_success(response.status_code)):
+            pin_to_primary(request.user)
+        return super().finalize_response(request, response, *args, **kwargs)
+
+
+class SubmissionAdmissionMixin:
+    """
+    Rate limits anonymous submissions with the throttles and turns them away
+    with a 503 when SUBMISSION_MAX_CONCURRENT are already in progress in the
+    process; see admission.py
+    """
+    throttle_classes = (SubmissionRateThrottle, SubmissionGlobalRateThrottle)
+    admitted = False
+
+    def dispatch(self, request, *args, **kwargs):
+        try:
+            return super().dispatch(request, *args, **kwargs)
+        finally:
+            if self.admitted:
+                submission_slots.release()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        if is_anonymous_submission(request):
+            if not submission_slots.acquire(
+                    settings.SUBMISSION_MAX_CONCURRENT):
+                raise ServiceUnavailable(wait=settings.SUBMISSION_RETRY_AFTER)
+            self.admitted = True
+
+
+class RegistrationList(SubmissionAdmissionMixin, ReplicaRoutingMixin,
+                       SparseFieldsetMixin, generics.ListCreateAPIView):
     permission_classes = (IsAuthenticated | AnonymousPost,)
+    queryset = Registration.objects.select_related('approved_by')
     serializer_class = RegistrationSerializer
+    pagination_class = RegistrationPagination
 
     def get_queryset(self):
-        queryset = Registration.objects.all()
+        queryset = super().get_queryset()
 
         search_filters = self.get_search_filters()
         queryset = queryset.filter(**search_filters)
@@ -33,41 +137,372 @@ class RegistrationList(generics.ListCreateAPIView):
         return queryset
 
     def get_search_filters(self):
-        search_filters = {}
-        for param, case_insensitive_search in REGISTRATION_SEARCH_PARAMS:
-            value = self.request.query_params.get(param)
-            if value is not None:
-                if case_insensitive_search:
-                    search_filters[f'latest_data__{param}__iexact'] = value
-                else:
-                    search_filters[f'latest_data__{param}'] = value
-        for param, case_insensitive_search in REGISTRANT_SEARCH_PARAMS:
-            # The registrant is always the 1st memmber of the household
-            value = self.request.query_params.get(f'registrant_{param}')
-            if value is not None:
-                if case_insensitive_search:
-                    search_filters[f'latest_data__household__0__{param}__iexact'] = value
-                else:
-                    search_filters[f'latest_data__household__0__{param}'] = value
-        return search_filters
-
-
-class RegistrationDetail(generics.RetrieveUpdateDestroyAPIView):
+        return get_search_filters(self.request.query_params)
+
+    def list(self, request, *args, **kwargs):
+        if is_conditional(request):
+            # Only the pk and modified_at of the page's rows
+            paginator = self.pagination_class()
+            queryset = self.filter_queryset(self.get_queryset()).values(
+                'id', 'modified_at')
+            page = paginator.paginate_queryset(queryset, request, view=self)
+            response = evaluate_preconditions(request, *self.page_validators(
+                queryset if page is None else page,
+                None if page is None else paginator))
+            if response is not None:
+                return response
+        response = super().list(request, *args, **kwargs)
+        rows = [{'id': registration.pk,
+                 'modified_at': registration.modified_at}
+                for registration in self.page]
+        return set_validators(response, *self.page_validators(
+            rows, self.paginator if self.paginated else None))
+
+    def paginate_queryset(self, queryset):
+        page = super().paginate_queryset(queryset)
+        # Unpaginated lists are read in full; the queryset caches them
+        self.paginated = page is not None
+        self.page = queryset if page is None else page
+        return page
+
+    def page_validators(self, rows, paginator):
+        return list_validators(
+            self.request, ((row['id'], row['modified_at']) for row in rows),
+            paginator and paginator.get_page_state())
+
+
+class RegistrationBulkCreate(ReplicaRoutingMixin, generics.GenericAPIView):
+    """
+    Accepts a JSON array or NDJSON body of registrations. Each item is
+    validated on its own; the valid ones are inserted together and the
+    response lists, in order, the new id or the errors for every item.
+    """
+    permission_classes = (IsAuthenticated,)
+    serializer_class = RegistrationSerializer
+    parser_classes = (*api_settings.DEFAULT_PARSER_CLASSES, NDJSONParser)
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        if not isinstance(items, list):
+            raise ParseError("Expected a list of registrations")
+        if len(items) > BULK_CREATE_MAX_ITEMS:
+            raise ParseError(
+                f"At most {BULK_CREATE_MAX_ITEMS} registrations are allowed "
+                "per request")
+
+        # A single serializer validates every item, as ListSerializer does,
+        # so its fields are only built once
+        serializer = self.get_serializer()
+        results = []
+        validated_data = []
+        for index, item in enumerate(items):
+            try:
+                validated_data.append(serializer.run_validation(item))
+            except ValidationError as exc:
+                results.append({"index": index,
+                                "status": status.HTTP_400_BAD_REQUEST,
+                                "errors": exc.detail})
+            else:
+                results.append({"index": index,
+                                "status": status.HTTP_201_CREATED})
+
+        created = iter(self.perform_bulk_create(validated_data))
+        for result in results:
+            if result["status"] == status.HTTP_201_CREATED:
+                result["id"] = next(created).pk
+        return Response(results)
+
+    def perform_bulk_create(self, validated_data):
+        return self.get_serializer(many=True).create(validated_data)
+
+
+class RegistrationExport(generics.GenericAPIView):
+    """
+    Streams every registration matching the search params as NDJSON (the
+    default) or as a flattened CSV of latest_data, chosen with the Accept
+    header or the `format` query param
+    """
     permission_classes = (IsAuthenticated,)
-    queryset = Registration.objects.all()
+    renderer_classes = (NDJSONRenderer, CSVRenderer)
+
+    def get_queryset(self):
+        search_filters = get_search_filters(self.request.query_params)
+        return Registration.objects.filter(**search_filters)
+
+    def get(self, request, *args, **kwargs):
+        renderer = request.accepted_renderer
+        lines = EXPORT_FORMATS[renderer.format](self.get_queryset())
+        response = StreamingHttpResponse(
+            lines, content_type=f'{renderer.media_type}; charset=utf-8')
+        response['Content-Disposition'] = \
+            f'attachment; filename="registrations.{renderer.format}"'
+        return response
+
+
+class RegistrationDetail(ReplicaRoutingMixin, SparseFieldsetMixin,
+                         generics.RetrieveUpdateDestroyAPIView):
+    """
+    PUT replaces a registration's latest_data; PATCH merges a JSON Merge
+    Patch (RFC 7396) into it in the database, so concurrent patches to
+    different members both apply
+    """
+    permission_classes = (IsAuthenticated,)
+    queryset = Registration.objects.select_related('approved_by')
     serializer_class = RegistrationSerializer
+    parser_classes = (*api_settings.DEFAULT_PARSER_CLASSES, MergePatchParser)
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.request.method not in SAFE_METHODS:
+            # Writes lock the row they change, so the disaster statistics
+            # are moved from the counter it is really stored under
+            queryset = queryset.select_for_update(of=('self',))
+        return queryset
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            if self.request.method not in SAFE_METHODS:
+                raise
+            return self.get_archived_object()
+
+    def get_archived_object(self):
+        """
+        The registration from the archive, for registrations of disasters
+        that have been archived (read-only)
+        """
+        archived = get_object_or_404(
+            ArchivedRegistration.objects.select_related('approved_by'),
+            pk=self.kwargs['pk'])
+        self.check_object_permissions(self.request, archived)
+        registration = archived.to_registration()
+        fieldset = self.get_fieldset()
+        if fieldset is not None:
+            fieldset.annotate(registration)
+        return registration
+
+    def retrieve(self, request, *args, **kwargs):
+        if is_conditional(request):
+            response = self.check_preconditions()
+            if response is not None:
+                return response
+        instance = self.get_object()
+        response = Response(self.get_serializer(instance).data)
+        return set_validators(response, *registration_validators(
+            request, instance.pk, instance.modified_at))
+
+    def update(self, request, *args, **kwargs):
+        # The row stays locked from the precondition check to the update, so
+        # If-Match cannot pass against a version that is being replaced
+        with transaction.atomic():
+            if is_conditional(request):
+                self.check_preconditions(lock=True)
+            response = super().update(request, *args, **kwargs)
+        return set_validators(response, *registration_validators(
+            request, self.updated.pk, self.updated.modified_at))
 
     def perform_update(self, serializer):
-        serializer.save(modified_by=self.request.user)
+        self.updated = serializer.save(modified_by=self.request.user)
+
+    def partial_update(self, request, *args, **kwargs):
+        with transaction.atomic():
+            if is_conditional(request):
+                self.check_preconditions(lock=True)
+            self.updated = Registration.objects.merge_patch(
+                kwargs['pk'], request.data, modified_by=request.user,
+                validate=validate_latest_data)
+        if self.updated is None:
+            raise Http404
+        response = Response(self.get_serializer(self.updated).data)
+        return set_validators(response, *registration_validators(
+            request, self.updated.pk, self.updated.modified_at))
+
+    def destroy(self, request, *args, **kwargs):
+        with transaction.atomic():
+            return super().destroy(request, *args, **kwargs)
+
+    def check_preconditions(self, lock=False):
+        """
+        Evaluate the conditional headers against the registration's current
+        modified_at, without loading the registration itself
+        """
+        queryset = Registration.objects.filter(pk=self.kwargs['pk'])
+        if lock:
+            queryset = queryset.select_for_update()
+        modified_at = queryset.values_list('modified_at', flat=True).first()
+        if modified_at is None and not lock:
+            modified_at = ArchivedRegistration.objects.filter(
+                pk=self.kwargs['pk']).values_list(
+                'modified_at', flat=True).first()
+        if modified_at is None:
+            # Answered with the usual 404
+            return None
+        return evaluate_preconditions(self.request, *registration_validators(
+            self.request, self.kwargs['pk'], modified_at))
+
 
-class RegistrationStatusUpdate(generics.UpdateAPIView):
+class RegistrationDuplicates(generics.GenericAPIView):
+    """
+    Lists the other registrations for the same disaster that share a match
+    key with this one, and which kinds of key they share
+    """
     permission_classes = (IsAuthenticated,)
-    queryset = Registration.objects.all()
+    queryset = Registration.objects.only('id')
+
+    def get(self, request, *args, **kwargs):
+        registration = self.get_object()
+        return Response([
+            {"id": registration_id, "matched_on": kinds}
+            for registration_id, kinds
+            in registration.find_duplicates().items()
+        ])
+
+
+class RegistrationRevisionMixin:
+    permission_classes = (IsAuthenticated,)
+    serializer_class = RegistrationRevisionSerializer
+
+    def get_registration(self):
+        """
+        The registration, from the archive if its disaster was archived,
+        with only what rebuilding its revisions needs
+        """
+        registration = Registration.objects.only(
+            'id', 'original_data', 'latest_data', 'created_at').filter(
+            pk=self.kwargs['pk']).first()
+        if registration is None:
+            registration = get_object_or_404(
+                ArchivedRegistration, pk=self.kwargs['pk']).to_registration()
+        return registration
+
+    def get_revision_data(self, history_entry):
+        """
+        Serialize a revision from Registration.revision_history, with the
+        JSON Patch it made to latest_data rather than the one undoing it
+        """
+        revision, previous_data, data = history_entry
+        revision.change = make_patch(previous_data, data)
+        return self.get_serializer(revision).data
+
+
+class RegistrationRevisionList(RegistrationRevisionMixin,
+                               generics.GenericAPIView):
+    """
+    The revisions of a registration, oldest first, each with the JSON Patch
+    it made to latest_data
+    """
+    def get(self, request, *args, **kwargs):
+        history = self.get_registration().revision_history()
+        return Response([self.get_revision_data(entry)
+                         for entry in reversed(history)])
+
+
+class RegistrationRevisionDetail(RegistrationRevisionMixin,
+                                 generics.GenericAPIView):
+    """
+    A registration's latest_data as of one of its revisions; revision 0 is
+    its original_data
+    """
+    def get(self, request, pk, number, *args, **kwargs):
+        registration = self.get_registration()
+        if number == 0:
+            revision = RegistrationRevision(
+                registration_id=pk, number=0,
+                modified_at=registration.created_at)
+            revision.change = []
+            data = self.get_serializer(revision).data
+            data['latest_data'] = registration.original_data
+            return Response(data)
+        history = registration.revision_history(since=number)
+        if not history or history[-1][0].number != number:
+            raise Http404
+        data = self.get_revision_data(history[-1])
+        data['latest_data'] = history[-1][2]
+        return Response(data)
+
+
+class RegistrationStatusUpdate(ReplicaRoutingMixin, generics.UpdateAPIView):
+    permission_classes = (IsAuthenticated,)
+    queryset = Registration.objects.select_for_update()
     serializer_class = RegistrationStatusSerializer
 
     def update(self, request, *args, **kwargs):
         kwargs['partial'] = True
-        return super().update(request, *args, **kwargs)
+        with transaction.atomic():
+            return super().update(request, *args, **kwargs)
 
     def perform_update(self, serializer):
         serializer.save(approved_by=self.request.user)
+
+
+class RegistrationBulkStatusUpdate(ReplicaRoutingMixin,
+                                   generics.GenericAPIView):
+    permission_classes = (IsAuthenticated,)
+    serializer_class = RegistrationBulkStatusSerializer
+
+    def put(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.save(approved_by=request.user))
+
+
+class DisasterStatistics(generics.GenericAPIView):
+    """
+    Registration counts for a disaster by county, preferred_language and
+    approval states, read from the counters kept by statistics.py
+    """
+    permission_classes = (IsAuthenticated,)
+
+    def get(self, request, disaster_id, *args, **kwargs):
+        approval_values = {state: value
+                           for value, state in APPROVAL_STATES.items()}
+        statistics = DisasterStatistic.objects.filter(
+            disaster_id=disaster_id, count__gt=0).order_by(
+            'county', 'preferred_language', 'rules_service_approved',
+            'user_approved')
+        counts = [
+            {
+                "county": statistic.county or None,
+                "preferred_language": statistic.preferred_language or None,
+                "rules_service_approved":
+                    approval_values[statistic.rules_service_approved],
+                "user_approved": approval_values[statistic.user_approved],
+                "count": statistic.count,
+            }
+            for statistic in statistics
+        ]
+        return Response({
+            "disaster_id": disaster_id,
+            "total": sum(count["count"] for count in counts),
+            "counts": counts,
+        })
+
+
+class DatabasePoolStatistics(generics.GenericAPIView):
+    """
+    The state of the database connection pools of the worker process that
+    serves the request
+    """
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request, *args, **kwargs):
+        return Response([
+            {"alias": alias, "database": database, "pid": os.getpid(),
+             **pool.stats()}
+            for (alias, database, _), pool in sorted(pools().items())
+        ])
+
+
+class Metrics(generics.GenericAPIView):
+    """
+    Request and connection pool metrics of all the app's worker processes,
+    in the Prometheus text format
+    """
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusTextRenderer,)
+
+    def get(self, request, *args, **kwargs):
+        return Response(exposition(),
+                        content_type='text/plain; version=0.0.4; '
+                                     'charset=utf-8')
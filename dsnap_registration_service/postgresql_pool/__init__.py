@@ -0,0 +1,16 @@
+"""
+A PostgreSQL database backend that keeps a bounded pool of connections per
+process; see pool.py.
+
+    DATABASES = {
+        'default': {
+            'ENGINE': 'dsnap_registration_service.postgresql_pool',
+            ...
+            'CONN_MAX_AGE': 0,
+            'POOL': {'MAX_SIZE': 10, 'TIMEOUT': 30, 'CHECK_IDLE_AFTER': 30},
+        }
+    }
+
+CONN_MAX_AGE should be 0: closing a connection at the end of a request
+returns it to the pool instead of closing the socket.
+"""
@@ -0,0 +1,36 @@
+from django.db.backends.base.base import NO_DB_ALIAS
+from django.db.backends.postgresql import base
+
+from .creation import DatabaseCreation
+from .pool import get_pool
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+    pool = None
+
+    def get_pool(self, conn_params):
+        # Separate pools for separate databases, such as the test database
+        # and the one it is created from
+        key = (self.alias, conn_params.get('database'),
+               repr(sorted(conn_params.items())))
+        return get_pool(
+            key, lambda: super(DatabaseWrapper, self).get_new_connection(
+                conn_params),
+            self.settings_dict.get('POOL', {}))
+
+    def get_new_connection(self, conn_params):
+        # Not the short-lived connection Django uses to create and drop
+        # databases, which it never closes
+        if self.alias == NO_DB_ALIAS:
+            return super().get_new_connection(conn_params)
+        self.pool = self.get_pool(conn_params)
+        return self.pool.acquire()
+
+    def _close(self):
+        if self.connection is None or self.pool is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            # Django keeps using a connection closed inside an atomic block
+            # until the block exits, so it cannot be shared
+            self.pool.release(self.connection, discard=self.in_atomic_block)
@@ -0,0 +1,11 @@
+from django.db.backends.postgresql import creation
+
+from .pool import pools
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Idle pooled connections would keep the database from being dropped
+        for pool in pools().values():
+            pool.close_idle()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,208 @@
+"""
+A bounded pool of psycopg2 connections.
+
+Each process keeps at most MAX_SIZE connections per database. A thread (or,
+under gunicorn's gevent worker, a greenlet) that needs a connection when all
+of them are in use waits on the pool for up to TIMEOUT seconds instead of
+opening another one, so a surge of requests queues in the app rather than
+exhausting the server's max_connections.
+
+Connections are handed back when Django closes them and are reused most
+recently used first. One that has been idle for more than CHECK_IDLE_AFTER
+seconds is health-checked with ``SELECT 1`` before it is reused, and broken
+connections are discarded.
+
+The pool waits with the threading module, which gevent's monkey patching
+makes cooperative. psycopg2 itself only yields to other greenlets once
+psycogreen has patched it, which gunicorn.conf.py does in each worker.
+"""
+import os
+import threading
+import time
+from collections import deque
+
+import psycopg2
+from psycopg2 import extensions
+
+DEFAULT_OPTIONS = {
+    # Connections per process
+    'MAX_SIZE': 10,
+    # Seconds to wait for a connection before giving up
+    'TIMEOUT': 30,
+    # Seconds a connection may sit idle before it is checked on reuse
+    'CHECK_IDLE_AFTER': 30,
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(psycopg2.OperationalError):
+    pass
+
+
+class ConnectionPool:
+    def __init__(self, connect, max_size, timeout, check_idle_after):
+        self.connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle_after = check_idle_after
+        # Looked up now, so a pool made after gevent's monkey patching gets
+        # the cooperative versions
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        # (connection, time it was returned), most recently returned last
+        self._idle = deque()
+        self._in_use = 0
+        self._waiting = 0
+        self._counts = dict.fromkeys(
+            ('created', 'reused', 'checked', 'discarded', 'timeouts'), 0)
+
+    def acquire(self):
+        """
+        Return an idle connection that is still usable, or a new one if
+        there is none, waiting for a free slot if all are in use
+        """
+        with self._lock:
+            self._waiting += 1
+        try:
+            acquired = self._slots.acquire(timeout=self.timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not acquired:
+            with self._lock:
+                self._counts['timeouts'] += 1
+            raise PoolTimeout(
+                f"No database connection became free within {self.timeout} "
+                f"seconds ({self.max_size} in use)")
+        try:
+            connection = self._reuse_idle() or self._create()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return connection
+
+    def release(self, connection, discard=False):
+        """
+        Hand a connection back to the pool, rolling back any transaction it
+        was left in, or close it if it is broken or `discard` is true
+        """
+        try:
+            if not discard and self._reset(connection):
+                with self._lock:
+                    self._idle.append((connection, time.monotonic()))
+                return
+            self._discard(connection)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    def close_idle(self):
+        """
+        Close every idle connection
+        """
+        with self._lock:
+            idle, self._idle = list(self._idle), deque()
+        for connection, _ in idle:
+            self._discard(connection)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'open': self._in_use + len(self._idle),
+                'in_use': self._in_use,
+                'idle': len(self._idle),
+                'waiting': self._waiting,
+                **self._counts,
+            }
+
+    def _reuse_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, returned_at = self._idle.pop()
+            if self._is_healthy(connection, time.monotonic() - returned_at):
+                with self._lock:
+                    self._counts['reused'] += 1
+                return connection
+            self._discard(connection)
+
+    def _create(self):
+        connection = self.connect()
+        with self._lock:
+            self._counts['created'] += 1
+        return connection
+
+    def _is_healthy(self, connection, idle_for):
+        if connection.closed:
+            return False
+        if idle_for < self.check_idle_after:
+            return True
+        with self._lock:
+            self._counts['checked'] += 1
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _reset(self, connection):
+        """
+        Leave the connection idle outside of a transaction; return whether
+        it can be reused
+        """
+        if connection.closed:
+            return False
+        status = connection.get_transaction_status()
+        if status == extensions.TRANSACTION_STATUS_IDLE:
+            return True
+        if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        try:
+            connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def _discard(self, connection):
+        with self._lock:
+            self._counts['discarded'] += 1
+        try:
+            connection.close()
+        except psycopg2.Error:
+            pass
+
+
+def get_pool(key, connect, options):
+    """
+    The process's pool for `key`, made with `connect` and `options` if there
+    is none. Pools inherited from a parent process are replaced, since its
+    connections cannot be shared.
+    """
+    with _pools_lock:
+        entry = _pools.get(key)
+        if entry is None or entry[0] != os.getpid():
+            options = {**DEFAULT_OPTIONS, **options}
+            entry = (os.getpid(), ConnectionPool(
+                connect, options['MAX_SIZE'], options['TIMEOUT'],
+                options['CHECK_IDLE_AFTER']))
+            _pools[key] = entry
+        return entry[1]
+
+
+def pools():
+    """
+    The pools of this process, by key
+    """
+    with _pools_lock:
+        return {key: pool for key, (pid, pool) in _pools.items()
+                if pid == os.getpid()}
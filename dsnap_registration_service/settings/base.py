@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import tempfile
 
 import dj_database_url
 
@@ -52,6 +53,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'dsnap_registration.metrics.MetricsMiddleware',
+    'dsnap_registration.profiling.ProfilingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
@@ -87,8 +90,57 @@ WSGI_APPLICATION = 'dsnap_registration_service.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/1.11/ref/settings/#databases
 
+# Connections come from a bounded pool in each process, which requests wait
+# on when it is exhausted; see dsnap_registration_service/postgresql_pool.
+# CONN_MAX_AGE is 0 so connections go back to the pool after each request.
+DATABASE_POOL = {
+    'MAX_SIZE': int(os.getenv('DATABASE_POOL_SIZE', 10)),
+    'TIMEOUT': 30,  # seconds
+    'CHECK_IDLE_AFTER': 30,  # seconds
+}
+
+
+def pooled(database):
+    """
+    Use the pooled backend for a database configured by dj_database_url
+    """
+    if database:
+        database.update(ENGINE='dsnap_registration_service.postgresql_pool',
+                        CONN_MAX_AGE=0, POOL=DATABASE_POOL)
+    return database
+
+
 DATABASES = {}
-DATABASES['default'] = dj_database_url.config(conn_max_age=600)
+DATABASES['default'] = pooled(dj_database_url.config())
+
+# An optional read replica for safe-method registration reads; see
+# dsnap_registration/routers.py. Tests read the replica through the primary.
+if os.getenv('REPLICA_DATABASE_URL'):
+    DATABASES['replica'] = pooled(
+        dj_database_url.config('REPLICA_DATABASE_URL'))
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+}
+
+DATABASE_ROUTERS = ['dsnap_registration.routers.ReplicaRouter']
+
+# Seconds a user keeps reading from the primary after a write, so they see
+# their own writes despite replication lag
+REPLICA_PIN_SECONDS = 10
+# The cache holding the pins, which every app process must share; the app
+# does not start with a replica and an in-process cache. The database cache
+# needs no other service (bin/run.sh creates its table).
+REPLICA_PIN_CACHE = 'default'
+if 'replica' in DATABASES:
+    CACHES['replica_pins'] = {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'replica_pin_cache',
+    }
+    REPLICA_PIN_CACHE = 'replica_pins'
 
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
@@ -132,11 +184,63 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': (
-        'rest_framework.parsers.JSONParser',
+        'dsnap_registration.parsers.FastJSONParser',
+    ),
+    'DEFAULT_RENDERER_CLASSES': (
+        'dsnap_registration.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ),
     'NON_FIELD_ERRORS_KEY': 'Invalid request',
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.BasicAuthentication',
-    )
+        'dsnap_registration.authentication.CachedBasicAuthentication',
+    ),
+    # Clients are identified by the address the cloud.gov router appends to
+    # X-Forwarded-For, not by what they sent in it themselves
+    'NUM_PROXIES': int(os.getenv('NUM_PROXIES', 1)),
+    # Token buckets for anonymous POSTs to /registrations, per client IP and
+    # for all clients; see dsnap_registration/admission.py
+    'DEFAULT_THROTTLE_RATES': {
+        'anonymous_submission': os.getenv('SUBMISSION_RATE_PER_IP', '20/min'),
+        'anonymous_submissions_total': os.getenv('SUBMISSION_RATE',
+                                                 '3000/min'),
+    },
 }
+
+# The cache holding the submission token buckets; shared between processes
+# if it is a shared cache
+SUBMISSION_THROTTLE_CACHE = 'default'
+# Anonymous submissions handled at once per process before the rest are
+# turned away with a 503, and the Retry-After sent with it
+SUBMISSION_MAX_CONCURRENT = int(os.getenv('SUBMISSION_MAX_CONCURRENT', 50))
+SUBMISSION_RETRY_AFTER = 1  # seconds
+
+# Registrations created by concurrent requests in a worker within this many
+# seconds of each other are inserted and committed together; 0 turns it off.
+# See dsnap_registration/group_commit.py.
+GROUP_COMMIT_WINDOW = float(os.getenv('GROUP_COMMIT_WINDOW', 0))
+GROUP_COMMIT_MAX_SIZE = 100
+# Requests whose batch has not started writing this long after the window
+# insert their registration on their own
+GROUP_COMMIT_TIMEOUT = 5  # seconds
+
+# Basic auth credentials that passed a password check are remembered
+# in-process, so repeat requests skip the password hashing
+BASIC_AUTH_CACHE_TTL = 300  # seconds
+BASIC_AUTH_CACHE_MAX_ENTRIES = 1000
+
+# Each process writes its request metrics here for /metrics to add up; see
+# dsnap_registration/metrics.py. Without it, /metrics only reports the
+# process that serves it.
+METRICS_DIR = os.getenv('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = 1  # seconds
+
+# Add a Server-Timing header with the time spent in each phase of a request
+SERVER_TIMING = True
+
+# Where requests by staff users with an X-Profile header save their
+# profiles; see dsnap_registration/profiling.py
+PROFILE_DIR = os.getenv('PROFILE_DIR') or os.path.join(
+    tempfile.gettempdir(), 'dsnap-profiles')
+PROFILE_DIR_MAX_BYTES = 50 * 1024 * 1024
+PROFILE_MAX_AGE = 24 * 60 * 60  # seconds
@@ -10,7 +10,7 @@ SECRET_KEY = 'Just a simple secret key for development'
 DEBUG = True
 
 if not DATABASES['default']:
-    DATABASES['default'] = dj_database_url.parse(
-        'postgres:///dsnap_registration', conn_max_age=600)
+    DATABASES['default'] = pooled(dj_database_url.parse(
+        'postgres:///dsnap_registration'))
 
 WHITENOISE_AUTOREFRESH = True
@@ -0,0 +1,16 @@
+"""
+Settings for the gunicorn server started by bin/run.sh.
+
+The gevent workers monkey patch the standard library, but psycopg2 talks to
+Postgres from C, so a query would block every greenlet of its worker until
+it returned. psycogreen makes psycopg2 wait for the server through gevent
+instead, so other requests run while one waits on the database (and on the
+connection pool, see postgresql_pool/pool.py).
+"""
+worker_class = 'gevent'
+workers = 4
+
+
+def post_fork(server, worker):
+    from psycogreen.gevent import patch_psycopg
+    patch_psycopg()
@@ -0,0 +1,122 @@
+import copy
+import re
+from contextlib import contextmanager
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+
+from dsnap_registration import partitions
+from dsnap_registration.routers import REPLICA
+
+from test_api import GOOD_PAYLOAD, TEST_PASSWORD, TEST_USERNAME
+
+SAVEPOINT_SQL = re.compile(r'(RELEASE |ROLLBACK TO )?SAVEPOINT ')
+# The database cache of replica pins, which may as well be kept elsewhere
+PIN_CACHE_SQL = re.compile(r'.*"replica_pin_cache"', re.DOTALL)
+
+
+@pytest.fixture
+def query_budget():
+    """
+    A context manager that fails the test when the code inside it runs more
+    SQL queries than the given budget:
+
+        with query_budget(2):
+            client.get('/registrations')
+    """
+    @contextmanager
+    def budget(max_queries):
+        with CaptureQueriesContext(connection) as queries:
+            yield queries
+        # Savepoints only appear because each test runs in a transaction
+        statements = [query['sql'] for query in queries.captured_queries
+                      if not SAVEPOINT_SQL.match(query['sql']) and
+                      not PIN_CACHE_SQL.match(query['sql'])]
+        if len(statements) > max_queries:
+            listing = '\n'.join(
+                f'{number}. {sql[:200]}'
+                for number, sql in enumerate(statements, 1))
+            pytest.fail(f"{len(statements)} queries exceeded the budget of "
+                        f"{max_queries}:\n{listing}")
+    return budget
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """
+    Submission rate limits and replica pins are kept in the cache
+    """
+    cache.clear()
+
+
+@pytest.fixture(autouse=True)
+def forget_partitions():
+    """
+    Partitions created by a test are rolled back with it
+    """
+    partitions._known_partitions.clear()
+
+
+def share_connection(alias):
+    """
+    Have `alias` use the primary's connection, so that it sees the data of
+    the test's transaction
+    """
+    connections.databases.setdefault(alias,
+                                     connections.databases[DEFAULT_DB_ALIAS])
+    connections[alias] = connections[DEFAULT_DB_ALIAS]
+
+
+@pytest.fixture(autouse=True)
+def configured_replica():
+    """
+    A replica set up with REPLICA_DATABASE_URL is only a mirror of the test
+    database, and reads through the primary's connection
+    """
+    if REPLICA in connections.databases:
+        share_connection(REPLICA)
+
+
+@pytest.fixture
+def replica():
+    """
+    A stand-in read replica for the test, reading through the primary's
+    connection
+    """
+    configured = REPLICA in connections.databases
+    share_connection(REPLICA)
+    yield REPLICA
+    if not configured:
+        del connections[REPLICA]
+        del connections.databases[REPLICA]
+
+
+@pytest.fixture
+def payload1(client):
+    payload1 = copy.deepcopy(GOOD_PAYLOAD)
+    client.post('/registrations', data=payload1,
+                content_type="application/json")
+    return payload1
+
+
+@pytest.fixture
+def payload2(client):
+    payload2 = copy.deepcopy(GOOD_PAYLOAD)
+    payload2["state_id"] = "ZZ987654321"
+    payload2["household"][0]["ssn"] = "987654321"
+    del payload2["household"][1]
+    client.post('/registrations', data=payload2,
+                content_type="application/json")
+    return payload2
+
+
+@pytest.fixture
+def authenticated_client(client):
+    get_user_model().objects.create_superuser(
+            username=TEST_USERNAME,
+            password=TEST_PASSWORD,
+            email="admin@example.com")
+    return client
@@ -0,0 +1,120 @@
+import pytest
+from django.test import RequestFactory
+from rest_framework import status
+
+from dsnap_registration.admission import (SubmissionRateThrottle,
+                                          TokenBucketThrottle,
+                                          submission_slots)
+
+from test_api import GOOD_PAYLOAD, TEST_AUTHORIZATION
+
+
+@pytest.fixture
+def rates(settings):
+    """
+    Sets the submission rate limits for the test
+    """
+    def set_rates(per_ip=None, total=None):
+        settings.REST_FRAMEWORK = {
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {'anonymous_submission': per_ip,
+                                       'anonymous_submissions_total': total},
+        }
+    return set_rates
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(TokenBucketThrottle, 'timer', lambda self: now[0])
+    return now
+
+
+def submit(client, ip='10.0.0.1', **extra):
+    return client.post('/registrations', data=GOOD_PAYLOAD,
+                       content_type="application/json", REMOTE_ADDR=ip,
+                       **extra)
+
+
+@pytest.mark.django_db
+def test_per_ip_rate_limit(client, rates, clock):
+    rates(per_ip='3/min')
+    for _ in range(3):
+        assert submit(client).status_code == status.HTTP_201_CREATED
+    response = submit(client)
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert response['Retry-After'] == '20'
+    assert submit(client, ip='10.0.0.2').status_code == \
+        status.HTTP_201_CREATED
+
+    # One request's worth of tokens comes back every 20 seconds
+    clock[0] += 10
+    assert submit(client).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    assert submit(client)['Retry-After'] == '10'
+    clock[0] += 10
+    assert submit(client).status_code == status.HTTP_201_CREATED
+    assert submit(client).status_code == status.HTTP_429_TOO_MANY_REQUESTS
+    clock[0] += 3600
+    for _ in range(3):
+        assert submit(client).status_code == status.HTTP_201_CREATED
+
+
+@pytest.mark.django_db
+def test_per_ip_rate_limit_ignores_spoofed_addresses(client, rates, clock):
+    rates(per_ip='2/min')
+    # The router appends the address it got the request from
+    for spoofed in ('1.1.1.1', '2.2.2.2, 3.3.3.3'):
+        response = submit(client, ip='10.0.0.9',
+                          HTTP_X_FORWARDED_FOR=f'{spoofed}, 203.0.113.7')
+        assert response.status_code == status.HTTP_201_CREATED
+    response = submit(client, ip='10.0.0.9',
+                      HTTP_X_FORWARDED_FOR='4.4.4.4, 203.0.113.7')
+    assert response.status_code == status.HTTP_429_TOO_MANY_REQUESTS
+
+    request = RequestFactory().post(
+        '/registrations', HTTP_X_FORWARDED_FOR='5.5.5.5, 203.0.113.7')
+    assert SubmissionRateThrottle().get_ident(request) == '203.0.113.7'
+
+
+@pytest.mark.django_db
+def test_global_rate_limit(client, rates, clock):
+    rates(per_ip='10/min', total='2/min')
+    assert submit(client, ip='10.0.0.1').status_code == \
+        status.HTTP_201_CREATED
+    assert submit(client, ip='10.0.0.2').status_code == \
+        status.HTTP_201_CREATED
+    assert submit(client, ip='10.0.0.3').status_code == \
+        status.HTTP_429_TOO_MANY_REQUESTS
+
+
+@pytest.mark.django_db
+def test_authenticated_requests_are_not_limited(authenticated_client, rates,
+                                                settings):
+    rates(per_ip='1/min', total='1/min')
+    settings.SUBMISSION_MAX_CONCURRENT = 0
+    for _ in range(3):
+        response = submit(authenticated_client,
+                          HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+        assert response.status_code == status.HTTP_201_CREATED
+    response = authenticated_client.get(
+        '/registrations', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_concurrency_cap(client, settings):
+    settings.SUBMISSION_MAX_CONCURRENT = 1
+    assert submission_slots.acquire(1)
+    try:
+        response = submit(client)
+        assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+        assert response['Retry-After'] == '1'
+    finally:
+        submission_slots.release()
+
+    assert submit(client).status_code == status.HTTP_201_CREATED
+    response = client.post('/registrations', data={"disaster_id": "x"},
+                           content_type="application/json")
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    # Slots are given back however the request ends
+    assert submission_slots.active == 0
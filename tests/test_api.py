@@ -1,10 +1,26 @@
 import base64
 import copy
+import csv
+import importlib
+import io
+import json
+import re
+import types
+from unittest import mock
 
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
 
+from dsnap_registration import partitions
+from dsnap_registration.authentication import credential_cache
+from dsnap_registration.models import (ArchivedRegistration,
+                                       DisasterStatistic, MatchKey,
+                                       Registration)
+
 TEST_USERNAME = "admin"
 TEST_PASSWORD = "admin"
 TEST_AUTHORIZATION = "Basic {}".format(str(base64.b64encode(
@@ -270,29 +286,937 @@ def test_search_by_registrant_last_name_and_registrant_ssn(
     assert len(result) == 1
 
 
-@pytest.fixture
-def payload1(client):
-    payload1 = copy.deepcopy(GOOD_PAYLOAD)
-    client.post('/registrations', data=payload1,
-                content_type="application/json")
-    return payload1
+@pytest.mark.django_db
+def test_bulk_create(authenticated_client):
+    bad_payload = copy.deepcopy(GOOD_PAYLOAD)
+    del bad_payload["disaster_id"]
+    payloads = [GOOD_PAYLOAD, bad_payload, GOOD_PAYLOAD]
+
+    response = authenticated_client.post(
+        '/registrations/bulk', data=payloads, content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [r["index"] for r in results] == [0, 1, 2]
+    assert [r["status"] for r in results] == [201, 400, 201]
+    assert results[1]["errors"] == {
+        "Invalid request":
+            ["""Validation failed: ["'disaster_id' is a required property"]"""]
+    }
 
+    response = authenticated_client.get(f'/registrations/{results[2]["id"]}',
+                                        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    result = response.json()
+    assert result["original_data"] == result["latest_data"]
+    assert result["latest_data"]["state_id"] == GOOD_PAYLOAD["state_id"]
 
-@pytest.fixture
-def payload2(client):
-    payload2 = copy.deepcopy(GOOD_PAYLOAD)
-    payload2["state_id"] = "ZZ987654321"
-    payload2["household"][0]["ssn"] = "987654321"
-    del payload2["household"][1]
-    client.post('/registrations', data=payload2,
+
+@pytest.mark.django_db
+def test_bulk_create_ndjson(authenticated_client):
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    payload["ebt_card_number"] = "123456789"
+    body = "\n".join(json.dumps(p) for p in (payload, payload)) + "\n"
+
+    response = authenticated_client.post(
+        '/registrations/bulk', data=body, content_type="application/x-ndjson",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [r["status"] for r in results] == [201, 201]
+
+    response = authenticated_client.get(f'/registrations/{results[0]["id"]}',
+                                        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.json()["original_data"]["ebt_card_number"] is None
+
+
+@pytest.mark.django_db
+def test_bulk_create_requires_authentication(client):
+    response = client.post('/registrations/bulk', data=[GOOD_PAYLOAD],
+                           content_type="application/json")
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+
+
+@pytest.mark.django_db
+def test_search_fields_follow_updates(authenticated_client, payload1):
+    registration_id = Registration.objects.get().pk
+    payload = copy.deepcopy(payload1)
+    payload["state_id"] = "new123"
+    payload["household"][0]["last_name"] = "Smith"
+    authenticated_client.put(f'/registrations/{registration_id}',
+                             data=payload, content_type="application/json",
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+
+    for search in ('state_id=NEW123', 'registrant_last_name=smith'):
+        response = authenticated_client.get(
+            f'/registrations?{search}', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+        assert [r["id"] for r in response.json()] == [registration_id]
+    response = authenticated_client.get(
+        f'/registrations?state_id={payload1["state_id"]}',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.json() == []
+
+
+@pytest.mark.django_db
+def test_search_folds_case_like_python(authenticated_client):
+    def search(last_name):
+        response = authenticated_client.get(
+            f'/registrations?registrant_last_name={last_name}',
+            HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+        return [r["id"] for r in response.json()]
+
+    registration_id = create_registration(
+        authenticated_client,
+        lambda p: p["household"][0].update(last_name="Strauß"))
+    assert search("strauß") == search("STRAUSS") == [registration_id]
+
+    # As migration 0007's UPPER() left it
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            UPDATE registration SET registrant_last_name =
+                UPPER(latest_data #>> '{household,0,last_name}')
+        """)
+    assert search("strauß") == []
+    migration = importlib.import_module(
+        'dsnap_registration.migrations.0015_fold_search_fields_like_python')
+    migration.refold_search_fields(
+        None, types.SimpleNamespace(connection=connection))
+    assert search("strauß") == [registration_id]
+
+
+@pytest.mark.django_db
+def test_bulk_create_accepts_generator():
+    Registration.objects.bulk_create(
+        Registration(original_data=GOOD_PAYLOAD, latest_data=GOOD_PAYLOAD)
+        for _ in range(2))
+    assert Registration.objects.filter(
+        state_id=GOOD_PAYLOAD["state_id"].upper()).count() == 2
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('search_filter,index', (
+    ({'state_id': 'ABC9876'}, 'registration_state_id_idx'),
+    ({'registrant_ssn': '123456789'}, 'registration_reg_ssn_idx'),
+    ({'registrant_dob': '1980-01-01'}, 'registration_reg_dob_idx'),
+    ({'registrant_last_name': 'DOE'}, 'registration_reg_last_name_idx'),
+))
+def test_search_uses_index(search_filter, index):
+    # The test table is tiny, so make sequential scans unattractive to the
+    # planner the way a large table would
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+    plan = Registration.objects.filter(**search_filter).explain()
+    assert index in plan_indexes(plan)
+
+
+def plan_indexes(plan):
+    """
+    The indexes a query plan scans, and on a partitioned registration table
+    the partitioned indexes they are partitions of
+    """
+    names = {using or on for using, on in re.findall(
+        r'Index (?:Only )?Scan (?:Backward )?using (\S+)|'
+        r'Bitmap Index Scan on (\S+)', plan)}
+    with connection.cursor() as cursor:
+        cursor.execute("""
+            SELECT parent.relname FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE child.relname = ANY(%s)
+        """, [list(names)])
+        return names | {row[0] for row in cursor.fetchall()}
+
+
+@pytest.mark.django_db
+def test_cursor_pagination(authenticated_client, payload1, payload2):
+    response = authenticated_client.get(
+        '/registrations?cursor=&limit=1',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    page = response.json()
+    assert "count" not in page
+    assert page["previous"] is None
+    first_id = page["results"][0]["id"]
+
+    # Rows created while paging show up after the current position
+    authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                              content_type="application/json")
+
+    ids = [first_id]
+    while page["next"]:
+        response = authenticated_client.get(
+            page["next"], HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+        page = response.json()
+        ids.extend(r["id"] for r in page["results"])
+    assert ids == sorted(Registration.objects.values_list("id", flat=True))
+
+
+@pytest.mark.django_db
+def test_limit_offset_pagination(authenticated_client, payload1, payload2):
+    response = authenticated_client.get(
+        '/registrations?limit=1&offset=1',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    page = response.json()
+    assert page["count"] == 2
+    assert len(page["results"]) == 1
+
+
+@pytest.mark.django_db
+def test_export_ndjson(authenticated_client, payload1, payload2):
+    response = authenticated_client.get(
+        '/registrations/export?registrant_last_name=doe',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"].startswith("application/x-ndjson")
+    lines = b"".join(response.streaming_content).decode().splitlines()
+    records = [json.loads(line) for line in lines]
+    assert [r["latest_data"]["state_id"] for r in records] == \
+        [payload1["state_id"], payload2["state_id"]]
+    assert "original_data" not in records[0]
+
+
+@pytest.mark.django_db
+def test_export_csv(authenticated_client, payload1, payload2):
+    response = authenticated_client.get(
+        f'/registrations/export?format=csv&disaster_id=34'
+        f'&state_id={payload2["state_id"]}',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert response["Content-Type"].startswith("text/csv")
+    content = b"".join(response.streaming_content).decode()
+    rows = list(csv.DictReader(io.StringIO(content)))
+    assert len(rows) == 1
+    assert rows[0]["household.0.ssn"] == payload2["household"][0]["ssn"]
+    assert rows[0]["residential_address.city"] == "Oakland"
+    assert rows[0]["ebt_card_number"] == ""
+    # payload2 only has a single household member
+    assert "household.1.ssn" not in rows[0]
+
+    response = authenticated_client.get(
+        '/registrations/export?disaster_id=abc',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_export_command(tmp_path, payload1, payload2):
+    output = tmp_path / "export.ndjson"
+    call_command('export_registrations', '--state-id', payload1["state_id"],
+                 '--output', str(output))
+    records = [json.loads(line) for line in output.read_text().splitlines()]
+    assert [r["latest_data"] for r in records] == [payload1]
+
+
+@pytest.mark.django_db
+def test_cached_basic_authentication(authenticated_client, payload1):
+    credential_cache.clear()
+    user_model = get_user_model()
+    with mock.patch.object(user_model, 'check_password', autospec=True,
+                           side_effect=user_model.check_password) as check:
+        for _ in range(3):
+            response = authenticated_client.get(
+                '/registrations', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+            assert response.status_code == status.HTTP_200_OK
+        assert check.call_count == 1
+
+    # Changing the password invalidates the cached credentials
+    user = user_model.objects.get(username=TEST_USERNAME)
+    user.set_password("a new password")
+    user.save()
+    response = authenticated_client.get(
+        '/registrations', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+
+
+@pytest.mark.django_db
+def test_cached_basic_authentication_rejects_wrong_password(
+        authenticated_client):
+    credential_cache.clear()
+    authenticated_client.get('/registrations',
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    wrong_authorization = "Basic {}".format(str(base64.b64encode(
+        f"{TEST_USERNAME}:wrong".encode()), "utf-8"))
+    response = authenticated_client.get('/registrations',
+                                        HTTP_AUTHORIZATION=wrong_authorization)
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+
+
+@pytest.mark.django_db
+def test_bulk_status_by_id(authenticated_client, payload1, payload2):
+    first_id, second_id = Registration.objects.order_by(
+        'id').values_list('id', flat=True)
+    status_payload = {"registrations": [
+        {"id": first_id, "rules_service_approved": True,
+         "user_approved": True},
+        {"id": second_id, "rules_service_approved": True,
+         "user_approved": False},
+        {"id": second_id + 100, "rules_service_approved": False,
+         "user_approved": False},
+    ]}
+    response = authenticated_client.put(
+        '/registrations/status', data=status_payload,
+        content_type="application/json", HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {
+        "updated_count": 2,
+        "updated": [first_id, second_id],
+        "not_found": [second_id + 100],
+    }
+
+    response = authenticated_client.get(f'/registrations/{second_id}',
+                                        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    result = response.json()
+    assert result["rules_service_approved"] is True
+    assert result["user_approved"] is False
+    assert result["approved_by"] == TEST_USERNAME
+    assert result["approved_at"] is not None
+
+
+@pytest.mark.django_db
+def test_bulk_status_by_filter(authenticated_client, payload1, payload2):
+    status_payload = {
+        "filter": {"state_id": payload2["state_id"].lower()},
+        "rules_service_approved": False,
+        "user_approved": False,
+    }
+    response = authenticated_client.put(
+        '/registrations/status', data=status_payload,
+        content_type="application/json", HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == {"updated_count": 1}
+    assert list(Registration.objects.order_by('id').values_list(
+        'user_approved', flat=True)) == [None, False]
+
+    # An empty filter would match everything, so it is rejected
+    status_payload["filter"] = {}
+    response = authenticated_client.put(
+        '/registrations/status', data=status_payload,
+        content_type="application/json", HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_sparse_fieldset_list(authenticated_client, payload1, payload2):
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get(
+            '/registrations?registrant_last_name=doe'
+            '&fields=id,user_approved,latest_data.household.0.last_name',
+            HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert [sorted(r) for r in results] == \
+        [["id", "latest_data.household.0.last_name", "user_approved"]] * 2
+    assert results[0]["latest_data.household.0.last_name"] == "Doe"
+
+    list_query = queries.captured_queries[-1]["sql"]
+    assert '"registration"."original_data"' not in list_query
+    assert '"registration"."latest_data",' not in list_query
+
+
+@pytest.mark.django_db
+def test_sparse_fieldset_detail(authenticated_client, payload1):
+    registration_id = Registration.objects.get().pk
+    response = authenticated_client.get(
+        f'/registrations/{registration_id}?exclude=original_data,latest_data',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert result["id"] == registration_id
+    assert "original_data" not in result
+    assert "latest_data" not in result
+    assert "created_at" in result
+
+    response = authenticated_client.get(
+        f'/registrations/{registration_id}?fields=id,password,latest_data.x-y',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"fields": ["Unknown field 'password'",
+                                          "Unknown field 'latest_data.x-y'"]}
+
+
+# Maximum number of SQL queries per request, authentication included
+QUERY_BUDGETS = {
+    'create': 3,
+    'list': 3,
+    'detail': 2,
+    'status': 4,
+}
+
+
+def run_on_commit():
+    """
+    Run what is waiting for the test's transaction to commit, which it never
+    does
+    """
+    for _, callback in connection.run_on_commit:
+        callback()
+
+
+@pytest.mark.django_db
+def test_query_budgets(authenticated_client, query_budget):
+    credential_cache.clear()
+    # The disaster's partition is created with its first registration, and
+    # remembered once that commits
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    run_on_commit()
+    registration_ids = [response.json()["id"]]
+    for _ in range(3):
+        with query_budget(QUERY_BUDGETS['create']):
+            response = authenticated_client.post(
+                '/registrations', data=GOOD_PAYLOAD,
                 content_type="application/json")
-    return payload2
+        registration_ids.append(response.json()["id"])
+
+    status_payload = {"rules_service_approved": True, "user_approved": True}
+    for registration_id in registration_ids:
+        with query_budget(QUERY_BUDGETS['status']):
+            response = authenticated_client.put(
+                f'/registrations/{registration_id}/status',
+                data=status_payload, content_type="application/json",
+                HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+        assert response.status_code == status.HTTP_200_OK
+
+    # approved_by must not cost a query per row
+    with query_budget(QUERY_BUDGETS['list']):
+        response = authenticated_client.get(
+            '/registrations', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert [r["approved_by"] for r in response.json()] == [TEST_USERNAME] * 4
+
+    with query_budget(QUERY_BUDGETS['detail']):
+        response = authenticated_client.get(
+            f'/registrations/{registration_ids[0]}',
+            HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.json()["approved_by"] == TEST_USERNAME
+
+
+def query_sql(queries):
+    return ' '.join(query['sql'] for query in queries.captured_queries)
+
+
+@pytest.mark.django_db
+def test_detail_conditional_get(authenticated_client, payload1):
+    url = f'/registrations/{Registration.objects.get().pk}'
+    response = authenticated_client.get(url,
+                                        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    etag = response['ETag']
+    last_modified = response['Last-Modified']
+    assert 'no-cache' in response['Cache-Control']
+
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get(
+            url, HTTP_IF_NONE_MATCH=etag,
+            HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response['ETag'] == etag
+    assert 'latest_data' not in query_sql(queries)
+
+    response = authenticated_client.get(
+        url, HTTP_IF_MODIFIED_SINCE=last_modified,
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    # Another representation of the same registration
+    response = authenticated_client.get(
+        f'{url}?fields=id', HTTP_IF_NONE_MATCH=etag,
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+
+    authenticated_client.put(url, data=payload1,
+                             content_type="application/json",
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    response = authenticated_client.get(
+        url, HTTP_IF_NONE_MATCH=etag, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+
+@pytest.mark.django_db
+def test_detail_if_match(authenticated_client, payload1):
+    url = f'/registrations/{Registration.objects.get().pk}'
+    etag = authenticated_client.get(
+        url, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)['ETag']
+
+    response = authenticated_client.put(
+        url, data=payload1, content_type="application/json",
+        HTTP_IF_MATCH=etag, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    new_etag = response['ETag']
+    assert new_etag != etag
+
+    payload = copy.deepcopy(payload1)
+    payload["phone"] = "2165550000"
+    response = authenticated_client.put(
+        url, data=payload, content_type="application/json",
+        HTTP_IF_MATCH=etag, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+    assert Registration.objects.get().latest_data["phone"] == payload1["phone"]
+
+    response = authenticated_client.patch(
+        url, data=payload, content_type="application/json",
+        HTTP_IF_MATCH=new_etag, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert Registration.objects.get().latest_data["phone"] == "2165550000"
+
+
+@pytest.mark.django_db
+def test_list_conditional_get(authenticated_client, payload1, payload2):
+    url = f'/registrations?state_id={payload1["state_id"]}'
+    response = authenticated_client.get(
+        url, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    etag = response['ETag']
+
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get(
+            url, HTTP_IF_NONE_MATCH=etag,
+            HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert 'latest_data' not in query_sql(queries)
+
+    # A registration outside the search does not change the list
+    authenticated_client.post('/registrations', data=payload2,
+                              content_type="application/json")
+    response = authenticated_client.get(
+        url, HTTP_IF_NONE_MATCH=etag, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+    registration = Registration.objects.get(state_id=payload1["state_id"])
+    authenticated_client.put(
+        f'/registrations/{registration.pk}/status',
+        data={"rules_service_approved": True, "user_approved": True},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    response = authenticated_client.get(
+        url, HTTP_IF_NONE_MATCH=etag, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag'] != etag
+
+    response = authenticated_client.get(
+        f'{url}&limit=1', HTTP_IF_NONE_MATCH=response['ETag'],
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+def test_list_validators_come_from_the_page(authenticated_client, payload1,
+                                            payload2):
+    # Unconditional requests run no aggregate over the matching rows
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get(
+            '/registrations?cursor=&limit=1',
+            HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert 'COUNT(' not in query_sql(queries)
+    assert 'MAX(' not in query_sql(queries)
+    etag = response['ETag']
+    next_page = response.json()['next']
+
+    with CaptureQueriesContext(connection) as queries:
+        response = authenticated_client.get(
+            '/registrations?cursor=&limit=1', HTTP_IF_NONE_MATCH=etag,
+            HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert 'COUNT(' not in query_sql(queries)
+    assert 'latest_data' not in query_sql(queries)
+
+    # A change on another page leaves this one alone
+    second = authenticated_client.get(
+        next_page, HTTP_AUTHORIZATION=TEST_AUTHORIZATION).json()['results'][0]
+    authenticated_client.put(
+        f'/registrations/{second["id"]}/status',
+        data={"rules_service_approved": True, "user_approved": True},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    response = authenticated_client.get(
+        '/registrations?cursor=&limit=1', HTTP_IF_NONE_MATCH=etag,
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+
+
+def create_registration(client, change):
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    change(payload)
+    response = client.post('/registrations', data=payload,
+                           content_type="application/json")
+    assert response.status_code == status.HTTP_201_CREATED
+    return response.json()["id"]
+
+
+def get_duplicates(client, registration_id):
+    response = client.get(f'/registrations/{registration_id}/duplicates',
+                          HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+
+@pytest.mark.django_db
+def test_duplicates(authenticated_client):
+    def unrelated(payload):
+        payload["household"] = [{"first_name": "Ann", "last_name": "Roe",
+                                 "ssn": "555000111", "dob": "1990-02-02"}]
+
+    def same_dependent_ssn(payload):
+        del payload["household"][0]
+
+    def same_dob_and_name(payload):
+        unrelated(payload)
+        payload["household"][0].update(ssn="555000222", last_name="roe ")
+
+    def other_disaster(payload):
+        payload["disaster_id"] = GOOD_PAYLOAD["disaster_id"] + 1
+
+    original_id = create_registration(authenticated_client, lambda p: None)
+    unrelated_id = create_registration(authenticated_client, unrelated)
+    dependent_id = create_registration(authenticated_client,
+                                       same_dependent_ssn)
+    create_registration(authenticated_client, other_disaster)
+
+    assert get_duplicates(authenticated_client, original_id) == [
+        {"id": dependent_id, "matched_on": ["ssn"]}]
+    assert get_duplicates(authenticated_client, unrelated_id) == []
+
+    name_id = create_registration(authenticated_client, same_dob_and_name)
+    assert get_duplicates(authenticated_client, unrelated_id) == [
+        {"id": name_id, "matched_on": ["dob_last_name"]}]
+
+    # Flagged in the list too, without asking registration by registration
+    response = authenticated_client.get(
+        '/registrations?possible_duplicates=true',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    assert sorted(r["id"] for r in response.json()) == sorted(
+        [original_id, unrelated_id, dependent_id, name_id])
+    response = authenticated_client.get(
+        '/registrations?possible_duplicates=true&disaster_id='
+        f'{GOOD_PAYLOAD["disaster_id"] + 1}',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.json() == []
+    response = authenticated_client.get(
+        '/registrations?possible_duplicates=yes',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+def test_duplicates_follow_updates(authenticated_client, payload1):
+    registration_id = Registration.objects.get().pk
+    other_id = create_registration(authenticated_client, lambda p: None)
+    assert get_duplicates(authenticated_client, registration_id) == [
+        {"id": other_id, "matched_on": ["ssn"]}]
+
+    payload = copy.deepcopy(payload1)
+    for number, member in enumerate(payload["household"]):
+        member["ssn"] = f"99900000{number}"
+    authenticated_client.put(f'/registrations/{registration_id}',
+                             data=payload, content_type="application/json",
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert get_duplicates(authenticated_client, registration_id) == []
+
+
+@pytest.mark.django_db
+def test_duplicates_require_authentication(client, payload1):
+    registration_id = Registration.objects.get().pk
+    response = client.get(f'/registrations/{registration_id}/duplicates')
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
+
+
+@pytest.mark.django_db
+def test_index_match_keys_command(authenticated_client):
+    Registration.objects.bulk_create(
+        Registration(original_data=GOOD_PAYLOAD, latest_data=GOOD_PAYLOAD)
+        for _ in range(3))
+    assert MatchKey.objects.count() == 6
+    MatchKey.objects.all().delete()
+
+    out = io.StringIO()
+    call_command('index_match_keys', batch_size=2, stdout=out)
+    assert "indexed 3 registrations" in out.getvalue()
+    assert MatchKey.objects.count() == 6
+    registration_id = Registration.objects.order_by('pk').first().pk
+    assert len(get_duplicates(authenticated_client, registration_id)) == 2
+
+
+def get_stats(client, disaster_id):
+    response = client.get(f'/disasters/{disaster_id}/stats',
+                          HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+    return response.json()
+
+
+def statistic_counters():
+    return set(DisasterStatistic.objects.filter(count__gt=0).values_list(
+        'disaster_id', 'county', 'preferred_language',
+        'rules_service_approved', 'user_approved', 'count'))
+
+
+@pytest.mark.django_db
+def test_disaster_stats(authenticated_client):
+    disaster_id = GOOD_PAYLOAD["disaster_id"]
+
+    def spanish(payload):
+        payload.update(preferred_language="es", county="Marin")
+
+    def no_county(payload):
+        del payload["county"]
+        payload["disaster_id"] = float(disaster_id)
+
+    first_id = create_registration(authenticated_client, lambda p: None)
+    spanish_id = create_registration(authenticated_client, spanish)
+    create_registration(authenticated_client, no_county)
+    authenticated_client.put(
+        f'/registrations/{first_id}/status',
+        data={"rules_service_approved": True, "user_approved": False},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+
+    stats = get_stats(authenticated_client, disaster_id)
+    assert stats["total"] == 3
+    assert stats["counts"] == [
+        {"county": None, "preferred_language": "en",
+         "rules_service_approved": None, "user_approved": None, "count": 1},
+        {"county": "Alameda", "preferred_language": "en",
+         "rules_service_approved": True, "user_approved": False, "count": 1},
+        {"county": "Marin", "preferred_language": "es",
+         "rules_service_approved": None, "user_approved": None, "count": 1},
+    ]
+    assert get_stats(authenticated_client, disaster_id + 1)["total"] == 0
+
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    payload["county"] = "Marin"
+    authenticated_client.put(f'/registrations/{spanish_id}', data=payload,
+                             content_type="application/json",
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    authenticated_client.delete(f'/registrations/{first_id}',
+                                HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    stats = get_stats(authenticated_client, disaster_id)
+    assert stats["total"] == 2
+    assert [(c["county"], c["preferred_language"], c["count"])
+            for c in stats["counts"]] == [(None, "en", 1), ("Marin", "en", 1)]
+
+
+@pytest.mark.django_db
+def test_disaster_stats_follow_bulk_writes(authenticated_client):
+    response = authenticated_client.post(
+        '/registrations/bulk', data=[GOOD_PAYLOAD] * 3,
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    ids = [result["id"] for result in response.json()]
+    authenticated_client.put(
+        '/registrations/status',
+        data={"registrations": [
+            {"id": ids[0], "rules_service_approved": True,
+             "user_approved": True},
+            {"id": ids[1], "rules_service_approved": False,
+             "user_approved": True}]},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    stats = get_stats(authenticated_client, GOOD_PAYLOAD["disaster_id"])
+    assert sorted((c["rules_service_approved"], c["count"])
+                  for c in stats["counts"]
+                  if c["rules_service_approved"] is not None) == \
+        [(False, 1), (True, 1)]
+
+    authenticated_client.put(
+        '/registrations/status',
+        data={"filter": {"disaster_id": GOOD_PAYLOAD["disaster_id"]},
+              "rules_service_approved": True, "user_approved": False},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    stats = get_stats(authenticated_client, GOOD_PAYLOAD["disaster_id"])
+    assert stats["counts"] == [
+        {"county": "Alameda", "preferred_language": "en",
+         "rules_service_approved": True, "user_approved": False, "count": 3}]
+
+
+@pytest.mark.django_db
+def test_reconcile_statistics_command(authenticated_client, payload1,
+                                      payload2):
+    def other_disaster_without_county(payload):
+        del payload["county"]
+        payload["disaster_id"] = 7
+
+    create_registration(authenticated_client, other_disaster_without_county)
+    create_registration(authenticated_client,
+                        lambda p: p.update(disaster_id=2 ** 40))
+    counters = statistic_counters()
+    assert len(counters) == 2
+
+    DisasterStatistic.objects.update(count=0)
+    out = io.StringIO()
+    call_command('reconcile_statistics', stdout=out)
+    assert "Rebuilt 2" in out.getvalue()
+    assert statistic_counters() == counters
+
+
+@pytest.mark.django_db
+def test_disaster_stats_require_authentication(client):
+    response = client.get('/disasters/1/stats')
+    assert response.status_code in (
+        status.HTTP_401_UNAUTHORIZED, status.HTTP_403_FORBIDDEN)
 
 
 @pytest.fixture
-def authenticated_client(client):
-    get_user_model().objects.create_superuser(
-            username=TEST_USERNAME,
-            password=TEST_PASSWORD,
-            email="admin@example.com")
-    return client
+def partitioned():
+    if not partitions.is_partitioned():
+        pytest.skip("The registration table is not partitioned")
+
+
+def disaster_registration(disaster_id):
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    payload["disaster_id"] = disaster_id
+    return Registration(original_data=payload, latest_data=payload)
+
+
+def partitions_by_id():
+    """
+    Map each registration id to the table its row is stored in
+    """
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, tableoid::regclass::text FROM registration")
+        return dict(cursor.fetchall())
+
+
+@pytest.mark.django_db
+def test_registrations_are_stored_by_disaster(partitioned):
+    first = disaster_registration(1)
+    first.save()
+    second, unknown = Registration.objects.bulk_create(
+        [disaster_registration(2), disaster_registration(2.5)])
+
+    assert partitions_by_id() == {
+        first.pk: 'registration_disaster_1',
+        second.pk: 'registration_disaster_2',
+        unknown.pk: 'registration_default',
+    }
+
+
+@pytest.mark.django_db
+def test_disaster_search_scans_one_partition(partitioned,
+                                             authenticated_client):
+    Registration.objects.bulk_create([disaster_registration(1),
+                                      disaster_registration(2),
+                                      disaster_registration(None)])
+
+    plan = Registration.objects.filter(disaster_id=2).explain()
+    assert 'registration_disaster_2' in plan
+    assert 'registration_disaster_1' not in plan
+    assert 'registration_default' not in plan
+
+    response = authenticated_client.get(
+        '/registrations?disaster_id=2', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert [r["latest_data"]["disaster_id"] for r in response.json()] == [2]
+
+
+@pytest.mark.django_db
+def test_disaster_change_moves_registration(partitioned, authenticated_client):
+    instance = disaster_registration(1)
+    instance.save()
+
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    payload["disaster_id"] = 3
+    response = authenticated_client.put(
+        f'/registrations/{instance.pk}', data=payload,
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == 200
+    assert partitions_by_id() == {instance.pk: 'registration_disaster_3'}
+
+
+@pytest.mark.django_db
+def test_partitions_are_remembered_once_committed(partitioned):
+    disaster_registration(5).save()
+    # The test's transaction has not committed, so it could still roll the
+    # partition back
+    assert ('default', 5) not in partitions._known_partitions
+    run_on_commit()
+    assert ('default', 5) in partitions._known_partitions
+
+
+@pytest.mark.django_db
+def test_new_partition_takes_over_default_rows(partitioned):
+    # As if the transaction that created the partition had been rolled back
+    partitions._known_partitions.add(('default', 4))
+    stray = disaster_registration(4)
+    stray.save()
+    assert partitions_by_id() == {stray.pk: 'registration_default'}
+
+    partitions._known_partitions.clear()
+    later = disaster_registration(4)
+    later.save()
+    assert partitions_by_id() == {stray.pk: 'registration_disaster_4',
+                                  later.pk: 'registration_disaster_4'}
+    assert Registration.objects.filter(disaster_id=4).count() == 2
+
+
+def get_registration(client, registration_id, **extra):
+    return client.get(f'/registrations/{registration_id}',
+                      HTTP_AUTHORIZATION=TEST_AUTHORIZATION, **extra)
+
+
+@pytest.mark.django_db
+def test_archive_disaster(authenticated_client):
+    edited_id = create_registration(authenticated_client,
+                                    lambda p: p.update(disaster_id=7))
+    approved_id = create_registration(authenticated_client,
+                                      lambda p: p.update(disaster_id=7))
+    open_id = create_registration(authenticated_client,
+                                  lambda p: p.update(disaster_id=8))
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    payload.update(disaster_id=7, county="Marin")
+    payload["household"][0]["last_name"] = "Jones"
+    authenticated_client.put(f'/registrations/{edited_id}', data=payload,
+                             content_type="application/json",
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    authenticated_client.put(
+        f'/registrations/{approved_id}/status',
+        data={"rules_service_approved": True, "user_approved": True},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    before = {registration_id: get_registration(authenticated_client,
+                                                registration_id)
+              for registration_id in (edited_id, approved_id)}
+    counters = statistic_counters()
+
+    out = io.StringIO()
+    call_command('archive_disaster', '7', '--batch-size', '1', stdout=out)
+    assert "archived 2 registrations" in out.getvalue()
+
+    assert list(Registration.objects.values_list('pk', flat=True)) == \
+        [open_id]
+    assert not MatchKey.objects.filter(disaster_id=7).exists()
+    assert ArchivedRegistration.objects.get(
+        pk=approved_id).packed_latest_data_delta is None
+    if partitions.is_partitioned():
+        assert "Dropped the partition" in out.getvalue()
+        assert 'registration_disaster_7' not in partitions_by_id().values()
+
+    # Archived registrations read the same as before
+    for registration_id, response in before.items():
+        archived = get_registration(authenticated_client, registration_id)
+        assert archived.status_code == status.HTTP_200_OK
+        assert archived.json() == response.json()
+        assert get_registration(
+            authenticated_client, registration_id,
+            HTTP_IF_NONE_MATCH=response['ETag']).status_code == \
+            status.HTTP_304_NOT_MODIFIED
+    response = get_registration(
+        authenticated_client, f'{edited_id}?fields=id,'
+        'latest_data.household.0.last_name,latest_data.household.9')
+    assert response.json() == {"id": edited_id,
+                               "latest_data.household.0.last_name": "Jones",
+                               "latest_data.household.9": None}
+
+    # ... but they cannot be changed
+    response = authenticated_client.put(
+        f'/registrations/{edited_id}', data=payload,
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    # ... and are still counted
+    assert statistic_counters() == counters
+    call_command('reconcile_statistics', stdout=io.StringIO())
+    assert statistic_counters() == counters
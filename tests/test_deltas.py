@@ -0,0 +1,67 @@
+import copy
+import json
+
+import pytest
+
+from dsnap_registration.deltas import PatchError, apply_patch, make_patch
+
+from test_api import GOOD_PAYLOAD
+
+
+def edited_payload():
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    payload["county"] = "Cuyahoga"
+    payload["phone"] = None
+    del payload["preferred_language"]
+    payload["household"][0]["last_name"] = "Jones"
+    payload["household"].append({"first_name": "Sam", "last_name": "Jones"})
+    payload["a/b~c"] = {"nested": [1, 2]}
+    return payload
+
+
+@pytest.mark.parametrize("source,target", [
+    (GOOD_PAYLOAD, GOOD_PAYLOAD),
+    (GOOD_PAYLOAD, edited_payload()),
+    (edited_payload(), GOOD_PAYLOAD),
+    ([1, 2, 3], [1]),
+    ([1], [3, 2, 1]),
+    ({"x": 1}, {"x": 1.0}),
+    ({"x": 1}, {"x": True}),
+    ({"x": [1]}, {"x": {"0": 1}}),
+    ({"x": 1}, None),
+])
+def test_patch_round_trip(source, target):
+    patched = apply_patch(source, make_patch(source, target))
+    # Compared as JSON, where 1, 1.0 and true differ
+    assert json.dumps(patched, sort_keys=True) == \
+        json.dumps(target, sort_keys=True)
+
+
+def test_patch_is_minimal():
+    source = copy.deepcopy(GOOD_PAYLOAD)
+    target = copy.deepcopy(GOOD_PAYLOAD)
+    target["household"][0]["last_name"] = "Jones"
+    assert make_patch(source, target) == [
+        {"op": "replace", "path": "/household/0/last_name", "value": "Jones"}]
+    assert make_patch(source, copy.deepcopy(source)) == []
+
+
+def test_apply_patch_does_not_modify_document():
+    source = copy.deepcopy(GOOD_PAYLOAD)
+    apply_patch(source, make_patch(source, edited_payload()))
+    assert source == GOOD_PAYLOAD
+
+
+@pytest.mark.parametrize("patch", [
+    [{"op": "move", "from": "/a", "path": "/b"}],
+    [{"op": "remove", "path": "/missing"}],
+    [{"op": "replace", "path": "/a/0", "value": 1}],
+    [{"op": "add", "path": "/list/5", "value": 1}],
+    [{"op": "add", "path": "/list/01", "value": 1}],
+    [{"op": "add", "path": "a", "value": 1}],
+    [{"op": "add", "path": "/a"}],
+    [{"op": "remove", "path": ""}],
+])
+def test_apply_patch_rejects_invalid_operations(patch):
+    with pytest.raises(PatchError):
+        apply_patch({"a": 1, "list": [0]}, patch)
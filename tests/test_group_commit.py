@@ -0,0 +1,175 @@
+import threading
+import time
+from unittest import mock
+
+import pytest
+from django.db import DatabaseError, connection
+from django.test import Client
+from rest_framework import status
+
+from dsnap_registration.group_commit import Batch, GroupCommitter
+from dsnap_registration.models import MatchKey, Registration
+
+from test_api import GOOD_PAYLOAD
+
+
+@pytest.fixture
+def batches():
+    """
+    Records the size of every batch written
+    """
+    sizes = []
+    write = Batch.write
+
+    def spy(self):
+        sizes.append(len(self.registrations))
+        return write(self)
+
+    with mock.patch.object(Batch, 'write', spy):
+        yield sizes
+
+
+def post_registration(client):
+    return client.post('/registrations', data=GOOD_PAYLOAD,
+                       content_type="application/json")
+
+
+@pytest.mark.django_db
+def test_group_commit_is_off_by_default(client, batches):
+    assert post_registration(client).status_code == status.HTTP_201_CREATED
+    assert batches == []
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_creates_are_committed_together(settings, batches):
+    settings.GROUP_COMMIT_WINDOW = 0.5
+    count = 8
+    barrier = threading.Barrier(count)
+    responses = []
+
+    def create():
+        barrier.wait()
+        responses.append(post_registration(Client()))
+        connection.close()
+
+    threads = [threading.Thread(target=create) for _ in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert [r.status_code for r in responses] == \
+        [status.HTTP_201_CREATED] * count
+    ids = {r.json()["id"] for r in responses}
+    assert set(Registration.objects.values_list('pk', flat=True)) == ids
+    assert sum(batches) == count
+    assert max(batches) > 1
+    # The side tables are written with the batch
+    assert set(MatchKey.objects.values_list('registration_id',
+                                            flat=True)) == ids
+
+
+@pytest.mark.django_db
+def test_full_batches_do_not_wait(settings, client, batches):
+    settings.GROUP_COMMIT_WINDOW = 10
+    settings.GROUP_COMMIT_MAX_SIZE = 1
+    start = time.monotonic()
+    assert post_registration(client).status_code == status.HTTP_201_CREATED
+    assert time.monotonic() - start < 5
+    assert batches == [1]
+
+
+@pytest.mark.django_db
+def test_failed_batches_are_written_one_by_one(settings, client):
+    settings.GROUP_COMMIT_WINDOW = 0.01
+    with mock.patch.object(Registration.objects, 'bulk_create',
+                           side_effect=DatabaseError):
+        response = post_registration(client)
+    assert response.status_code == status.HTTP_201_CREATED
+    assert Registration.objects.filter(pk=response.json()["id"]).exists()
+
+
+def test_batches_close_when_full():
+    committer = GroupCommitter()
+    created = []
+
+    class FakeRegistration:
+        def __init__(self, number):
+            self.number = number
+
+    def write(batch):
+        created.append([r.number for r in batch.registrations])
+        batch.done.set()
+
+    with mock.patch.object(Batch, 'write', write):
+        threads = [threading.Thread(
+            target=committer.create, args=(FakeRegistration(number), 5, 2))
+            for number in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=3)
+    assert sorted(len(batch) for batch in created) == [2, 2]
+
+
+class LeaderKilled(BaseException):
+    """
+    Stands in for GreenletExit or gevent.Timeout
+    """
+
+
+class FakeRegistration:
+    def __init__(self, saved):
+        self.pk = None
+        self._state = mock.Mock(adding=True)
+        self.saved = saved
+
+    def save(self, force_insert=False):
+        self.saved.append(self)
+
+
+def run_together(leader, follower, delay=0.05):
+    threads = [threading.Thread(target=leader)]
+    threads[0].start()
+    time.sleep(delay)
+    threads.append(threading.Thread(target=follower))
+    threads[1].start()
+    for thread in threads:
+        thread.join(timeout=10)
+    assert not any(thread.is_alive() for thread in threads)
+
+
+def test_followers_go_on_when_the_leader_dies():
+    committer = GroupCommitter()
+    saved = []
+    leader, follower = FakeRegistration(saved), FakeRegistration(saved)
+    killed = []
+
+    def lead():
+        try:
+            committer.create(leader, 0.2, 10)
+        except LeaderKilled:
+            killed.append(True)
+
+    with mock.patch.object(Batch, 'write', side_effect=LeaderKilled):
+        run_together(lead, lambda: committer.create(follower, 0.2, 10))
+    assert killed
+    assert saved == [follower]
+
+
+def test_followers_stop_waiting_for_a_stuck_leader(settings):
+    settings.GROUP_COMMIT_TIMEOUT = 0
+    committer = GroupCommitter()
+    saved = []
+    written = []
+    leader, follower = FakeRegistration(saved), FakeRegistration(saved)
+
+    def write(batch):
+        written.append(list(batch.registrations))
+
+    with mock.patch.object(Batch, 'write', write):
+        run_together(lambda: committer.create(leader, 1, 10),
+                     lambda: committer.create(follower, 0.1, 10))
+    # The follower took its registration back before the batch was written
+    assert saved == [follower]
+    assert written == [[leader]]
@@ -0,0 +1,132 @@
+import collections
+import datetime
+import decimal
+import io
+import json
+import os
+
+import pytest
+from django.utils.translation import gettext_lazy
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from dsnap_registration import parsers, renderers
+from dsnap_registration.parsers import FastJSONParser
+from dsnap_registration.renderers import FastJSONRenderer
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+
+UTC = datetime.timezone.utc
+
+
+@pytest.fixture(params=['orjson', 'stdlib'])
+def json_backend(request, monkeypatch):
+    """
+    Run the test with orjson, and again as if it were not installed
+    """
+    if request.param == 'orjson':
+        pytest.importorskip('orjson')
+    else:
+        monkeypatch.setattr(parsers, 'orjson', None)
+        monkeypatch.setattr(renderers, 'orjson', None)
+    return request.param
+
+
+def load_example():
+    with open(EXAMPLE_PATH) as f:
+        return json.load(f)
+
+
+def render_data():
+    registration = {
+        "id": 7,
+        "original_data": load_example(),
+        "latest_data": load_example(),
+        "rules_service_approved": None,
+        "user_approved": True,
+        "approved_by": "caseworker",
+        "created_at": datetime.datetime(2019, 3, 1, 12, 30, 5, 123456,
+                                        tzinfo=UTC),
+        "approved_at": datetime.datetime(2019, 3, 1, 12, 30, tzinfo=UTC),
+        "modified_at": None,
+    }
+    return [
+        registration,
+        {"date": datetime.date(2019, 3, 1), "time": datetime.time(8, 15),
+         "naive": datetime.datetime(2019, 3, 1, 8, 15, 0, 500),
+         "duration": datetime.timedelta(hours=1, seconds=3),
+         "decimal": decimal.Decimal("12.50"), "float": 100.25,
+         "lazy": gettext_lazy("This field is required."),
+         "text": "Zoë     \U0001f600 \"quoted\" \\",
+         "nested": [[], {}, None, False, -0.0, 2 ** 63 - 1]},
+        {"big": 2 ** 70},
+    ]
+
+
+@pytest.mark.parametrize('data', render_data())
+def test_renderer_output_matches_drf(json_backend, data):
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+@pytest.mark.parametrize('data', [
+    {"small": 1e-05, "large": 1e+16, "huge": -1.5e+300, "tiny": 5e-324},
+    {"in_range": [1e-4, 9999999999999998.0, 0.1, -0.0]},
+    {"decimal": decimal.Decimal("1E+20")},
+    {1e-07: "float key"},
+    [collections.OrderedDict(nested=(2.5, 1e+20))],
+    1e+100,
+])
+def test_renderer_floats_match_drf(json_backend, data):
+    assert FastJSONRenderer().render(data) == JSONRenderer().render(data)
+
+
+@pytest.mark.parametrize('value', [float('nan'), float('inf'), -float('inf')])
+def test_renderer_refuses_non_finite_floats_like_drf(json_backend, value):
+    data = {"values": [1.5, value]}
+    with pytest.raises(ValueError) as expected:
+        JSONRenderer().render(data)
+    with pytest.raises(ValueError) as actual:
+        FastJSONRenderer().render(data)
+    assert str(actual.value) == str(expected.value)
+
+
+def test_renderer_refuses_circular_data_like_drf(json_backend):
+    data = {"values": [1]}
+    data["values"].append(data)
+    with pytest.raises(ValueError, match="Circular reference"):
+        FastJSONRenderer().render(data)
+
+
+def test_renderer_indent_matches_drf(json_backend):
+    data = render_data()[0]
+    media_type = 'application/json; indent=4'
+    assert FastJSONRenderer().render(data, media_type) == \
+        JSONRenderer().render(data, media_type)
+
+
+@pytest.mark.parametrize('body', [
+    json.dumps(load_example()).encode(),
+    b'{"amount": 12.5, "missing": null, "ok": true, "n": -3}',
+    b'{"disaster_id": 123456789012345678901234567890}',
+    '{"name": "Zoë  "}'.encode(),
+    b'[1, 2.0, 1e400]',
+])
+def test_parser_result_matches_drf(json_backend, body):
+    assert FastJSONParser().parse(io.BytesIO(body)) == \
+        JSONParser().parse(io.BytesIO(body))
+
+
+@pytest.mark.parametrize('body', [
+    b'{"a": 1',
+    b'{"a": NaN}',
+    b'\xef\xbb\xbf{}',
+    b'{"a": "\xff"}',
+])
+def test_parser_errors_match_drf(json_backend, body):
+    with pytest.raises(ParseError) as expected:
+        JSONParser().parse(io.BytesIO(body))
+    with pytest.raises(ParseError) as actual:
+        FastJSONParser().parse(io.BytesIO(body))
+    assert actual.value.detail == expected.value.detail
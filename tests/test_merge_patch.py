@@ -0,0 +1,152 @@
+import copy
+import json
+
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from dsnap_registration.models import MatchKey, Registration
+
+from test_api import GOOD_PAYLOAD, TEST_AUTHORIZATION
+
+MERGE_PATCH = 'application/merge-patch+json'
+
+# The examples of RFC 7396, appendix A: (target, patch, result)
+RFC_EXAMPLES = [
+    ({"a": "b"}, {"a": "c"}, {"a": "c"}),
+    ({"a": "b"}, {"b": "c"}, {"a": "b", "b": "c"}),
+    ({"a": "b"}, {"a": None}, {}),
+    ({"a": "b", "b": "c"}, {"a": None}, {"b": "c"}),
+    ({"a": ["b"]}, {"a": "c"}, {"a": "c"}),
+    ({"a": "c"}, {"a": ["b"]}, {"a": ["b"]}),
+    ({"a": {"b": "c"}}, {"a": {"b": "d", "c": None}}, {"a": {"b": "d"}}),
+    ({"a": [{"b": "c"}]}, {"a": [1]}, {"a": [1]}),
+    (["a", "b"], ["c", "d"], ["c", "d"]),
+    ({"a": "b"}, ["c"], ["c"]),
+    ({"a": "foo"}, None, None),
+    ({"a": "foo"}, "bar", "bar"),
+    ({"e": None}, {"a": 1}, {"e": None, "a": 1}),
+    ([1, 2], {"a": "b", "c": None}, {"a": "b"}),
+    ({}, {"a": {"bb": {"ccc": None}}}, {"a": {"bb": {}}}),
+]
+
+
+@pytest.fixture
+def registration_id(authenticated_client):
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    return response.json()["id"]
+
+
+def patch(client, registration_id, body, **extra):
+    return client.patch(f'/registrations/{registration_id}',
+                        data=json.dumps(body), content_type=MERGE_PATCH,
+                        HTTP_AUTHORIZATION=TEST_AUTHORIZATION, **extra)
+
+
+def disaster_total(client, disaster_id):
+    return client.get(f'/disasters/{disaster_id}/stats',
+                      HTTP_AUTHORIZATION=TEST_AUTHORIZATION).json()["total"]
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('target,merge_patch,result', RFC_EXAMPLES)
+def test_jsonb_merge_patch(target, merge_patch, result):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT jsonb_merge_patch(%s::jsonb, %s::jsonb)",
+                       [json.dumps(target), json.dumps(merge_patch)])
+        assert cursor.fetchone()[0] == result
+
+
+@pytest.mark.django_db
+def test_merge_patch(authenticated_client, registration_id):
+    with CaptureQueriesContext(connection) as queries:
+        response = patch(authenticated_client, registration_id,
+                         {"phone": "2165550000", "email": None,
+                          "residential_address": {"street2": "Apt 2"}})
+    assert response.status_code == status.HTTP_200_OK
+    assert response['ETag']
+
+    expected = copy.deepcopy(GOOD_PAYLOAD)
+    expected["phone"] = "2165550000"
+    del expected["email"]
+    expected["residential_address"]["street2"] = "Apt 2"
+    assert response.json()["latest_data"] == expected
+    assert Registration.objects.get().latest_data == expected
+    # Merged by the UPDATE, without reading the document first; the
+    # search fields and match keys did not change
+    assert not any(query['sql'].startswith('SELECT') and
+                   'latest_data' in query['sql']
+                   for query in queries.captured_queries)
+    assert not any('registration_match_key' in query['sql']
+                   for query in queries.captured_queries)
+
+    # Patches to different members both apply
+    patch(authenticated_client, registration_id, {"county": "Marin"})
+    data = Registration.objects.get().latest_data
+    assert (data["county"], data["phone"]) == ("Marin", "2165550000")
+
+    revisions = authenticated_client.get(
+        f'/registrations/{registration_id}/revisions',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION).json()
+    assert [revision["delta"] for revision in revisions][-1] == [
+        {"op": "replace", "path": "/county", "value": "Marin"}]
+
+
+@pytest.mark.django_db
+def test_merge_patch_keeps_side_tables_in_step(authenticated_client,
+                                               registration_id):
+    household = copy.deepcopy(GOOD_PAYLOAD["household"])
+    household[0].update(last_name="Roe", ssn="323456789")
+    response = patch(authenticated_client, registration_id,
+                     {"disaster_id": 35, "state_id": "xyz1234",
+                      "household": household})
+    assert response.status_code == status.HTTP_200_OK
+
+    registration = Registration.objects.get()
+    assert (registration.disaster_id, registration.state_id,
+            registration.registrant_ssn,
+            registration.registrant_last_name) == \
+        (35, "XYZ1234", "323456789", "ROE")
+    assert set(MatchKey.objects.values_list('disaster_id', flat=True)) == {35}
+    assert MatchKey.objects.filter(value="323456789").exists()
+    assert disaster_total(authenticated_client, 34) == 0
+    assert disaster_total(authenticated_client, 35) == 1
+
+
+@pytest.mark.django_db
+def test_invalid_merge_patch_is_rolled_back(authenticated_client,
+                                            registration_id):
+    modified_at = Registration.objects.get().modified_at
+    for body in ({"disaster_id": None}, {"unknown": 1}, ["a list"]):
+        response = patch(authenticated_client, registration_id, body)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert response.json()["Invalid request"][0].startswith(
+            "Validation failed")
+
+    registration = Registration.objects.get()
+    assert registration.latest_data["disaster_id"] == 34
+    assert registration.modified_at == modified_at
+    assert not registration.revisions.exists()
+
+
+@pytest.mark.django_db
+def test_merge_patch_of_missing_registration(authenticated_client):
+    response = patch(authenticated_client, 0, {"phone": "2165550000"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_merge_patch_preconditions(authenticated_client, registration_id):
+    etag = authenticated_client.get(
+        f'/registrations/{registration_id}',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)['ETag']
+    response = patch(authenticated_client, registration_id,
+                     {"phone": "2165550000"}, HTTP_IF_MATCH=etag)
+    assert response.status_code == status.HTTP_200_OK
+
+    response = patch(authenticated_client, registration_id,
+                     {"phone": "2165551111"}, HTTP_IF_MATCH=etag)
+    assert response.status_code == status.HTTP_412_PRECONDITION_FAILED
+    assert Registration.objects.get().latest_data["phone"] == "2165550000"
@@ -0,0 +1,195 @@
+import base64
+import json
+import re
+import time
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+
+from dsnap_registration import metrics
+
+from test_api import GOOD_PAYLOAD, TEST_AUTHORIZATION
+
+# A pid no process has (above the kernel's pid_max)
+EXITED_PID = 2 ** 22 + 1
+
+
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    monkeypatch.setattr(metrics, '_registry', None)
+
+
+@pytest.fixture
+def metrics_dir(settings, tmpdir, monkeypatch):
+    settings.METRICS_DIR = str(tmpdir)
+    # No background flushing; /metrics flushes this process itself
+    monkeypatch.setattr(metrics, 'start_flusher', lambda: None)
+    return tmpdir
+
+
+def scrape(client):
+    response = client.get('/metrics', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == 200
+    assert response['Content-Type'].startswith('text/plain; version=0.0.4')
+    return response.content.decode()
+
+
+def sample(text, name, **labels):
+    """
+    The value of the sample of `name` with exactly `labels`
+    """
+    label_text = ','.join(f'{key}="{value}"' for key, value in labels.items())
+    pattern = re.escape(f'{name}{{{label_text}}}' if labels else name)
+    match = re.search(rf'^{pattern} (\S+)$', text, re.MULTILINE)
+    assert match, f"No sample {name} {labels}"
+    return float(match.group(1))
+
+
+@pytest.mark.django_db
+def test_request_metrics(authenticated_client):
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    assert response.status_code == 201
+    registration_id = response.json()['id']
+    authenticated_client.get(f'/registrations/{registration_id}',
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    authenticated_client.get('/registrations/0',
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    authenticated_client.get('/no-such-page')
+
+    text = scrape(authenticated_client)
+    assert '# TYPE dsnap_http_request_duration_seconds histogram' in text
+    assert sample(text, 'dsnap_http_requests_total', view='RegistrationList',
+                  method='POST', status='201') == 1
+    assert sample(text, 'dsnap_http_requests_total',
+                  view='RegistrationDetail', method='GET', status='200') == 1
+    assert sample(text, 'dsnap_http_requests_total',
+                  view='RegistrationDetail', method='GET', status='404') == 1
+    assert sample(text, 'dsnap_http_requests_total', view='unmatched',
+                  method='GET', status='404') == 1
+
+    assert sample(text, 'dsnap_http_request_duration_seconds_count',
+                  view='RegistrationDetail', method='GET') == 2
+    assert sample(text, 'dsnap_http_request_duration_seconds_bucket',
+                  view='RegistrationDetail', method='GET', le='+Inf') == 2
+    assert sample(text, 'dsnap_http_request_duration_seconds_sum',
+                  view='RegistrationDetail', method='GET') > 0
+    # Submissions are validated; reads are not
+    assert sample(text, 'dsnap_http_request_phase_seconds_count',
+                  view='RegistrationList', method='POST',
+                  phase='validation') == 1
+    assert sample(text, 'dsnap_http_request_phase_seconds_count',
+                  view='RegistrationDetail', method='GET',
+                  phase='authentication') == 2
+    assert 'view="RegistrationDetail",method="GET",phase="validation"' \
+        not in text
+    assert sample(text, 'dsnap_http_request_db_queries_count',
+                  view='RegistrationList', method='POST') == 1
+    assert sample(text, 'dsnap_http_request_db_queries_bucket',
+                  view='RegistrationList', method='POST', le='0') == 0
+    assert sample(text, 'dsnap_http_response_size_bytes_sum',
+                  view='RegistrationList', method='POST') == \
+        len(response.content)
+    assert sample(text, 'dsnap_db_pool_connections', alias='default',
+                  state='in_use') >= 1
+
+
+@pytest.mark.django_db
+def test_metrics_are_added_up_across_processes(authenticated_client,
+                                               metrics_dir):
+    authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                              content_type="application/json")
+    # What an exited worker left behind
+    buckets = metrics.METRICS['dsnap_http_request_duration_seconds'].buckets
+    metrics_dir.join(f'metrics-{EXITED_PID}.json').write(json.dumps({
+        'pid': EXITED_PID,
+        'samples': [
+            ['dsnap_http_requests_total',
+             ['RegistrationList', 'POST', '201'], 4],
+            ['dsnap_http_request_duration_seconds',
+             ['RegistrationList', 'POST'],
+             [0] * (len(buckets) - 1) + [3, 1, 40.5]],
+        ],
+        'gauges': [
+            ['dsnap_db_pool_connections', ['default', 'in_use'], 100],
+        ],
+    }))
+    metrics_dir.join('unrelated.txt').write('ignored')
+
+    text = scrape(authenticated_client)
+    assert sample(text, 'dsnap_http_requests_total', view='RegistrationList',
+                  method='POST', status='201') == 5
+    assert sample(text, 'dsnap_http_request_duration_seconds_bucket',
+                  view='RegistrationList', method='POST', le='10') == 4
+    assert sample(text, 'dsnap_http_request_duration_seconds_count',
+                  view='RegistrationList', method='POST') == 5
+    assert sample(text, 'dsnap_http_request_duration_seconds_sum',
+                  view='RegistrationList', method='POST') > 40.5
+    # Gauges of exited processes are dropped
+    assert sample(text, 'dsnap_db_pool_connections', alias='default',
+                  state='in_use') < 100
+    # This process wrote its own snapshot
+    assert len(metrics_dir.listdir('metrics-*.json')) == 2
+
+
+@pytest.mark.django_db
+def test_metrics_need_staff(client):
+    response = client.get('/metrics')
+    assert response.status_code == 401
+
+    get_user_model().objects.create_user(username="caseworker",
+                                         password="caseworker")
+    response = client.get('/metrics', HTTP_AUTHORIZATION="Basic {}".format(
+        base64.b64encode(b"caseworker:caseworker").decode()))
+    assert response.status_code == 403
+
+
+def test_render_escapes_label_values():
+    text = metrics.render({
+        ('dsnap_http_requests_total', ('a"b\\c\nd', 'GET', '200')): 2,
+    })
+    assert text == (
+        '# HELP dsnap_http_requests_total HTTP requests handled\n'
+        '# TYPE dsnap_http_requests_total counter\n'
+        'dsnap_http_requests_total{view="a\\"b\\\\c\\nd",method="GET",'
+        'status="200"} 2\n')
+
+
+def test_unknown_methods_share_a_label(rf):
+    state = metrics.RequestState()
+    request = rf.generic('BREW', '/')
+    metrics.MetricsMiddleware(None).record(request, HttpResponse(), state,
+                                           0.01)
+    text = metrics.render(metrics.merge([metrics.snapshot()]))
+    assert sample(text, 'dsnap_http_requests_total', view='unmatched',
+                  method='other', status='200') == 1
+
+
+@pytest.mark.django_db
+def test_server_timing(authenticated_client, settings):
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    timings = dict(re.findall(r'(\w+);dur=([\d.]+)',
+                              response['Server-Timing']))
+    assert list(timings) == ['auth', 'validate', 'db', 'serialize', 'render',
+                             'total']
+    assert float(timings['total']) >= float(timings['db']) > 0
+    assert re.search(r'db;dur=[\d.]+;desc="\d+ queries"',
+                     response['Server-Timing'])
+
+    settings.SERVER_TIMING = False
+    response = authenticated_client.get('/registrations',
+                                        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert 'Server-Timing' not in response
+
+
+def test_nested_phases_are_timed_once():
+    metrics._state.request = state = metrics.RequestState()
+    try:
+        with metrics.phase('serialization'):
+            with metrics.phase('serialization'):
+                time.sleep(0.01)
+    finally:
+        metrics._state.request = None
+    assert 0.01 <= state.phases['serialization'] < 0.02
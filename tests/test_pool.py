@@ -0,0 +1,154 @@
+import base64
+import os
+import runpy
+import threading
+import time
+
+import psycopg2
+import pytest
+from django.contrib.auth import get_user_model
+from django.db import connection
+from psycopg2 import extensions
+
+from dsnap_registration_service.postgresql_pool.pool import (ConnectionPool,
+                                                             PoolTimeout)
+
+from test_api import TEST_AUTHORIZATION
+
+
+@pytest.fixture
+def make_pool(django_db_blocker):
+    """
+    Makes pools of real connections to the test database, closing them all
+    at the end of the test
+    """
+    with django_db_blocker.unblock():
+        connection.ensure_connection()
+        params = connection.get_connection_params()
+    made = []
+
+    def make(max_size=2, timeout=1, check_idle_after=30):
+        pool = ConnectionPool(lambda: psycopg2.connect(**params), max_size,
+                              timeout, check_idle_after)
+        made.append(pool)
+        return pool
+
+    yield make
+    for pool in made:
+        pool.close_idle()
+
+
+def test_reuses_connections(make_pool):
+    pool = make_pool()
+    first = pool.acquire()
+    pool.release(first)
+    assert pool.acquire() is first
+    stats = pool.stats()
+    assert (stats['created'], stats['reused']) == (1, 1)
+    assert (stats['open'], stats['in_use'], stats['idle']) == (1, 1, 0)
+
+
+def test_waits_for_a_free_connection(make_pool):
+    pool = make_pool(max_size=2, timeout=0.1)
+    first, _ = pool.acquire(), pool.acquire()
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+
+    pool.timeout = 5
+    threading.Timer(0.05, pool.release, [first]).start()
+    assert pool.acquire() is first
+    assert pool.stats()['created'] == 2
+
+
+def test_connections_stay_bounded_under_concurrency(make_pool):
+    pool = make_pool(max_size=3, timeout=10)
+    errors = []
+
+    def work():
+        try:
+            for _ in range(5):
+                connection = pool.acquire()
+                with connection.cursor() as cursor:
+                    cursor.execute('SELECT pg_sleep(0.001)')
+                connection.commit()
+                pool.release(connection)
+        except Exception as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=work) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    stats = pool.stats()
+    assert not errors
+    assert stats['created'] <= 3
+    assert stats['created'] + stats['reused'] == 100
+    assert (stats['in_use'], stats['waiting']) == (0, 0)
+
+
+def test_released_connections_are_reset(make_pool):
+    pool = make_pool()
+    connection = pool.acquire()
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    assert connection.get_transaction_status() == \
+        psycopg2.extensions.TRANSACTION_STATUS_INTRANS
+    pool.release(connection)
+    assert connection.get_transaction_status() == \
+        psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+    assert pool.acquire() is connection
+    pool.release(connection, discard=True)
+    assert connection.closed
+    assert pool.stats()['open'] == 0
+
+
+def test_broken_idle_connections_are_replaced(make_pool):
+    pool = make_pool(check_idle_after=0)
+    connection = pool.acquire()
+    connection.commit()
+    pid = connection.get_backend_pid()
+    pool.release(connection)
+
+    with make_pool().acquire().cursor() as cursor:
+        cursor.execute('SELECT pg_terminate_backend(%s)', [pid])
+    time.sleep(0.1)
+
+    replacement = pool.acquire()
+    assert replacement is not connection
+    with replacement.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    stats = pool.stats()
+    assert (stats['checked'], stats['discarded'], stats['created']) == \
+        (1, 1, 2)
+
+
+@pytest.mark.django_db
+def test_pool_stats(authenticated_client, client):
+    response = authenticated_client.get(
+        '/pool/stats', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == 200
+    default, = [pool for pool in response.json()
+                if pool["database"] == connection.settings_dict['NAME']]
+    assert default["alias"] == 'default'
+    assert default["in_use"] == 1
+    assert default["max_size"] == 10
+
+    get_user_model().objects.create_user(username="caseworker",
+                                         password="caseworker")
+    response = client.get('/pool/stats', HTTP_AUTHORIZATION="Basic {}".format(
+        base64.b64encode(b"caseworker:caseworker").decode()))
+    assert response.status_code == 403
+
+
+def test_gunicorn_workers_make_psycopg2_cooperative():
+    config = runpy.run_path(os.path.join(os.path.dirname(__file__), '..',
+                                         'gunicorn.conf.py'))
+    assert config['worker_class'] == 'gevent'
+    try:
+        config['post_fork'](server=None, worker=None)
+        assert extensions.get_wait_callback() is not None
+    finally:
+        extensions.set_wait_callback(None)
@@ -0,0 +1,132 @@
+import copy
+import io
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from rest_framework import status
+
+from dsnap_registration.models import Registration, RegistrationRevision
+
+from test_api import GOOD_PAYLOAD, TEST_AUTHORIZATION, TEST_USERNAME
+
+
+def put(client, registration_id, payload):
+    response = client.put(f'/registrations/{registration_id}', data=payload,
+                          content_type="application/json",
+                          HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == status.HTTP_200_OK
+
+
+def get(client, path):
+    return client.get(path, HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+
+
+def edits(count):
+    """
+    `count` successive versions of GOOD_PAYLOAD, each changing the phone
+    number, some also the county
+    """
+    versions = []
+    for index in range(count):
+        payload = copy.deepcopy(GOOD_PAYLOAD)
+        payload["phone"] = f"216555{index:04d}"
+        if index % 3 == 0:
+            payload["county"] = f"County {index}"
+        versions.append(payload)
+    return versions
+
+
+@pytest.mark.django_db
+def test_revisions(authenticated_client):
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    registration_id = response.json()["id"]
+    original = Registration.objects.get(pk=registration_id).latest_data
+    versions = edits(9)
+    for payload in versions:
+        put(authenticated_client, registration_id, payload)
+    # Nothing changed, so no revision, nor any work towards one
+    with CaptureQueriesContext(connection) as queries:
+        put(authenticated_client, registration_id, versions[-1])
+    assert not any('registration_revision' in query['sql'] or
+                   'registration_match_key' in query['sql']
+                   for query in queries.captured_queries)
+    # Neither do status updates
+    authenticated_client.put(
+        f'/registrations/{registration_id}/status',
+        data={"rules_service_approved": True, "user_approved": True},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+
+    response = get(authenticated_client,
+                   f'/registrations/{registration_id}/revisions')
+    assert response.status_code == status.HTTP_200_OK
+    revisions = response.json()
+    assert [revision["number"] for revision in revisions] == \
+        list(range(1, 10))
+    assert revisions[0]["modified_by"] == TEST_USERNAME
+    assert revisions[2]["delta"] == [
+        {"op": "replace", "path": "/phone", "value": "2165550002"}]
+    # Stored as the change undoing it, from the version after it
+    assert RegistrationRevision.objects.get(
+        registration_id=registration_id, number=3).delta == [
+        {"op": "replace", "path": "/phone", "value": "2165550001"}]
+
+    for number, expected in enumerate([original] + versions):
+        response = get(authenticated_client,
+                       f'/registrations/{registration_id}/revisions/{number}')
+        assert response.status_code == status.HTTP_200_OK
+        body = response.json()
+        assert body["number"] == number
+        expected = copy.deepcopy(expected)
+        # Never taken from submissions
+        expected["ebt_card_number"] = None
+        assert body["latest_data"] == expected
+    assert response.json()["modified_at"] == revisions[-1]["modified_at"]
+
+    response = get(authenticated_client,
+                   f'/registrations/{registration_id}/revisions/10')
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_revisions_of_archived_registrations(authenticated_client):
+    payload = copy.deepcopy(GOOD_PAYLOAD)
+    payload.update(disaster_id=7)
+    response = authenticated_client.post('/registrations', data=payload,
+                                         content_type="application/json")
+    registration_id = response.json()["id"]
+    edited = copy.deepcopy(payload)
+    edited["phone"] = "2165559999"
+    put(authenticated_client, registration_id, edited)
+
+    call_command('archive_disaster', '7', stdout=io.StringIO())
+    response = get(authenticated_client,
+                   f'/registrations/{registration_id}/revisions')
+    assert [revision["number"] for revision in response.json()] == [1]
+    response = get(authenticated_client,
+                   f'/registrations/{registration_id}/revisions/1')
+    assert response.json()["latest_data"]["phone"] == "2165559999"
+    response = get(authenticated_client,
+                   f'/registrations/{registration_id}/revisions/0')
+    assert response.json()["latest_data"]["phone"] == GOOD_PAYLOAD["phone"]
+
+
+@pytest.mark.django_db
+def test_revisions_of_missing_registrations(authenticated_client):
+    for path in ('/registrations/0/revisions', '/registrations/0/revisions/0'):
+        response = get(authenticated_client, path)
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+def test_revisions_are_deleted_with_their_registration(authenticated_client):
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    registration_id = response.json()["id"]
+    put(authenticated_client, registration_id, edits(1)[0])
+    authenticated_client.delete(f'/registrations/{registration_id}',
+                                HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert not RegistrationRevision.objects.exists()
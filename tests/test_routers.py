@@ -0,0 +1,134 @@
+from unittest import mock
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+
+from dsnap_registration.authentication import credential_cache
+from dsnap_registration.models import Registration
+from dsnap_registration.routers import (REPLICA, ReplicaRouter,
+                                        check_pin_cache, has_replica,
+                                        pin_cache, replica_reads)
+
+from test_api import GOOD_PAYLOAD, TEST_AUTHORIZATION
+
+
+@pytest.fixture
+def routed_reads():
+    """
+    Records the (model name, alias) of every read the router decides on
+    """
+    routed = []
+    db_for_read = ReplicaRouter.db_for_read
+
+    def spy(self, model, **hints):
+        alias = db_for_read(self, model, **hints)
+        # Pins in the database cache
+        if model.__name__ != 'CacheEntry':
+            routed.append((model.__name__, alias))
+        return alias
+
+    credential_cache.clear()
+    with mock.patch.object(ReplicaRouter, 'db_for_read', spy):
+        yield routed
+
+
+def test_router_without_replica():
+    if has_replica():
+        pytest.skip("REPLICA_DATABASE_URL is set")
+    router = ReplicaRouter()
+    with replica_reads():
+        assert router.db_for_read(Registration) is None
+    assert router.db_for_write(Registration) == 'default'
+
+
+def test_router_with_replica(replica):
+    router = ReplicaRouter()
+    assert router.db_for_read(Registration) is None
+    with replica_reads():
+        assert router.db_for_read(Registration) == REPLICA
+        with replica_reads(False):
+            assert router.db_for_read(Registration) is None
+        assert router.db_for_read(Registration) == REPLICA
+    assert router.db_for_read(Registration) is None
+    assert router.db_for_write(Registration) == 'default'
+    assert router.allow_migrate('default', 'dsnap_registration')
+    assert not router.allow_migrate(REPLICA, 'dsnap_registration')
+
+
+@pytest.mark.django_db
+def test_reads_use_replica(authenticated_client, replica, routed_reads):
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    registration_id = response.json()["id"]
+    # Anonymous submissions do not pin anyone to the primary
+    assert not routed_reads
+
+    response = authenticated_client.get(
+        '/registrations', HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert [r["id"] for r in response.json()] == [registration_id]
+    response = authenticated_client.get(
+        f'/registrations/{registration_id}',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.json()["id"] == registration_id
+    # Authentication reads the primary
+    assert set(routed_reads) == {('User', None), ('Registration', REPLICA)}
+
+
+@pytest.mark.django_db
+def test_writers_read_their_writes(authenticated_client, replica,
+                                   routed_reads):
+    response = authenticated_client.post('/registrations', data=GOOD_PAYLOAD,
+                                         content_type="application/json")
+    registration_id = response.json()["id"]
+    response = authenticated_client.put(
+        f'/registrations/{registration_id}/status',
+        data={"rules_service_approved": True, "user_approved": True},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == 200
+    assert {alias for model, alias in routed_reads} == {None}
+
+    routed_reads.clear()
+    response = authenticated_client.get(
+        f'/registrations/{registration_id}',
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.json()["user_approved"] is True
+    assert {alias for model, alias in routed_reads} == {None}
+
+    # Once the pin expires
+    pin_cache().clear()
+    routed_reads.clear()
+    authenticated_client.get(f'/registrations/{registration_id}',
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert ('Registration', REPLICA) in routed_reads
+
+
+@pytest.mark.django_db
+def test_failed_writes_do_not_pin(authenticated_client, replica,
+                                  routed_reads):
+    response = authenticated_client.put(
+        '/registrations/0/status',
+        data={"rules_service_approved": True, "user_approved": True},
+        content_type="application/json",
+        HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert response.status_code == 404
+
+    routed_reads.clear()
+    authenticated_client.get('/registrations',
+                             HTTP_AUTHORIZATION=TEST_AUTHORIZATION)
+    assert ('Registration', REPLICA) in routed_reads
+
+
+def test_pins_need_a_shared_cache(replica, settings):
+    settings.CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+        'shared': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'replica_pin_cache'},
+    }
+    settings.REPLICA_PIN_CACHE = 'default'
+    with pytest.raises(ImproperlyConfigured):
+        check_pin_cache()
+    settings.REPLICA_PIN_CACHE = 'shared'
+    check_pin_cache()
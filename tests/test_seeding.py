@@ -0,0 +1,102 @@
+import datetime
+import io
+
+import pytest
+from django.core.management import CommandError, call_command
+from django.db import connection
+
+from dsnap_registration.models import (DisasterStatistic, MatchKey,
+                                       Registration)
+from dsnap_registration.seeding import copy_text
+from dsnap_registration.serializers import REGISTRATION_VALIDATOR
+
+
+def seed(*args):
+    call_command('seed_registrations', *args, stdout=io.StringIO())
+
+
+def seeded_rows():
+    """
+    The seeded registrations, with ids counted from the first
+    """
+    rows = list(Registration.objects.order_by('id').values_list(
+        'id', 'latest_data', 'rules_service_approved', 'user_approved',
+        'created_at', 'approved_at'))
+    first_id = rows[0][0]
+    return [(id - first_id, *rest) for id, *rest in rows]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_seed_registrations():
+    seed('120', '--disasters', '3', '--first-disaster-id', '40',
+         '--duplicate-rate', '0.3', '--chunk-size', '50', '--workers', '1')
+
+    registrations = list(Registration.objects.order_by('id'))
+    assert len(registrations) == 120
+    ids = [registration.id for registration in registrations]
+    assert ids == list(range(ids[0], ids[0] + 120))
+    for registration in registrations:
+        assert REGISTRATION_VALIDATOR.error_messages(
+            registration.latest_data) == []
+        assert registration.disaster_id in (40, 41, 42)
+        assert registration.registrant_last_name == \
+            registration.latest_data['household'][0]['last_name'].upper()
+        assert (registration.approved_at is None) == \
+            (registration.user_approved is None)
+
+    # Match keys are loaded, and some registrations have duplicates
+    assert MatchKey.objects.filter(registration_id=ids[0]).exists()
+    assert any(registration.find_duplicates()
+               for registration in registrations[50:])
+    # Statistics count every registration
+    totals = {disaster: 0 for disaster in (40, 41, 42)}
+    for statistic in DisasterStatistic.objects.all():
+        totals[statistic.disaster_id] += statistic.count
+    assert sum(totals.values()) == 120
+    assert totals[40] > totals[42]
+
+    # The id sequence continues after the seeded registrations
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT nextval(pg_get_serial_sequence("
+                       "'registration', 'id'))")
+        assert cursor.fetchone()[0] > ids[-1]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_seed_registrations_is_deterministic():
+    seed('90', '--seed', '7', '--chunk-size', '40', '--workers', '1')
+    single = seeded_rows()
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE registration, registration_match_key, "
+                       "disaster_statistic")
+
+    seed('90', '--seed', '7', '--chunk-size', '40', '--workers', '3')
+    assert seeded_rows() == single
+
+    with connection.cursor() as cursor:
+        cursor.execute("TRUNCATE registration, registration_match_key, "
+                       "disaster_statistic")
+    seed('90', '--seed', '8', '--chunk-size', '40', '--workers', '1')
+    assert seeded_rows() != single
+
+
+def test_copy_text():
+    assert copy_text(None) == '\\N'
+    assert copy_text(True) == 't'
+    assert copy_text(12) == '12'
+    assert copy_text({"a": "tab\there", "b": "back\\slash"}) == \
+        '{"a":"tab\\\\there","b":"back\\\\\\\\slash"}'
+    assert copy_text('line\nbreak') == 'line\\nbreak'
+    assert copy_text(datetime.datetime(2019, 1, 1, 12, 30)) == \
+        '2019-01-01T12:30:00'
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('args', [
+    ['0'],
+    ['10', '--workers', '0'],
+    ['10', '--duplicate-rate', '1.5'],
+])
+def test_seed_registrations_rejects_bad_options(args):
+    with pytest.raises(CommandError):
+        seed(*args)
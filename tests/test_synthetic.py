@@ -0,0 +1,113 @@
+import importlib.util
+import json
+import os
+from collections import Counter
+
+import pytest
+from django.contrib.auth import get_user_model
+from rest_framework import status
+
+from dsnap_registration.models import Registration
+from dsnap_registration.serializers import (REGISTRATION_SCHEMA,
+                                            REGISTRATION_VALIDATOR)
+from dsnap_registration.synthetic import RegistrationGenerator
+
+from test_api import TEST_PASSWORD, TEST_USERNAME
+
+LOADTEST_PATH = os.path.join(os.path.dirname(__file__), '..', 'benchmarks',
+                             'loadtest.py')
+
+
+@pytest.fixture(scope='module')
+def loadtest():
+    spec = importlib.util.spec_from_file_location('loadtest', LOADTEST_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def test_generated_registrations_are_valid():
+    generator = RegistrationGenerator(seed=1, disaster_ids=[7, 8])
+    for registration in generator.registrations(500):
+        assert REGISTRATION_VALIDATOR.error_messages(registration) == []
+        assert registration['disaster_id'] in (7, 8)
+
+
+def test_generated_registrations_are_deterministic():
+    first = list(RegistrationGenerator(seed=42).registrations(20))
+    second = list(RegistrationGenerator(seed=42).registrations(20))
+    other = list(RegistrationGenerator(seed=43).registrations(20))
+    assert first == second
+    assert first != other
+
+
+def test_generated_registrations_vary():
+    registrations = list(RegistrationGenerator(seed=3).registrations(500))
+    household_sizes = Counter(len(r['household']) for r in registrations)
+    assert min(household_sizes) == 1
+    assert max(household_sizes) >= 6
+    jobs = [len(member['jobs']) for r in registrations
+            for member in r['household']]
+    assert 0 in jobs and max(jobs) >= 2
+    pay = {job['pay'] for r in registrations for member in r['household']
+           for job in member['jobs']}
+    assert len(pay) > 100
+    # Children don't work
+    for registration in registrations:
+        for member in registration['household']:
+            if member['dob'] > '2004':
+                assert member['jobs'] == []
+
+
+def test_generator_fills_in_properties_it_has_no_hints_for():
+    schema = dict(REGISTRATION_SCHEMA, properties=dict(
+        REGISTRATION_SCHEMA['properties'],
+        pet_count={"type": "integer", "minimum": 0},
+        shelter_code={"type": "string", "pattern": r"^\d{4}$"},
+    ))
+    registration = RegistrationGenerator(seed=1, schema=schema).registration()
+    assert isinstance(registration['pet_count'], int)
+    assert len(registration['shelter_code']) == 4
+
+
+def test_generator_rejects_patterns_it_cannot_satisfy():
+    schema = {"type": "object",
+              "properties": {"code": {"type": "string",
+                                      "pattern": "^[A-Z]+$"}}}
+    with pytest.raises(ValueError):
+        RegistrationGenerator(schema=schema).registration()
+
+
+def test_loadtest_summary(loadtest):
+    samples = [('GET /registrations', 200, seconds / 1000)
+               for seconds in range(1, 101)]
+    samples.append(('GET /registrations', 429, 0.0005))
+    summary = loadtest.summarize(samples, elapsed=2)['GET /registrations']
+    assert summary['requests'] == 101
+    assert summary['succeeded'] == 100
+    assert summary['statuses'] == {'200': 100, '429': 1}
+    assert summary['succeeded_throughput'] == 50
+    assert summary['latency_ms']['p50'] == 50
+    assert summary['latency_ms']['p95'] == 95
+    assert summary['latency_ms']['p99'] == 99
+    assert summary['latency_ms']['max'] == 100
+
+
+@pytest.mark.django_db(transaction=True)
+def test_loadtest_against_live_server(loadtest, live_server, settings,
+                                      tmpdir):
+    settings.REST_FRAMEWORK = {**settings.REST_FRAMEWORK,
+                               'DEFAULT_THROTTLE_RATES': {}}
+    get_user_model().objects.create_user(username=TEST_USERNAME,
+                                         password=TEST_PASSWORD)
+    output = str(tmpdir.join('loadtest.json'))
+    loadtest.main([live_server.url, '--username', TEST_USERNAME,
+                   '--password', TEST_PASSWORD, '--seed-count', '5',
+                   '--duration', '0.5', '--concurrency', '2',
+                   '--output', output])
+    with open(output) as f:
+        results = json.load(f)
+    endpoints = results['scenarios']['mixed']['endpoints']
+    submitted = endpoints['POST /registrations']
+    assert set(submitted['statuses']) == {str(status.HTTP_201_CREATED)}
+    assert Registration.objects.count() == 5 + submitted['requests']
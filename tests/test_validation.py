@@ -0,0 +1,108 @@
+import copy
+import json
+import os
+
+import pytest
+from jsonschema import Draft7Validator
+
+from dsnap_registration.serializers import (REGISTRATION_BULK_STATUS_SCHEMA,
+                                            REGISTRATION_SCHEMA,
+                                            REGISTRATION_STATUS_SCHEMA)
+from dsnap_registration.validation import CompiledSchema
+
+EXAMPLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'examples',
+                            'request.json')
+
+
+def load_example():
+    with open(EXAMPLE_PATH) as f:
+        return json.load(f)
+
+
+def mutations():
+    """
+    Yield (description, document) pairs covering each keyword the schema uses
+    """
+    def mutated(change):
+        doc = load_example()
+        change(doc)
+        return doc
+
+    yield 'valid', load_example()
+    yield 'missing required', mutated(lambda d: d.pop('disaster_id'))
+    yield 'extra top-level', mutated(lambda d: d.update(EXTRA=1))
+    yield 'wrong type', mutated(lambda d: d.update(county=12))
+    yield 'bool is not a number', mutated(lambda d: d.update(disaster_id=True))
+    yield 'below minimum', mutated(lambda d: d.update(disaster_id=-1))
+    yield 'bad enum', mutated(lambda d: d.update(preferred_language='fr'))
+    yield 'bad pattern', mutated(lambda d: d.update(phone='555'))
+    yield 'null allowed', mutated(lambda d: d.update(phone=None))
+    yield 'anyOf failure', mutated(
+        lambda d: d.update(money_on_hand=-5))
+    yield 'nested ref', mutated(
+        lambda d: d['residential_address'].update(zipcode=94612))
+    yield 'array item', mutated(
+        lambda d: d['household'][1].update(ssn='12-34'))
+    yield 'deep extra', mutated(
+        lambda d: d['household'][0]['jobs'][0].update(EXTRA=1))
+    yield 'not an object', []
+    yield 'several errors', mutated(
+        lambda d: d.update(phone='1', email=None, EXTRA=True))
+
+
+@pytest.mark.parametrize('description,document', list(mutations()))
+def test_compiled_registration_schema_matches_jsonschema(description,
+                                                         document):
+    compiled = CompiledSchema(REGISTRATION_SCHEMA)
+    validator = Draft7Validator(REGISTRATION_SCHEMA)
+
+    assert compiled.is_valid(document) == validator.is_valid(document)
+    assert compiled.error_messages(document) == \
+        [e.message for e in validator.iter_errors(document)]
+
+
+def test_compiled_status_schema_matches_jsonschema():
+    compiled = CompiledSchema(REGISTRATION_STATUS_SCHEMA)
+    validator = Draft7Validator(REGISTRATION_STATUS_SCHEMA)
+    good = {"rules_service_approved": True, "user_approved": False}
+    for document in (good, {}, dict(good, user_approved=None),
+                     dict(good, extra=1)):
+        assert compiled.error_messages(document) == \
+            [e.message for e in validator.iter_errors(document)]
+
+
+def test_unsupported_keyword_falls_back_to_jsonschema():
+    schema = {"type": "string", "format": "email", "maxLength": 3}
+    compiled = CompiledSchema(schema)
+
+    assert compiled.is_valid("abc")
+    assert compiled.error_messages("abcd") == ["'abcd' is too long"]
+
+
+def test_large_household_is_valid():
+    document = load_example()
+    member = document['household'][0]
+    document['household'] = [copy.deepcopy(member) for _ in range(12)]
+
+    assert CompiledSchema(REGISTRATION_SCHEMA).error_messages(document) == []
+
+
+@pytest.mark.parametrize('document', (
+    {"registrations": [{"id": 1, "rules_service_approved": True,
+                        "user_approved": False}]},
+    {"registrations": [{"id": 1.0, "rules_service_approved": True,
+                        "user_approved": False}]},
+    {"registrations": [{"id": True, "rules_service_approved": True,
+                        "user_approved": False}]},
+    {"registrations": []},
+    {"filter": {"disaster_id": 3}, "rules_service_approved": True,
+     "user_approved": True},
+    {"filter": {}, "rules_service_approved": True, "user_approved": True},
+    {"filter": {"disaster_id": 3}, "registrations": []},
+))
+def test_compiled_bulk_status_schema_matches_jsonschema(document):
+    compiled = CompiledSchema(REGISTRATION_BULK_STATUS_SCHEMA)
+    validator = Draft7Validator(REGISTRATION_BULK_STATUS_SCHEMA)
+
+    assert compiled.error_messages(document) == \
+        [e.message for e in validator.iter_errors(document)]